@@ -0,0 +1,223 @@
+"""
+aiohttp version of the web front end (server.py).
+
+Each pending obfuscation is a coroutine waiting on the daemon's socket rather
+than a gunicorn thread, so one process holds hundreds of them; uploads,
+job files and results are read and written off the event loop. Serves the
+same page and API as server.py except /api/batch. Run with
+`python3 aioserver.py` (start.sh does when WEB_SERVER=aiohttp).
+"""
+import os
+import json
+import asyncio
+from aiohttp import web
+from config import Config
+from jobqueue import job_queue, QueueFull
+from costmodel import JobTooLarge
+from preflight import InvalidCode
+from jobs import JobStore, JobManager, FINISHED
+from workspace import start_janitor
+import delivery
+from uploads import read_submission_async, UploadError
+from views import HTML, api_result, refusal, publish, job_view, stats_args
+from stats import stats_store
+import selftest
+import ratelimit
+import client
+import metrics
+
+routes = web.RouteTableDef()
+
+
+async def run_job(code, preset, show_debug, on_queue, on_start):
+    return await client.obfuscate(code, preset, show_debug, 'web', on_queue, on_start)
+
+jobs = JobManager(JobStore(Config.JOBS_FOLDER), run_async=run_job, verify=client.verify_sync)
+
+
+def refused_response(refused):
+    status, body, headers = refused
+    return web.json_response(body, status=status, headers=headers)
+
+
+async def rate_limited(request, cost):
+    """A 429 response when this client is over its rate limit, else None"""
+    keys = ratelimit.web_keys(request.remote, request.headers.get('X-Forwarded-For'))
+    allowed, retry_after = await client.rate_limit(keys, cost)
+    return None if allowed else refused_response(refusal(ratelimit.refused(retry_after)))
+
+
+@routes.get('/')
+async def index(request):
+    return web.Response(text=HTML, content_type='text/html')
+
+
+@routes.get('/api/test')
+async def api_test(request):
+    ready, status = selftest.readiness()
+    return web.json_response({'result': selftest.report(), 'ready': ready, 'status': status})
+
+
+@routes.post('/api/obfuscate')
+async def api_obfuscate(request):
+    """Same request and response as server.api_obfuscate"""
+    try:
+        code, options = await read_submission_async(request)
+    except UploadError as e:
+        return web.json_response({'success': False, 'error': str(e)}, status=e.status)
+    preset = options['preset']
+    show_debug = options['debug']
+    limited = await rate_limited(request, ratelimit.cost(preset))
+    if limited:
+        return limited
+
+    try:
+        result = await client.obfuscate(code, preset, show_debug, 'web')
+    except Exception as e:
+        return web.json_response({'success': False, 'error': str(e)})
+    refused = refusal(result)
+    if refused:
+        return refused_response(refused)
+
+    response = api_result(result, show_debug)
+    response = await asyncio.to_thread(publish, jobs.store, response, preset, result.get('key'), options['inline'])
+    if options['verify'] and response['success']:
+        response['verification'] = await asyncio.to_thread(jobs.verify_later, response['job_id'], code, result['output'])
+        response['status_url'] = f"/api/jobs/{response['job_id']}"
+    return web.json_response(response)
+
+
+@routes.get('/api/queue')
+async def api_queue(request):
+    return web.json_response(await asyncio.to_thread(job_queue.summary))
+
+
+@routes.post('/api/jobs')
+async def api_submit_job(request):
+    try:
+        code, options = await read_submission_async(request)
+        limited = await rate_limited(request, ratelimit.cost(options['preset']))
+        if limited:
+            return limited
+        job = await jobs.submit_async(code, options['preset'], options['debug'], options['verify'])
+    except UploadError as e:
+        return web.json_response({'success': False, 'error': str(e)}, status=e.status)
+    except JobTooLarge as e:
+        return refused_response(refusal({'too_large': True, 'error': str(e), 'estimate': e.estimate['seconds']}))
+    except InvalidCode as e:
+        return refused_response(refusal({'invalid': True, 'error': str(e), 'line': e.line, 'column': e.column}))
+    except QueueFull as e:
+        return refused_response(refusal({'busy': True, 'error': str(e), 'retry_after': e.retry_after}))
+    except Exception as e:
+        return web.json_response({'success': False, 'error': str(e)}, status=500)
+
+    return web.json_response(job_view(job), status=202)
+
+
+@routes.get('/api/jobs/{job_id}')
+async def api_job_status(request):
+    job = await asyncio.to_thread(jobs.get, request.match_info['job_id'])
+    if not job:
+        return web.json_response({'error': 'Unknown job'}, status=404)
+    return web.json_response(job_view(job))
+
+
+@routes.get('/api/jobs/{job_id}/events')
+async def api_job_events(request):
+    job_id = request.match_info['job_id']
+    if not await asyncio.to_thread(jobs.get, job_id):
+        return web.json_response({'error': 'Unknown job'}, status=404)
+
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    await response.prepare(request)
+    async for job in jobs.events_async(job_id):
+        await response.write(f"event: {job['status']}\ndata: {json.dumps(job_view(job))}\n\n".encode())
+    await response.write_eof()
+    return response
+
+
+@routes.get('/api/jobs/{job_id}/result')
+async def api_job_result(request):
+    job_id = request.match_info['job_id']
+    job = await asyncio.to_thread(jobs.get, job_id)
+    if not job:
+        return web.json_response({'error': 'Unknown job'}, status=404)
+    if job['status'] not in FINISHED:
+        return web.json_response({'error': 'Job not finished', 'status': job['status']}, status=409)
+    if job['status'] == 'failed':
+        return web.json_response({'error': job.get('error', 'Obfuscation failed')}, status=422)
+    return await send_result(request, jobs.store.result_path(job_id), request.query.get('download') == '1')
+
+
+async def send_result(request, path, as_attachment, download_name='obfuscated.lua'):
+    """server.send_result: sendfile when uncompressed, otherwise compressed chunk by chunk in a thread"""
+    encoding = delivery.negotiate(request.headers.get('Accept-Encoding'))
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return web.json_response({'error': 'Result expired'}, status=410)
+    headers = {'Content-Type': 'text/plain', 'Vary': 'Accept-Encoding'}
+    if as_attachment:
+        headers['Content-Disposition'] = f'attachment; filename={download_name}'
+    if encoding is None or size < Config.MIN_COMPRESS_BYTES:
+        return web.FileResponse(path, headers=headers)
+
+    headers['Content-Encoding'] = encoding
+    headers['X-Uncompressed-Length'] = str(size)
+    response = web.StreamResponse(headers=headers)
+    await response.prepare(request)
+    chunks = delivery.compress_file(path, encoding)
+    while True:
+        chunk = await asyncio.to_thread(next, chunks, None)
+        if chunk is None:
+            break
+        await response.write(chunk)
+    await response.write_eof()
+    return response
+
+
+@routes.get('/api/stats')
+async def api_stats(request):
+    return web.json_response(await asyncio.to_thread(stats_store.query, *stats_args(request.query)))
+
+
+@routes.get('/metrics')
+async def metrics_endpoint(request):
+    def render():
+        return metrics.render({
+            'hercules_queue_depth': ('Jobs waiting for a slot (node-wide)', job_queue.depth()),
+            'hercules_active_jobs': ('Jobs holding a slot (node-wide)', job_queue.running()),
+            'hercules_queue_concurrency': ('Configured concurrency slots', job_queue.concurrency),
+        })
+    body = await asyncio.to_thread(render)
+    return web.Response(body=body.encode(), headers={'Content-Type': 'text/plain; version=0.0.4'})
+
+
+@routes.get('/health')
+async def health(request):
+    """Always 200 while the process answers; see server.health"""
+    ready, status = selftest.readiness()
+    return web.json_response(dict(await client.summary(), status='healthy', ready=ready, self_test=status))
+
+
+def create_app():
+    os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(Config.OUTPUT_FOLDER, exist_ok=True)
+    # Jobs run in the obfuscation daemon (daemon.py); these only matter when it is down and client.py runs them here
+    metrics.registry.start_flusher()
+    start_janitor()
+    selftest.start_prober(fallback=True)
+
+    app = web.Application(client_max_size=Config.MAX_BATCH_BYTES)
+    app.add_routes(routes)
+    return app
+
+
+if __name__ == '__main__':
+    print(f"Hercules Path: {Config.HERCULES_PATH}")
+    # A deep accept backlog: bursts of hundreds of clients connect at once
+    web.run_app(create_app(), host='0.0.0.0', port=Config.WEB_PORT, backlog=1024)
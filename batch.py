@@ -0,0 +1,162 @@
+import io
+import os
+import json
+import time
+import zipfile
+import tempfile
+from config import Config
+
+PRESET_NAMES = ('min', 'mid', 'max')
+
+
+class BatchError(Exception):
+    """The batch itself is unusable (bad archive, too many files, too large)"""
+
+
+def _accept(name):
+    return name.endswith(('.lua', '.txt')) and not name.startswith('__MACOSX/') and '/.' not in f'/{name}'
+
+
+def _safe_name(name):
+    # Keep the module layout of the project but never allow escaping the archive root
+    parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.', '..')]
+    return '/'.join(parts)
+
+
+def read_zip(data):
+    """Extract Lua sources from a zip, checking declared sizes before inflating anything"""
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise BatchError('Not a valid zip archive')
+
+    infos = [i for i in archive.infolist() if not i.is_dir() and _accept(i.filename)]
+    if len(infos) > Config.MAX_BATCH_FILES:
+        raise BatchError(f'Too many files (max {Config.MAX_BATCH_FILES})')
+    if sum(i.file_size for i in infos) > Config.MAX_BATCH_BYTES:
+        raise BatchError(f'Archive too large (max {Config.MAX_BATCH_BYTES // 1024 // 1024}MB uncompressed)')
+
+    files = []
+    for info in infos:
+        if info.file_size > Config.MAX_CODE_LENGTH:
+            raise BatchError(f'{info.filename} is too large (max {Config.MAX_CODE_LENGTH} bytes)')
+        try:
+            code = archive.read(info).decode('utf-8')
+        except UnicodeDecodeError:
+            raise BatchError(f'{info.filename} is not UTF-8 text')
+        files.append((_safe_name(info.filename), code))
+    return files
+
+
+def collect(uploads):
+    """
+    Turn (filename, bytes) uploads into a list of (name, code).
+    Zips are expanded, plain .lua/.txt files are taken as-is.
+    """
+    files = []
+    for filename, data in uploads:
+        if filename.endswith('.zip'):
+            files.extend(read_zip(data))
+        elif _accept(filename):
+            if len(data) > Config.MAX_CODE_LENGTH:
+                raise BatchError(f'{filename} is too large (max {Config.MAX_CODE_LENGTH} bytes)')
+            try:
+                files.append((_safe_name(filename), data.decode('utf-8')))
+            except UnicodeDecodeError:
+                raise BatchError(f'{filename} is not UTF-8 text')
+        else:
+            raise BatchError(f'{filename}: use .lua, .txt or .zip')
+
+    if not files:
+        raise BatchError('No .lua files found')
+    if len(files) > Config.MAX_BATCH_FILES:
+        raise BatchError(f'Too many files (max {Config.MAX_BATCH_FILES})')
+    if sum(len(code) for _, code in files) > Config.MAX_BATCH_BYTES:
+        raise BatchError(f'Batch too large (max {Config.MAX_BATCH_BYTES // 1024 // 1024}MB)')
+
+    # Same name twice (e.g. two attachments called init.lua): keep both
+    seen = {}
+    unique = []
+    for name, code in files:
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        if count:
+            base, ext = os.path.splitext(name)
+            name = f'{base}_{count}{ext}'
+        unique.append((name, code))
+    return unique
+
+
+def parse_presets(value):
+    """Per-file presets, as a JSON object or 'a.lua=max,b.lua=min'"""
+    if not value:
+        return {}
+    if isinstance(value, dict):
+        mapping = value
+    else:
+        try:
+            mapping = json.loads(value)
+        except ValueError:
+            mapping = dict(pair.split('=', 1) for pair in value.split(',') if '=' in pair)
+    if not isinstance(mapping, dict):
+        raise BatchError('presets must map file names to min/mid/max')
+    presets = {}
+    for name, preset in mapping.items():
+        preset = str(preset).strip()
+        if preset not in PRESET_NAMES:
+            raise BatchError(f'Unknown preset {preset!r} for {name}')
+        presets[str(name).strip()] = preset
+    return presets
+
+
+def preset_for(name, default, presets):
+    return presets.get(name) or presets.get(os.path.basename(name)) or default
+
+
+def entry(name, preset, code, result, started):
+    """Per-file report line; result is a success/output/error dict"""
+    item = {
+        'file': name,
+        'preset': preset,
+        'success': bool(result.get('success')),
+        'seconds': round(time.time() - started, 3),
+        'original_size': len(code),
+        'cached': bool(result.get('cached')),
+    }
+    if item['success']:
+        item['obfuscated_size'] = len(result['output'])
+        item['output'] = result['output']
+    else:
+        item['error'] = (result.get('error') or 'Obfuscation failed')[:500]
+    return item
+
+
+def summarize(entries, started):
+    ok = [e for e in entries if e['success']]
+    return {
+        'files': len(entries),
+        'succeeded': len(ok),
+        'failed': len(entries) - len(ok),
+        'seconds': round(time.time() - started, 3),
+        'original_size': sum(e['original_size'] for e in entries),
+        'obfuscated_size': sum(e['obfuscated_size'] for e in ok),
+    }
+
+
+def build_zip(entries, summary):
+    """
+    Write outputs plus batch_report.json to a temporary file and return it.
+    The file is spooled to disk so large batches don't sit in memory.
+    """
+    out = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    report = {'summary': summary, 'files': []}
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for e in entries:
+            e = dict(e)
+            output = e.pop('output', None)
+            if output is not None:
+                archive.writestr(e['file'], output)
+            report['files'].append(e)
+        archive.writestr('batch_report.json', json.dumps(report, indent=2))
+    out.seek(0)
+    return out
@@ -0,0 +1,53 @@
+"""Deterministic Lua inputs for the benchmarks, from 100 B up to MAX_CODE_LENGTH"""
+import random
+
+SIZES = [100, 1000, 10000, 100000, 500000]
+# Lua allows 200 locals per function; later functions become module-table members
+LOCAL_FUNCTIONS = 150
+
+
+def _function(rng, n):
+    name = f'fn_{n}'
+    args = ', '.join(f'a{i}' for i in range(rng.randint(0, 3)))
+    body = [
+        f'local function {name}({args})' if n < LOCAL_FUNCTIONS else f'function lib.{name}({args})',
+        f'    local total = {rng.randint(0, 100)}',
+        f'    for i = 1, {rng.randint(2, 50)} do',
+        f'        total = total + i * {rng.randint(1, 9)}',
+        '    end',
+        f'    local msg = "value of {name}: " .. tostring(total)',
+        f'    if total > {rng.randint(10, 500)} then',
+        '        msg = msg .. " (large)"',
+        '    end',
+        f'    state["{name}"] = total',
+        '    return msg',
+        'end',
+        '',
+    ]
+    return '\n'.join(body) + '\n'
+
+
+def generate(size, seed=0):
+    """Lua source of exactly `size` bytes made of small independent functions"""
+    rng = random.Random(seed * 1000003 + size)
+    head = 'local state = {}\nlocal lib = {}\n'
+    tail = 'print(#state)\n'
+    parts = [head]
+    length = len(head) + len(tail)
+    n = 0
+    while True:
+        chunk = _function(rng, n)
+        if length + len(chunk) > size:
+            break
+        parts.append(chunk)
+        length += len(chunk)
+        n += 1
+    parts.append(tail)
+    code = ''.join(parts)
+    if len(code) + 3 <= size:
+        code += '--' + 'x' * (size - len(code) - 3) + '\n'
+    return code
+
+
+def corpus(sizes=None, seed=0):
+    return {size: generate(size, seed) for size in (sizes or SIZES)}
@@ -0,0 +1,238 @@
+"""
+Benchmark the obfuscation service.
+
+Measures throughput and p50/p95/p99 latency per preset, input size and
+concurrency level for bot.run_obfuscator and POST /api/obfuscate, and writes
+a JSON baseline that later runs can be compared against.
+
+By default Hercules is replaced by the stub in bench/stub, so the numbers are
+the wrapper's own overhead (queueing, file I/O, JSON, ANSI stripping, ...)
+plus a controllable fake obfuscation cost:
+
+    python bench/run.py --out bench/baseline.json
+    python bench/run.py --compare bench/baseline.json
+    python bench/run.py --hercules /app/hercules/src --presets min --sizes 1000
+
+The stub is tuned with HERCULES_STUB_DELAY_MS, HERCULES_STUB_MS_PER_KB and
+HERCULES_STUB_EXPANSION (see bench/stub/pipeline.lua).
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import corpus, SIZES
+
+
+def prepare_environment(args):
+    """
+    Point every path in Config at a scratch directory before any service
+    module is imported, and install the stub Hercules unless --hercules is given.
+    """
+    scratch = tempfile.mkdtemp(prefix='hercules-bench-')
+    if args.hercules:
+        hercules = args.hercules
+    else:
+        hercules = os.path.join(scratch, 'hercules')
+        shutil.copytree(os.path.join(BENCH_DIR, 'stub'), hercules)
+        for name in os.listdir(os.path.join(ROOT, 'lua')):
+            shutil.copy(os.path.join(ROOT, 'lua', name), hercules)
+
+    os.environ.update({
+        'HERCULES_PATH': hercules,
+        'UPLOAD_FOLDER': os.path.join(scratch, 'uploads'),
+        'OUTPUT_FOLDER': os.path.join(scratch, 'outputs'),
+        'RUN_FOLDER': os.path.join(scratch, 'run'),
+        'TMPFS_WORK_FOLDER': os.path.join('/dev/shm', os.path.basename(scratch)),
+    })
+    if args.concurrency_limit:
+        os.environ['MAX_CONCURRENT_JOBS'] = str(args.concurrency_limit)
+    os.environ.setdefault('MAX_QUEUE_DEPTH', '1000')
+    return scratch
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def summarize(target, preset, size, concurrency, latencies, errors, wall):
+    ms = [x * 1000 for x in latencies]
+    return {
+        'target': target,
+        'preset': preset,
+        'size': size,
+        'concurrency': concurrency,
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / wall, 2) if wall > 0 else None,
+        'mean_ms': round(sum(ms) / len(ms), 2) if ms else None,
+        'p50_ms': round(percentile(ms, 50), 2) if ms else None,
+        'p95_ms': round(percentile(ms, 95), 2) if ms else None,
+        'p99_ms': round(percentile(ms, 99), 2) if ms else None,
+    }
+
+
+def unique(code, n, use_cache):
+    # Every request misses the result cache unless --cache is given
+    return code if use_cache else f'{code}\n-- bench {n} {time.time_ns()}\n'
+
+
+def bench_bot(preset, code, concurrency, requests, use_cache):
+    import bot
+
+    async def run():
+        limit = asyncio.Semaphore(concurrency)
+        latencies = []
+        errors = 0
+
+        async def one(n):
+            nonlocal errors
+            async with limit:
+                start = time.perf_counter()
+                result = await bot.run_obfuscator(unique(code, n, use_cache), preset)
+                if result['success']:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(n) for n in range(requests)))
+        return latencies, errors, time.perf_counter() - start
+
+    return asyncio.run(run())
+
+
+def bench_api(preset, code, concurrency, requests, use_cache):
+    import server
+
+    def one(n):
+        client = server.app.test_client()
+        start = time.perf_counter()
+        response = client.post('/api/obfuscate', json={'code': unique(code, n, use_cache), 'preset': preset})
+        ok = response.status_code == 200 and response.get_json().get('success')
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, range(requests)))
+    wall = time.perf_counter() - start
+    latencies = [t for t, ok in results if ok]
+    return latencies, len(results) - len(latencies), wall
+
+
+TARGETS = {'run_obfuscator': bench_bot, 'api': bench_api}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, timeout=5).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(old, new):
+    """Print p50/p95/throughput changes for every matching row"""
+    def key(row):
+        return (row['target'], row['preset'], row['size'], row['concurrency'])
+
+    baseline = {key(r): r for r in old['results']}
+    print(f"\n{'target':<15}{'preset':<7}{'size':>8}{'conc':>6}{'p50 ms':>18}{'p95 ms':>18}{'rps':>16}")
+    for row in new['results']:
+        before = baseline.get(key(row))
+        if not before:
+            continue
+
+        def change(field):
+            a, b = before.get(field), row.get(field)
+            if not a or b is None:
+                return f'{b}'
+            return f'{b} ({(b - a) / a * 100:+.0f}%)'
+
+        print(f"{row['target']:<15}{row['preset']:<7}{row['size']:>8}{row['concurrency']:>6}"
+              f"{change('p50_ms'):>18}{change('p95_ms'):>18}{change('throughput_rps'):>16}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Hercules obfuscation service')
+    parser.add_argument('--targets', default='run_obfuscator,api', help='run_obfuscator and/or api')
+    parser.add_argument('--presets', default='min,mid,max')
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)), help='input sizes in bytes')
+    parser.add_argument('--concurrency', default='1,4,16', help='concurrency levels')
+    parser.add_argument('--requests', type=int, default=20, help='requests per combination')
+    parser.add_argument('--concurrency-limit', type=int, default=0, help='MAX_CONCURRENT_JOBS for the run')
+    parser.add_argument('--hercules', help='benchmark a real Hercules checkout instead of the stub')
+    parser.add_argument('--cache', action='store_true', help='let repeated inputs hit the result cache')
+    parser.add_argument('--out', help='write results as JSON (a baseline)')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    args = parser.parse_args()
+
+    scratch = prepare_environment(args)
+    from config import Config
+    from jobqueue import job_queue
+
+    inputs = corpus([int(s) for s in args.sizes.split(',')])
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'queue_concurrency': job_queue.concurrency,
+            'worker_pool_size': Config.WORKER_POOL_SIZE,
+            'stub': not args.hercules,
+            'stub_env': {k: v for k, v in os.environ.items() if k.startswith('HERCULES_STUB_')},
+            'requests': args.requests,
+        },
+        'results': [],
+    }
+
+    try:
+        for target in args.targets.split(','):
+            run = TARGETS[target]
+            for preset in args.presets.split(','):
+                for size, code in inputs.items():
+                    for concurrency in [int(c) for c in args.concurrency.split(',')]:
+                        latencies, errors, wall = run(preset, code, concurrency, args.requests, args.cache)
+                        row = summarize(target, preset, size, concurrency, latencies, errors, wall)
+                        report['results'].append(row)
+                        print(f"{target:<15}{preset:<5}{size:>8}B  c={concurrency:<3} "
+                              f"p50={row['p50_ms']}ms p95={row['p95_ms']}ms p99={row['p99_ms']}ms "
+                              f"rps={row['throughput_rps']} errors={errors}", flush=True)
+    finally:
+        from workers import pool
+        pool.shutdown()
+        shutil.rmtree(scratch, ignore_errors=True)
+        shutil.rmtree(os.environ['TMPFS_WORK_FOLDER'], ignore_errors=True)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+-- Stub Hercules settings: same step names as Config.PRESETS
+local config = {}
+
+config.settings = {
+    watermark_enabled = true,
+    watermark = {enabled = true},
+    string_encoding = {enabled = false},
+    string_to_expressions = {enabled = false},
+    variable_renaming = {enabled = true},
+    control_flow = {enabled = false},
+    garbage_code = {enabled = true},
+    opaque_predicates = {enabled = false},
+    function_inlining = {enabled = false},
+    compressor = {enabled = false},
+    wrap_in_function = {enabled = false},
+    virtual_machine = {enabled = false},
+    antitamper = {enabled = false},
+}
+
+return config
@@ -0,0 +1,58 @@
+--[[
+    Stub hercules.lua with the same command line as the real one:
+        lua hercules.lua <file> [--min|--mid|--max]
+    Writes <file>_obfuscated.lua next to the input. See pipeline.lua for tuning.
+]]
+
+local config = require("config")
+local Pipeline = require("pipeline")
+
+local PRESETS = {
+    min = {"watermark", "variable_renaming", "garbage_code"},
+    mid = {"watermark", "string_encoding", "variable_renaming", "control_flow",
+           "garbage_code", "opaque_predicates", "compressor"},
+    max = {"watermark", "string_to_expressions", "control_flow", "variable_renaming",
+           "garbage_code", "opaque_predicates", "function_inlining", "compressor",
+           "wrap_in_function", "virtual_machine", "antitamper"},
+}
+
+local file
+for _, a in ipairs(arg) do
+    if a == "--help" then
+        print("Usage: lua hercules.lua <file> [--min|--mid|--max]  (benchmark stub)")
+        os.exit(0)
+    end
+    local preset = a:match("^%-%-(%a+)$")
+    if preset and PRESETS[preset] then
+        for _, value in pairs(config.settings) do
+            if type(value) == "table" then
+                value.enabled = false
+            end
+        end
+        for _, name in ipairs(PRESETS[preset]) do
+            config.settings[name].enabled = true
+        end
+    elseif not file then
+        file = a
+    end
+end
+
+if not file then
+    io.stderr:write("no input file\n")
+    os.exit(1)
+end
+
+local f = assert(io.open(file, "r"))
+local code = f:read("a")
+f:close()
+
+local ok, result = pcall(Pipeline.process, code)
+if not ok then
+    io.stderr:write(tostring(result), "\n")
+    os.exit(1)
+end
+
+local out = assert(io.open((file:gsub("%.lua$", "")) .. "_obfuscated.lua", "w"))
+out:write(result)
+out:close()
+print("Obfuscation complete")
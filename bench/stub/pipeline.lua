@@ -0,0 +1,57 @@
+--[[
+    Stub Hercules pipeline for benchmarks.
+
+    Burns CPU instead of obfuscating, so the wrapper's own overhead can be
+    measured without the real obfuscator. Tuned through environment variables:
+        HERCULES_STUB_DELAY_MS    fixed cost per job (default 20)
+        HERCULES_STUB_MS_PER_KB   extra cost per KB of input (default 1)
+        HERCULES_STUB_EXPANSION   output size / input size (default 3)
+        HERCULES_STUB_FAIL        fail every job whose source contains this text
+]]
+
+local config = require("config")
+
+local Pipeline = {}
+
+local function env_number(name, default)
+    return tonumber(os.getenv(name) or "") or default
+end
+
+local function burn(ms)
+    local deadline = os.clock() + ms / 1000
+    local x = 0
+    while os.clock() < deadline do
+        x = x + 1
+    end
+    return x
+end
+
+function Pipeline.process(code)
+    local fail = os.getenv("HERCULES_STUB_FAIL")
+    if fail and fail ~= "" and code:find(fail, 1, true) then
+        error("stub failure requested")
+    end
+
+    -- More enabled steps cost more, like the real presets
+    local steps = 0
+    for _, value in pairs(config.settings) do
+        if type(value) == "table" and value.enabled then
+            steps = steps + 1
+        end
+    end
+    local scale = math.max(1, steps) / 3
+
+    burn((env_number("HERCULES_STUB_DELAY_MS", 20) + env_number("HERCULES_STUB_MS_PER_KB", 1) * #code / 1024) * scale)
+
+    local target = math.floor(#code * env_number("HERCULES_STUB_EXPANSION", 3))
+    local parts = {"-- stub obfuscated\n", code}
+    local size = #parts[1] + #code
+    while size < target do
+        local chunk = "\n--" .. string.rep("x", math.min(1024, target - size))
+        parts[#parts + 1] = chunk
+        size = size + #chunk
+    end
+    return table.concat(parts)
+end
+
+return Pipeline
@@ -0,0 +1,206 @@
+"""
+Benchmark the two web front ends against each other.
+
+Starts one obfuscation daemon (with the stub Hercules from bench/stub unless
+--hercules is given) and, in turn, gunicorn serving server.py exactly as
+start.sh runs it and aioserver.py, then sends POST /api/obfuscate at each
+concurrency level. Both talk to the same daemon, so the difference is the
+front end: how many requests it holds at once, their latency, and what that
+costs in threads and memory.
+
+    python bench/web.py
+    python bench/web.py --concurrency 32,128,512 --requests 1024 --out bench/web.json
+
+The stub's fixed cost per job (HERCULES_STUB_DELAY_MS, 200 ms here unless
+set) keeps requests pending long enough for the front ends to pile them up;
+MAX_CONCURRENT_JOBS is left to the daemon's usual cgroup sizing.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import asyncio
+import argparse
+import subprocess
+
+import aiohttp
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import generate
+from run import prepare_environment, summarize, git_revision
+
+SERVERS = {
+    'gunicorn': lambda port: [
+        sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', '2',
+        '--worker-class', 'gthread', '--threads', '16', '--timeout', '300', 'server:app'
+    ],
+    'aiohttp': lambda port: [sys.executable, 'aioserver.py'],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(check, timeout=30, what='process'):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if check():
+            return
+        time.sleep(0.1)
+    raise RuntimeError(f'{what} did not come up in {timeout}s')
+
+
+def responds(url):
+    try:
+        with socket.create_connection(('127.0.0.1', int(url.rsplit(':', 1)[1])), timeout=1):
+            return True
+    except OSError:
+        return False
+
+
+def tree_usage(pid):
+    """RSS (bytes) and thread count of a process and its children, from /proc"""
+    rss = threads = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss += int(line.split()[1]) * 1024
+                    elif line.startswith('Threads:'):
+                        threads += int(line.split()[1])
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pids.extend(int(p) for p in f.read().split())
+        except OSError:
+            continue
+    return rss, threads
+
+
+async def load(url, code, concurrency, requests, pid):
+    """Send `requests` unique jobs, at most `concurrency` in flight; sample the server meanwhile"""
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = {}
+    peak = {'rss': 0, 'threads': 0}
+
+    async def one(session, n):
+        async with limit:
+            start = time.perf_counter()
+            try:
+                async with session.post(url, json={'code': f'{code}\n-- web bench {n} {time.time_ns()}\n'}) as r:
+                    body = await r.json()
+                    status = r.status if body.get('success') else f'{r.status}:failed'
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = type(e).__name__
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+
+    async def sample():
+        while True:
+            rss, threads = tree_usage(pid)
+            peak['rss'] = max(peak['rss'], rss)
+            peak['threads'] = max(peak['threads'], threads)
+            await asyncio.sleep(0.2)
+
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=600)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        sampler = asyncio.create_task(sample())
+        start = time.perf_counter()
+        await asyncio.gather(*(one(session, n) for n in range(requests)))
+        wall = time.perf_counter() - start
+        sampler.cancel()
+    return latencies, statuses, wall, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the gunicorn and aiohttp web front ends')
+    parser.add_argument('--servers', default='gunicorn,aiohttp')
+    parser.add_argument('--concurrency', default='16,64,256', help='requests in flight')
+    parser.add_argument('--requests', type=int, default=512, help='requests per concurrency level')
+    parser.add_argument('--size', type=int, default=1000, help='input size in bytes')
+    parser.add_argument('--concurrency-limit', type=int, default=0, help='MAX_CONCURRENT_JOBS for the daemon')
+    parser.add_argument('--hercules', help='benchmark a real Hercules checkout instead of the stub')
+    parser.add_argument('--out', help='write results as JSON')
+    args = parser.parse_args()
+
+    scratch = prepare_environment(args)
+    os.environ.setdefault('HERCULES_STUB_DELAY_MS', '200')
+    # Every request is let into the queue: we measure waiting, not 429s
+    os.environ['MAX_QUEUE_DEPTH'] = str(max(int(c) for c in args.concurrency.split(',')) + 100)
+    os.environ['PYTHONUNBUFFERED'] = '1'
+    # All the load comes from one address
+    os.environ['RATE_LIMIT'] = '0'
+
+    from config import Config
+    log = open(os.path.join(scratch, 'servers.log'), 'w')
+    processes = []
+    code = generate(args.size)
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': git_revision(),
+            'cpus': os.cpu_count(),
+            'stub': not args.hercules,
+            'stub_env': {k: v for k, v in os.environ.items() if k.startswith('HERCULES_STUB_')},
+            'requests': args.requests,
+            'size': args.size,
+        },
+        'results': [],
+    }
+
+    try:
+        daemon = subprocess.Popen([sys.executable, 'daemon.py'], cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+        processes.append(daemon)
+        wait_for(lambda: os.path.exists(Config.DAEMON_SOCKET), what='daemon')
+
+        for name in args.servers.split(','):
+            port = free_port()
+            env = dict(os.environ, PORT=str(port))
+            server = subprocess.Popen(SERVERS[name](port), cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+            processes.append(server)
+            url = f'http://127.0.0.1:{port}'
+            wait_for(lambda: responds(url), what=name)
+
+            for concurrency in [int(c) for c in args.concurrency.split(',')]:
+                latencies, statuses, wall, peak = asyncio.run(
+                    load(f'{url}/api/obfuscate', code, concurrency, args.requests, server.pid)
+                )
+                errors = args.requests - len(latencies)
+                row = summarize(name, 'min', args.size, concurrency, latencies, errors, wall)
+                row.update(statuses=statuses, peak_rss_mb=round(peak['rss'] / 1024 / 1024, 1), peak_threads=peak['threads'])
+                report['results'].append(row)
+                print(f"{name:<9} c={concurrency:<4} p50={row['p50_ms']}ms p95={row['p95_ms']}ms p99={row['p99_ms']}ms "
+                      f"rps={row['throughput_rps']} errors={errors} rss={row['peak_rss_mb']}MB "
+                      f"threads={row['peak_threads']}", flush=True)
+
+            server.terminate()
+            server.wait(timeout=30)
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+                process.wait(timeout=30)
+        log.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+        shutil.rmtree(os.environ['TMPFS_WORK_FOLDER'], ignore_errors=True)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,27 @@
+import time
+STARTED = time.monotonic()  # before the heavy imports, for time-to-ready
 import discord
 from discord.ext import commands
 from discord import app_commands
 import asyncio
 import os
-import uuid
 import io
-import time
-import re
+import json
+import hashlib
 from datetime import datetime
 from config import Config
+from workspace import start_janitor
+from jobqueue import job_queue
+import client
+import metrics
+import batch
+import pipelines
+import ratelimit
+from batch import BatchError
+import delivery
+from jobs import JobStore
+from stats import stats_store
+import selftest
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -17,13 +30,22 @@ class Bot(commands.Bot):
     def __init__(self):
         super().__init__(command_prefix=Config.BOT_PREFIX, intents=intents, help_command=None)
         self.start_time = datetime.utcnow()
-        self.stats = {'total': 0, 'success': 0, 'failed': 0}
-        self.cooldowns = {}
         self.debug_mode = True  # Enable debug by default
     
     async def setup_hook(self):
-        await self.tree.sync()
-        print("Slash commands synced!")
+        # The gateway connection waits for setup_hook: everything slow happens once we're ready
+        self.ready_task = asyncio.create_task(self.after_ready())
+    
+    async def after_ready(self):
+        await self.wait_until_ready()
+        ready = time.monotonic() - STARTED
+        metrics.bot_ready_seconds.set(round(ready, 3))
+        print(f"Ready {ready:.2f}s after start")
+        # Workers, cache and queue live in the obfuscation daemon; these cover the in-process fallback
+        start_janitor()
+        metrics.registry.start_flusher()
+        selftest.start_prober(fallback=True)
+        await sync_commands(self.tree)
     
     async def on_ready(self):
         print(f'Bot ready: {self.user} | Servers: {len(self.guilds)}')
@@ -36,16 +58,123 @@ def create_embed(title, desc, color=0xff6b6b):
     embed.set_footer(text="Hercules Obfuscator")
     return embed
 
-def check_cooldown(user_id):
+def run_note(result):
+    """What to put after the time of a result that didn't run a job of its own"""
+    if result.get('cached'):
+        return ' (cached)'
+    if result.get('coalesced'):
+        return ' (shared with an identical request)'
+    return ''
+
+def busy_embed(result):
+    return create_embed(
+        "🚦 Server Busy",
+        f"{result['error']}. Try again in ~{result['retry_after']}s.",
+        0xffc800
+    )
+
+def command_tree_hash(tree, guild=None):
+    """Hash of every command definition that would be synced"""
+    definitions = []
+    for command in tree.get_commands(guild=guild):
+        try:
+            definitions.append(command.to_dict())
+        except TypeError:
+            # discord.py >= 2.4 wants the tree
+            definitions.append(command.to_dict(tree))
+    definitions.sort(key=lambda d: (d.get('type', 1), d['name']))
+    return hashlib.sha256(json.dumps(definitions, sort_keys=True).encode()).hexdigest()
+
+async def sync_commands(tree):
+    """
+    Sync the slash commands, but only when their definitions changed since the
+    last sync from this node (SYNC_COMMANDS=1 forces one). Global syncs are
+    slow and rate limited; with DEV_GUILD_ID set the commands go to that
+    server only, where they show up at once.
+    """
+    guild = discord.Object(id=int(Config.DEV_GUILD_ID)) if Config.DEV_GUILD_ID else None
+    if guild:
+        tree.copy_global_to(guild=guild)
+    target = f'guild {guild.id}' if guild else 'global'
+    digest = command_tree_hash(tree, guild)
+    path = os.path.join(Config.RUN_FOLDER, f"commands-{bot.application_id}-{target.replace(' ', '-')}.sha256")
+    try:
+        with open(path) as f:
+            synced = f.read().strip()
+    except OSError:
+        synced = None
+    if synced == digest and not Config.FORCE_COMMAND_SYNC:
+        metrics.command_syncs.inc(result='skipped')
+        print(f"Slash commands unchanged ({target}), sync skipped")
+        return
+    
+    start = time.monotonic()
+    try:
+        commands_synced = await tree.sync(guild=guild)
+    except discord.HTTPException as e:
+        metrics.command_syncs.inc(result='failed')
+        print(f"Slash command sync failed ({target}): {e}")
+        return
+    metrics.command_syncs.inc(result='synced')
+    print(f"Slash commands synced ({target}, {len(commands_synced)} commands) in {time.monotonic() - start:.2f}s")
+    try:
+        os.makedirs(Config.RUN_FOLDER, exist_ok=True)
+        with open(f'{path}.tmp', 'w') as f:
+            f.write(digest)
+        os.replace(f'{path}.tmp', path)
+    except OSError:
+        pass
+
+async def check_cooldown(user_id, guild, cost=1):
+    """Rate limit a command by user and server, shared with every process through the daemon (ratelimit.py)"""
     if str(user_id) in Config.ADMIN_IDS:
         return False, 0
-    now = datetime.utcnow()
-    if user_id in bot.cooldowns:
-        diff = (now - bot.cooldowns[user_id]).total_seconds()
-        if diff < Config.COOLDOWN_SECONDS:
-            return True, int(Config.COOLDOWN_SECONDS - diff)
-    bot.cooldowns[user_id] = now
-    return False, 0
+    keys = [f'user:{user_id}'] + ([f'guild:{guild.id}'] if guild else [])
+    allowed, retry_after = await client.rate_limit(keys, cost)
+    return not allowed, retry_after
+
+result_store = JobStore(Config.JOBS_FOLDER)
+
+def upload_limit(guild):
+    return guild.filesize_limit if guild else Config.DISCORD_UPLOAD_LIMIT
+
+async def send_output(send, output, guild, preset, original_size):
+    """
+    Deliver a result with send(**kwargs): as obfuscated.lua when it fits the
+    upload limit, else zipped, else as a link to the web server's download.
+    """
+    data = output.encode()
+    limit = upload_limit(guild)
+    if len(data) <= limit:
+        await send(file=discord.File(io.BytesIO(data), filename="obfuscated.lua"))
+        return
+    
+    size = f"{len(data) / 1024 / 1024:.1f}MB"
+    archive = await asyncio.to_thread(delivery.zip_output, data)
+    if archive.getbuffer().nbytes <= limit:
+        await send(content=f"📦 Output is {size}, sent as a zip", file=discord.File(archive, filename="obfuscated.zip"))
+        return
+    
+    if not Config.PUBLIC_URL:
+        await send(embed=create_embed("❌ Too Large", f"Output is {size}, over Discord's upload limit. Use the web version.", 0xff6464))
+        return
+    job = await asyncio.to_thread(
+        result_store.add, preset, original_size, output=output, obfuscated_size=len(data)
+    )
+    await send(content=f"🔗 Output is {size}, too large for Discord. Download (expires in {Config.JOB_TTL // 60} min): "
+                       f"{Config.PUBLIC_URL}/api/jobs/{job['id']}/result?download=1")
+
+async def send_archive(send, archive, guild):
+    size = archive.seek(0, io.SEEK_END)
+    archive.seek(0)
+    if size <= upload_limit(guild):
+        await send(file=discord.File(archive, filename="obfuscated.zip"))
+    else:
+        await send(embed=create_embed(
+            "❌ Too Large",
+            f"The archive is {size / 1024 / 1024:.1f}MB, over Discord's upload limit. Use `POST /api/batch` on the web version.",
+            0xff6464
+        ))
 
 async def download_attachment(att):
     if att.size > Config.MAX_FILE_SIZE:
@@ -57,213 +186,102 @@ async def download_attachment(att):
     except:
         return None, "Failed to read"
 
-def clean_ansi(text):
-    """Remove ANSI color codes from text"""
-    return re.sub(r'\x1b\[[0-9;]*m', '', text)
-
-async def run_obfuscator(code, preset='min', skip_verify=False, debug=False):
+async def run_obfuscator(code, preset='min', skip_verify=False, debug=False, on_queue=None, on_start=None):
     """
-    Run Hercules obfuscator with multiple fallback options
+    Obfuscate through the node's obfuscation daemon (see client.py).
+    on_queue(position, eta) is awaited while the job waits for a free slot,
+    on_start(estimate) once it has one and is about to run.
+    Unless skip_verify, a successful result has a 'verification' task that
+    checks the output (verify.py) while the caller delivers it; pass it to
+    show_verdict() afterwards.
     """
-    req_id = str(uuid.uuid4())[:8]
-    input_file = os.path.join(Config.UPLOAD_FOLDER, f'{req_id}.lua')
-    debug_info = []
-    
-    try:
-        os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
-        
-        # Write input file
-        with open(input_file, 'w') as f:
-            f.write(code)
-        
-        debug_info.append(f"📁 Input file: {input_file}")
-        debug_info.append(f"📏 Code size: {len(code)} bytes")
-        
-        # Try different command variations
-        commands_to_try = [
-            ['lua', 'hercules.lua', input_file, f'--{preset}'],
-            ['lua', 'hercules.lua', input_file],  # No preset
-            ['lua5.4', 'hercules.lua', input_file, f'--{preset}'],
-        ]
-        
-        result_data = None
-        last_error = None
-        
-        for cmd in commands_to_try:
-            debug_info.append(f"\n🔧 Trying: {' '.join(cmd)}")
-            
-            try:
-                start = time.time()
-                proc = await asyncio.create_subprocess_exec(
-                    *cmd, 
-                    cwd=Config.HERCULES_PATH,
-                    stdout=asyncio.subprocess.PIPE, 
-                    stderr=asyncio.subprocess.PIPE
-                )
-                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=60)
-                elapsed = time.time() - start
-                
-                stdout_text = clean_ansi(stdout.decode() if stdout else '')
-                stderr_text = clean_ansi(stderr.decode() if stderr else '')
-                
-                debug_info.append(f"⏱️ Time: {elapsed:.2f}s")
-                debug_info.append(f"📤 Exit code: {proc.returncode}")
-                
-                if stdout_text:
-                    debug_info.append(f"📝 STDOUT:\n{stdout_text[:300]}")
-                if stderr_text:
-                    debug_info.append(f"⚠️ STDERR:\n{stderr_text[:300]}")
-                
-                # Search for output file
-                output_file = await find_output_file(req_id, input_file, debug_info)
-                
-                if output_file:
-                    with open(output_file, 'r') as f:
-                        output = f.read()
-                    
-                    debug_info.append(f"✅ Output found: {output_file}")
-                    debug_info.append(f"📏 Output size: {len(output)} bytes")
-                    
-                    result_data = {
-                        'success': True,
-                        'output': output,
-                        'time': f'{elapsed:.2f}s',
-                        'original': len(code),
-                        'obfuscated': len(output),
-                        'debug': '\n'.join(debug_info) if debug else None,
-                        'command': ' '.join(cmd)
-                    }
-                    
-                    # Cleanup output file
-                    try:
-                        os.remove(output_file)
-                    except:
-                        pass
-                    
-                    break  # Success, exit loop
-                else:
-                    last_error = stderr_text or stdout_text or 'No output file'
-                    debug_info.append(f"❌ No output file found")
-                    
-            except asyncio.TimeoutError:
-                debug_info.append("❌ Command timeout")
-                last_error = "Timeout"
-            except Exception as e:
-                debug_info.append(f"❌ Error: {str(e)}")
-                last_error = str(e)
-        
-        if result_data:
-            return result_data
-        else:
-            return {
-                'success': False,
-                'error': last_error[:500] if last_error else 'Obfuscation failed',
-                'debug': '\n'.join(debug_info) if debug else None
-            }
-            
-    except Exception as e:
-        debug_info.append(f"❌ Exception: {str(e)}")
-        return {
-            'success': False,
-            'error': str(e),
-            'debug': '\n'.join(debug_info) if debug else None
-        }
-    finally:
-        # Cleanup input file
-        if os.path.exists(input_file):
-            try:
-                os.remove(input_file)
-            except:
-                pass
-
-async def find_output_file(req_id, input_file, debug_info):
-    """Search for the obfuscated output file"""
-    base_name = os.path.basename(input_file).replace('.lua', '_obfuscated.lua')
-    
-    # Possible locations
-    locations = [
-        input_file.replace('.lua', '_obfuscated.lua'),
-        os.path.join(Config.HERCULES_PATH, base_name),
-        os.path.join(Config.HERCULES_PATH, f'{req_id}_obfuscated.lua'),
-        os.path.join(Config.UPLOAD_FOLDER, base_name),
-    ]
-    
-    # Also scan directories for any obfuscated files
-    for directory in [Config.HERCULES_PATH, Config.UPLOAD_FOLDER]:
-        try:
-            for f in os.listdir(directory):
-                if '_obfuscated.lua' in f:
-                    full_path = os.path.join(directory, f)
-                    locations.append(full_path)
-                    debug_info.append(f"🔍 Found file: {f}")
-        except:
-            pass
-    
-    # Check each location
-    for loc in locations:
-        if os.path.exists(loc):
-            return loc
-    
-    return None
+    result = await client.obfuscate(code, preset, debug, 'bot', on_queue, on_start)
+    if result['success'] and not skip_verify and Config.VERIFY_OUTPUT:
+        result['verification'] = asyncio.create_task(client.verify(code, result['output']))
+    return result
+
+VERDICT_ICONS = {'passed': '✅', 'failed': '⚠️', 'inconclusive': '❔', 'skipped': '⏭️'}
+
+def verification_pending(embed, result):
+    if result.get('verification'):
+        embed.add_field(name="🧪 Verification", value="⏳ Checking that the output behaves like the original...", inline=False)
+    return embed
+
+async def show_verdict(msg, embed, result):
+    """Put the verdict of run_obfuscator()'s verification task in place of the pending field"""
+    if not result.get('verification'):
+        return
+    verdict = await result['verification']
+    embed.set_field_at(
+        len(embed.fields) - 1,
+        name="🧪 Verification",
+        value=f"{VERDICT_ICONS.get(verdict['verdict'], '')} **{verdict['verdict'].capitalize()}**: {verdict['reason'][:300]}",
+        inline=False
+    )
+    await msg.edit(embed=embed)
 
 async def test_hercules():
-    """Test if Hercules is working"""
-    debug_info = []
-    
-    # Test 1: Check if lua is available
-    try:
-        proc = await asyncio.create_subprocess_exec(
-            'lua', '-v',
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await proc.communicate()
-        lua_version = clean_ansi((stdout or stderr).decode())
-        debug_info.append(f"✅ Lua: {lua_version.strip()}")
-    except Exception as e:
-        debug_info.append(f"❌ Lua not found: {e}")
-    
-    # Test 2: Check hercules directory
-    try:
-        files = os.listdir(Config.HERCULES_PATH)
-        debug_info.append(f"✅ Hercules path: {Config.HERCULES_PATH}")
-        debug_info.append(f"📁 Files: {', '.join(files[:10])}")
-        if 'hercules.lua' in files:
-            debug_info.append("✅ hercules.lua found")
-        else:
-            debug_info.append("❌ hercules.lua NOT found")
-    except Exception as e:
-        debug_info.append(f"❌ Cannot read hercules path: {e}")
-    
-    # Test 3: Run hercules help
-    try:
-        proc = await asyncio.create_subprocess_exec(
-            'lua', 'hercules.lua', '--help',
-            cwd=Config.HERCULES_PATH,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
+    """The last background self-test (selftest.py); nothing is run on request"""
+    return await asyncio.to_thread(selftest.report)
+
+async def read_batch(attachments):
+    """Download attachments (zips and .lua files) into a list of (name, code)"""
+    uploads = []
+    for att in attachments:
+        if att.size > Config.MAX_BATCH_BYTES:
+            raise BatchError(f"{att.filename} is too large")
+        uploads.append((att.filename, await att.read()))
+    return batch.collect(uploads)
+
+async def run_batch(files, preset, presets, progress=None):
+    """
+    Obfuscate files spread over the available concurrency.
+    progress(done, total) is awaited at most every 2 seconds.
+    Returns (summary, zip file object, failed entries).
+    """
+    started = time.time()
+    limit = asyncio.Semaphore(job_queue.concurrency)
+    state = {'done': 0, 'shown': 0.0}
+    
+    async def run_one(name, code):
+        file_preset = batch.preset_for(name, preset, presets)
+        async with limit:
+            file_started = time.time()
+            # Not verified: a batch's files would take every verification slot /obfuscate needs
+            result = await run_obfuscator(code, file_preset, skip_verify=True)
+            # Shared queue is full: wait for room rather than failing the file
+            while result.get('busy') and time.time() - started < Config.QUEUE_WAIT_TIMEOUT:
+                await asyncio.sleep(min(max(result['retry_after'], 1), 5))
+                result = await run_obfuscator(code, file_preset, skip_verify=True)
+        state['done'] += 1
+        if progress and time.time() - state['shown'] > 2:
+            state['shown'] = time.time()
+            await progress(state['done'], len(files))
+        return batch.entry(name, file_preset, code, result, file_started)
+    
+    entries = await asyncio.gather(*(run_one(name, code) for name, code in files))
+    summary = batch.summarize(entries, started)
+    archive = await asyncio.to_thread(batch.build_zip, entries, summary)
+    failures = [e for e in entries if not e['success']]
+    return summary, archive, failures
+
+def batch_embed(summary, failures):
+    color = 0x00ff64 if not failures else (0xffc800 if summary['succeeded'] else 0xff6464)
+    embed = create_embed(
+        "📦 Batch Complete",
+        f"**Files:** `{summary['succeeded']}/{summary['files']}` succeeded\n"
+        f"**Time:** `{summary['seconds']:.2f}s`\n"
+        f"**Size:** `{summary['original_size']:,}` → `{summary['obfuscated_size']:,}` bytes",
+        color
+    )
+    if failures:
+        embed.add_field(
+            name="❌ Failed",
+            value='\n'.join(f"`{e['file']}`: {e['error'][:80]}" for e in failures[:5])[:1000],
+            inline=False
         )
-        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=10)
-        output = clean_ansi((stdout or stderr).decode())
-        debug_info.append(f"✅ Hercules help:\n{output[:500]}")
-    except Exception as e:
-        debug_info.append(f"❌ Hercules help failed: {e}")
-    
-    # Test 4: Simple obfuscation test
-    test_code = 'print("test")'
-    debug_info.append(f"\n🧪 Testing with: {test_code}")
-    
-    result = await run_obfuscator(test_code, 'min', debug=True)
-    if result['success']:
-        debug_info.append(f"✅ Test obfuscation SUCCESS")
-        debug_info.append(f"📏 Output size: {result['obfuscated']} bytes")
-    else:
-        debug_info.append(f"❌ Test obfuscation FAILED: {result['error']}")
-    
-    if result.get('debug'):
-        debug_info.append(f"\n📋 Debug output:\n{result['debug']}")
-    
-    return '\n'.join(debug_info)
+    embed.add_field(name="📋 Report", value="Per-file timings and sizes are in `batch_report.json`", inline=False)
+    return embed
 
 # ============ SLASH COMMANDS ============
 
@@ -272,7 +290,9 @@ async def test_hercules():
     code="Lua code to obfuscate",
     preset="Obfuscation level",
     file="Upload .lua file",
-    debug="Show debug information"
+    debug="Show debug information",
+    steps="Custom steps instead of the preset, e.g. variable_renaming,compressor",
+    verify="Check that the output behaves like the original (after it is sent)"
 )
 @app_commands.choices(preset=[
     app_commands.Choice(name="Minimum - Light", value="min"),
@@ -284,9 +304,18 @@ async def slash_obf(
     code: str = None, 
     preset: str = "min", 
     file: discord.Attachment = None,
-    debug: bool = False
+    debug: bool = False,
+    steps: str = None,
+    verify: bool = True
 ):
-    on_cd, rem = check_cooldown(interaction.user.id)
+    if steps:
+        try:
+            preset = pipelines.parse(steps)
+        except pipelines.StepError as e:
+            await interaction.response.send_message(embed=create_embed("❌ Error", str(e), 0xff6464), ephemeral=True)
+            return
+    
+    on_cd, rem = await check_cooldown(interaction.user.id, interaction.guild, ratelimit.cost(preset))
     if on_cd:
         await interaction.response.send_message(
             embed=create_embed("⏳ Cooldown", f"Wait {rem}s", 0xffc800), 
@@ -309,39 +338,56 @@ async def slash_obf(
         )
         return
     
-    bot.stats['total'] += 1
     msg = await interaction.followup.send(
         embed=create_embed("🔄 Obfuscating", f"**Preset:** `{preset}`\nPlease wait...", 0xffc800)
     )
     
-    result = await run_obfuscator(code, preset, debug=debug)
+    async def show_queue(position, eta):
+        await msg.edit(embed=create_embed(
+            "🔄 Obfuscating",
+            f"**Preset:** `{preset}`\n**Queue position:** `{position + 1}`\n**Estimated wait:** `~{eta:.0f}s`",
+            0xffc800
+        ))
+    
+    async def show_eta(estimate):
+        if estimate['trained']:
+            await msg.edit(embed=create_embed(
+                "🔄 Obfuscating",
+                f"**Preset:** `{preset}`\n**ETA:** `~{estimate['seconds']:.0f}s`",
+                0xffc800
+            ))
+    
+    result = await run_obfuscator(code, preset, skip_verify=not verify, debug=debug, on_queue=show_queue, on_start=show_eta)
+    
+    if result.get('busy'):
+        await msg.edit(embed=busy_embed(result))
+        return
     
     if result['success']:
-        bot.stats['success'] += 1
         inc = ((result['obfuscated'] - result['original']) / result['original'] * 100) if result['original'] > 0 else 0
         
         embed = create_embed(
             "✅ Obfuscation Complete",
-            f"**Preset:** `{preset}`\n**Time:** `{result['time']}`\n**Size:** `{result['original']:,}` → `{result['obfuscated']:,}` bytes (+{inc:.1f}%)",
+            f"**Preset:** `{preset}`\n**Time:** `{result['time']}`{run_note(result)}\n**Size:** `{result['original']:,}` → `{result['obfuscated']:,}` bytes (+{inc:.1f}%)",
             0x00ff64
         )
+        verification_pending(embed, result)
         
         await msg.edit(embed=embed)
         
-        # Send output file
-        await interaction.followup.send(
-            file=discord.File(io.BytesIO(result['output'].encode()), filename="obfuscated.lua")
-        )
+        # Send output file (zipped or as a link when it's too big to upload)
+        await send_output(interaction.followup.send, result['output'], interaction.guild, preset, result['original'])
         
         # Send debug info if requested
         if debug and result.get('debug'):
             debug_text = result['debug'][:1900]
             await interaction.followup.send(f"```\n{debug_text}\n```")
+        
+        await show_verdict(msg, embed, result)
     else:
-        bot.stats['failed'] += 1
         error_msg = result['error'][:500]
         
-        embed = create_embed("❌ Failed", error_msg, 0xff6464)
+        embed = create_embed("❌ Syntax Error" if result.get('invalid') else "❌ Failed", error_msg, 0xff6464)
         await msg.edit(embed=embed)
         
         # Always show debug on failure
@@ -350,12 +396,65 @@ async def slash_obf(
             await interaction.followup.send(f"**Debug Info:**\n```\n{debug_text}\n```")
 
 
+@bot.tree.command(name="batch", description="Obfuscate several Lua files or a zip at once")
+@app_commands.describe(
+    file1="A .lua file or a .zip of your project",
+    file2="Another .lua or .zip",
+    file3="Another .lua or .zip",
+    file4="Another .lua or .zip",
+    file5="Another .lua or .zip",
+    preset="Obfuscation level for the whole batch",
+    presets="Per-file presets, e.g. main.lua=max,util.lua=min"
+)
+@app_commands.choices(preset=[
+    app_commands.Choice(name="Minimum - Light", value="min"),
+    app_commands.Choice(name="Medium - Balanced", value="mid"),
+    app_commands.Choice(name="Maximum - Heavy", value="max"),
+])
+async def slash_batch(
+    interaction: discord.Interaction,
+    file1: discord.Attachment,
+    file2: discord.Attachment = None,
+    file3: discord.Attachment = None,
+    file4: discord.Attachment = None,
+    file5: discord.Attachment = None,
+    preset: str = "min",
+    presets: str = None
+):
+    await interaction.response.defer()
+    
+    try:
+        files = await read_batch([f for f in (file1, file2, file3, file4, file5) if f])
+        per_file = batch.parse_presets(presets)
+    except BatchError as e:
+        await interaction.followup.send(embed=create_embed("❌ Error", str(e), 0xff6464))
+        return
+    
+    # Every file in the batch is a job
+    cost = sum(ratelimit.cost(batch.preset_for(name, preset, per_file)) for name, _ in files)
+    on_cd, rem = await check_cooldown(interaction.user.id, interaction.guild, cost)
+    if on_cd:
+        await interaction.followup.send(embed=create_embed("⏳ Cooldown", f"Wait {rem}s", 0xffc800))
+        return
+    
+    msg = await interaction.followup.send(
+        embed=create_embed("📦 Obfuscating Batch", f"**Files:** `{len(files)}`\n**Preset:** `{preset}`", 0xffc800)
+    )
+    
+    async def show_progress(done, total):
+        await msg.edit(embed=create_embed("📦 Obfuscating Batch", f"**Progress:** `{done}/{total}`", 0xffc800))
+    
+    summary, archive, failures = await run_batch(files, preset, per_file, show_progress)
+    await msg.edit(embed=batch_embed(summary, failures))
+    await send_archive(interaction.followup.send, archive, interaction.guild)
+
+
 @bot.tree.command(name="test", description="Test if Hercules obfuscator is working")
 async def slash_test(interaction: discord.Interaction):
     await interaction.response.defer()
     
     msg = await interaction.followup.send(
-        embed=create_embed("🧪 Testing", "Running diagnostics...", 0xffc800)
+        embed=create_embed("🧪 Testing", "Reading the latest self-test...", 0xffc800)
     )
     
     test_result = await test_hercules()
@@ -386,6 +485,7 @@ async def slash_help(interaction: discord.Interaction):
         name="📝 Commands",
         value="""
 `/obfuscate` - Obfuscate code (add `debug:True` for details)
+`/batch` - Obfuscate several files or a .zip
 `/test` - Test if Hercules is working
 `/debug` - Toggle debug mode
 `/stats` - View statistics
@@ -407,6 +507,7 @@ async def slash_help(interaction: discord.Interaction):
         name="💬 Prefix Commands",
         value="""
 `!obf <code>` - Quick obfuscate
+`!batch [preset]` - Obfuscate attached files/.zip
 `!test` - Quick test
 `!debug` - Show debug info
         """,
@@ -430,17 +531,44 @@ async def slash_stats(interaction: discord.Interaction):
     d, h = divmod(h, 24)
     uptime = f"{d}d {h}h {m}m" if d else f"{h}h {m}m {s}s"
     
-    rate = (bot.stats['success'] / bot.stats['total'] * 100) if bot.stats['total'] > 0 else 0
-    
-    embed = create_embed("📊 Statistics", "")
-    embed.add_field(name="Total", value=f"`{bot.stats['total']}`", inline=True)
-    embed.add_field(name="Success", value=f"`{bot.stats['success']}`", inline=True)
-    embed.add_field(name="Failed", value=f"`{bot.stats['failed']}`", inline=True)
+    day, month = await asyncio.gather(
+        asyncio.to_thread(stats_store.query, 24, 60),
+        asyncio.to_thread(stats_store.query, Config.STATS_RETENTION_DAYS * 24, 24 * 60),
+    )
+    outcomes = day['outcomes']
+    succeeded = sum(outcomes[o]['jobs'] for o in ('done', 'cached', 'coalesced') if o in outcomes)
+    failed = outcomes['failed']['jobs'] if 'failed' in outcomes else 0
+    rate = (succeeded / (succeeded + failed) * 100) if succeeded + failed > 0 else 0
+    latency = day['total']
+    
+    embed = create_embed("📊 Statistics", "Last 24 hours, all sources")
+    embed.add_field(name="Jobs", value=f"`{latency['jobs']}`", inline=True)
+    embed.add_field(name="Success", value=f"`{succeeded}`", inline=True)
+    embed.add_field(name="Failed", value=f"`{failed}`", inline=True)
     embed.add_field(name="Rate", value=f"`{rate:.1f}%`", inline=True)
+    embed.add_field(
+        name="Latency",
+        value=f"p50 `{latency['p50_seconds'] or 0:.2f}s` / p95 `{latency['p95_seconds'] or 0:.2f}s`",
+        inline=True
+    )
+    embed.add_field(name=f"{Config.STATS_RETENTION_DAYS} days", value=f"`{month['total']['jobs']}` jobs", inline=True)
+    if day['presets']:
+        embed.add_field(
+            name="Presets",
+            value=' '.join(f"`{name}`: {p['jobs']}" for name, p in day['presets'].items()),
+            inline=False
+        )
     embed.add_field(name="Servers", value=f"`{len(bot.guilds)}`", inline=True)
     embed.add_field(name="Uptime", value=f"`{uptime}`", inline=True)
     embed.add_field(name="Debug", value=f"`{'ON' if bot.debug_mode else 'OFF'}`", inline=True)
     
+    cache_stats = (await client.summary())['cache']
+    embed.add_field(
+        name="Cache",
+        value=f"`{cache_stats['hits']}` hits / `{cache_stats['misses']}` misses (`{cache_stats['hit_rate']}%`)",
+        inline=False
+    )
+    
     await interaction.response.send_message(embed=embed)
 
 
@@ -459,31 +587,73 @@ async def cmd_obf(ctx, *, code: str = None):
         await ctx.send(embed=create_embed("❌", "`!obf <code>` or attach file", 0xff6464))
         return
     
-    on_cd, rem = check_cooldown(ctx.author.id)
+    on_cd, rem = await check_cooldown(ctx.author.id, ctx.guild, ratelimit.cost('min'))
     if on_cd:
         await ctx.send(embed=create_embed("⏳", f"Wait {rem}s", 0xffc800))
         return
     
-    bot.stats['total'] += 1
     msg = await ctx.send(embed=create_embed("🔄", "Obfuscating...", 0xffc800))
     
-    result = await run_obfuscator(code, 'min', debug=bot.debug_mode)
+    async def show_queue(position, eta):
+        await msg.edit(embed=create_embed("🔄", f"Queued at position `{position + 1}` (~{eta:.0f}s)", 0xffc800))
+    
+    async def show_eta(estimate):
+        if estimate['trained']:
+            await msg.edit(embed=create_embed("🔄", f"Obfuscating... ETA `~{estimate['seconds']:.0f}s`", 0xffc800))
+    
+    result = await run_obfuscator(code, 'min', debug=bot.debug_mode, on_queue=show_queue, on_start=show_eta)
+    
+    if result.get('busy'):
+        await msg.edit(embed=busy_embed(result))
+        return
     
     if result['success']:
-        bot.stats['success'] += 1
-        await msg.edit(embed=create_embed(
+        embed = verification_pending(create_embed(
             "✅ Complete", 
-            f"Time: `{result['time']}`\nSize: `{result['original']:,}` → `{result['obfuscated']:,}`", 
+            f"Time: `{result['time']}`{run_note(result)}\nSize: `{result['original']:,}` → `{result['obfuscated']:,}`", 
             0x00ff64
-        ))
-        await ctx.send(file=discord.File(io.BytesIO(result['output'].encode()), filename="obfuscated.lua"))
+        ), result)
+        await msg.edit(embed=embed)
+        await send_output(ctx.send, result['output'], ctx.guild, 'min', result['original'])
+        await show_verdict(msg, embed, result)
     else:
-        bot.stats['failed'] += 1
-        await msg.edit(embed=create_embed("❌ Failed", result['error'][:500], 0xff6464))
+        await msg.edit(embed=create_embed("❌ Syntax Error" if result.get('invalid') else "❌ Failed", result['error'][:500], 0xff6464))
         if result.get('debug'):
             await ctx.send(f"```\n{result['debug'][:1500]}\n```")
 
 
+@bot.command(name='batch')
+async def cmd_batch(ctx, preset: str = 'min', *, presets: str = None):
+    if not ctx.message.attachments:
+        await ctx.send(embed=create_embed("❌", "`!batch [preset] [a.lua=max,...]` with .lua files or a .zip attached", 0xff6464))
+        return
+    
+    if preset not in batch.PRESET_NAMES:
+        preset = 'min'
+    
+    try:
+        files = await read_batch(ctx.message.attachments)
+        per_file = batch.parse_presets(presets)
+    except BatchError as e:
+        await ctx.send(embed=create_embed("❌", str(e), 0xff6464))
+        return
+    
+    cost = sum(ratelimit.cost(batch.preset_for(name, preset, per_file)) for name, _ in files)
+    on_cd, rem = await check_cooldown(ctx.author.id, ctx.guild, cost)
+    if on_cd:
+        await ctx.send(embed=create_embed("⏳", f"Wait {rem}s", 0xffc800))
+        return
+    
+    msg = await ctx.send(embed=create_embed("📦", f"Obfuscating {len(files)} files...", 0xffc800))
+    
+    async def show_progress(done, total):
+        await msg.edit(embed=create_embed("📦", f"Obfuscating... `{done}/{total}`", 0xffc800))
+    
+    summary, archive, failures = await run_batch(files, preset, per_file, show_progress)
+    await msg.edit(embed=batch_embed(summary, failures))
+    await send_archive(ctx.send, archive, ctx.guild)
+
+
 @bot.command(name='test')
 async def cmd_test(ctx):
     msg = await ctx.send(embed=create_embed("🧪", "Testing...", 0xffc800))
@@ -498,12 +668,19 @@ async def cmd_test(ctx):
 @bot.command(name='debug')
 async def cmd_debug(ctx):
     """Show current debug info"""
+    summary = await client.summary()
     info = f"""
 **Debug Info**
 • Hercules Path: `{Config.HERCULES_PATH}`
 • Upload Folder: `{Config.UPLOAD_FOLDER}`
 • Debug Mode: `{'ON' if bot.debug_mode else 'OFF'}`
-• Stats: {bot.stats}
+• Stats (24h): {(await asyncio.to_thread(stats_store.query, 24))['total']}
+• Daemon: {'yes' if summary['daemon'] else 'no (in-process)'}
+• Cache: {summary['cache']}
+• Workers: {summary['workers']}
+• Queue: {summary['queue']}
+• Cost model: {summary['cost_model']}
+• Capabilities: {summary['capabilities']}
     """
     await ctx.send(embed=create_embed("🔧 Debug", info, 0x00d4ff))
 
@@ -513,7 +690,7 @@ async def cmd_help(ctx):
     embed = create_embed("🛡️ Hercules", "")
     embed.add_field(
         name="Commands", 
-        value="`/obfuscate` - Main\n`/test` - Test\n`!obf <code>` - Quick\n`!test` - Quick test", 
+        value="`/obfuscate` - Main\n`/batch` - Many files\n`/test` - Test\n`!obf <code>` - Quick\n`!batch` - Many files\n`!test` - Quick test", 
         inline=False
     )
     await ctx.send(embed=embed)
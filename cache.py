@@ -0,0 +1,221 @@
+import os
+import hashlib
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+import metrics
+
+_hercules_revision = None
+
+
+def hercules_revision():
+    """Revision of the Hercules checkout, computed once per process"""
+    global _hercules_revision
+    if _hercules_revision is not None:
+        return _hercules_revision
+
+    root = os.path.dirname(Config.HERCULES_PATH.rstrip('/'))
+    try:
+        r = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True, text=True, timeout=5)
+        if r.returncode == 0 and r.stdout.strip():
+            _hercules_revision = r.stdout.strip()
+            return _hercules_revision
+    except Exception:
+        pass
+
+    # No git metadata: fingerprint the sources instead
+    h = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(Config.HERCULES_PATH):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if not name.endswith('.lua'):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            h.update(f'{os.path.relpath(path, Config.HERCULES_PATH)}:{st.st_size}:{int(st.st_mtime)}\n'.encode())
+    _hercules_revision = 'tree-' + h.hexdigest()[:16]
+    return _hercules_revision
+
+
+def lua_version():
+    """Version banner of the probed Lua interpreter"""
+    from probe import capabilities
+    return capabilities()['version'] or 'unknown'
+
+
+class ResultCache:
+    """
+    Two-tier cache of obfuscation output keyed by content hash.
+    Memory tier is a bounded LRU, disk tier is evicted oldest-first by total size.
+    """
+
+    def __init__(self, directory, max_entries, max_memory_bytes, max_disk_bytes):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict()  # key -> (output, its size in bytes encoded)
+        self.memory_bytes = 0
+        self.disk_bytes = None
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'memory_hits': 0, 'disk_hits': 0, 'stores': 0, 'evictions': 0}
+
+    def key(self, code, preset):
+        h = hashlib.sha256()
+        for part in (hercules_revision(), lua_version(), preset):
+            h.update(part.encode())
+            h.update(b'\0')
+        h.update(code.encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.lua')
+
+    def _remember(self, key, output, size):
+        if size > self.max_memory_bytes:
+            return
+        if key in self.memory:
+            self.memory_bytes -= self.memory.pop(key)[1]
+        self.memory[key] = (output, size)
+        self.memory_bytes += size
+        while self.memory and (len(self.memory) > self.max_entries or self.memory_bytes > self.max_memory_bytes):
+            _, (_, old) = self.memory.popitem(last=False)
+            self.memory_bytes -= old
+
+    def get(self, key):
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+                self.stats['hits'] += 1
+                self.stats['memory_hits'] += 1
+                return entry[0]
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self.lock:
+                self.stats['misses'] += 1
+            return None
+
+        output = data.decode('utf-8')
+        with self.lock:
+            self._remember(key, output, len(data))
+            self.stats['hits'] += 1
+            self.stats['disk_hits'] += 1
+        return output
+
+    def file(self, key):
+        """Path of the disk copy of an entry, or None"""
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+    def put(self, key, output):
+        data = output.encode()
+        with self.lock:
+            self._remember(key, output, len(data))
+            self.stats['stores'] += 1
+
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # An overwritten entry no longer counts
+            try:
+                replaced = os.stat(path).st_size
+            except OSError:
+                replaced = 0
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            return
+
+        with self.lock:
+            if self.disk_bytes is None:
+                self.disk_bytes = self._disk_usage()
+            else:
+                self.disk_bytes += len(data) - replaced
+            if self.disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _entries(self):
+        entries = []
+        try:
+            for name in os.listdir(self.directory):
+                if not name.endswith('.lua'):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+        except OSError:
+            pass
+        return entries
+
+    def _disk_usage(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict_disk(self):
+        """Drop least recently used files until the disk tier fits again (caller holds lock)"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_disk_bytes * 0.9
+        for _, size, name in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+                total -= size
+                self.stats['evictions'] += 1
+            except OSError:
+                pass
+        self.disk_bytes = total
+
+    def summary(self):
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(
+                self.stats,
+                hit_rate=round(self.stats['hits'] / lookups * 100, 1) if lookups else 0.0,
+                memory_entries=len(self.memory),
+                memory_bytes=self.memory_bytes,
+                disk_bytes=self.disk_bytes,
+            )
+
+
+cache = ResultCache(
+    Config.CACHE_FOLDER,
+    Config.CACHE_MEMORY_ENTRIES,
+    Config.CACHE_MEMORY_BYTES,
+    Config.CACHE_DISK_BYTES,
+)
+
+
+def cached_result(code, preset):
+    """Look up a finished obfuscation (preset: what identifies the steps), returns (key, result dict or None)"""
+    start = time.time()
+    key = cache.key(code, preset)
+    output = cache.get(key)
+    if output is None:
+        metrics.cache_lookups.inc(result='miss')
+        return key, None
+    metrics.cache_lookups.inc(result='hit')
+    elapsed = time.time() - start
+    return key, {
+        'success': True,
+        'output': output,
+        'time': f'{elapsed:.3f}s',
+        'original': len(code),
+        'obfuscated': len(output),
+        'cached': True,
+    }
@@ -0,0 +1,273 @@
+"""
+Split mode: obfuscate a large file as several parts in parallel.
+
+The source is cut at top-level statements (functions, module-table members,
+everything else in between) into contiguous parts that are obfuscated
+independently and put back together in order, each inside its own
+do ... end block. Top-level locals are declared once in an unobfuscated
+prelude and the statements that created them become plain assignments, so
+every part still sees them; their names are the only thing split mode
+leaves readable.
+
+plan() raises Unsplittable when that rewrite could change what the program
+does (a top-level local used before it is declared or declared twice,
+<const>/<close> attributes, top-level labels, syntax we can't follow); the
+caller then runs the file whole. Steps that treat the file as one unit
+(the compressor, the VM, ...) run once over the reassembled result.
+"""
+import re
+from config import Config
+
+KEYWORDS = {
+    'and', 'break', 'do', 'else', 'elseif', 'end', 'false', 'for', 'function', 'if', 'in',
+    'local', 'nil', 'not', 'or', 'repeat', 'return', 'then', 'true', 'until', 'while',
+}
+OPENERS = {'function', 'if', 'do', 'repeat'}
+CLOSERS = {'end', 'until'}
+STATEMENT_KEYWORDS = {'local', 'return', 'if', 'while', 'for', 'repeat', 'break'}
+# Tokens an expression can end with; a name right after one starts a new statement
+EXPRESSION_END = {')', ']', '}', 'end', 'true', 'false', 'nil', '...'}
+
+# Steps that only make sense over the whole program
+WHOLE_FILE_STEPS = ('compressor', 'wrap_in_function', 'virtual_machine', 'antitamper')
+
+NAME = re.compile(r'[A-Za-z_]\w*')
+NUMBER = re.compile(r'(?:\d|\.\d)[\w.]*')
+STRING = re.compile(r'"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'', re.S)
+LONG_OPEN = re.compile(r'\[(=*)\[')
+SPACE = re.compile(r'\s+')
+OPERATORS = ('...', '..', '::', '==', '~=', '<=', '>=', '//', '<<', '>>')
+
+
+class Unsplittable(Exception):
+    """Splitting this file could change its behaviour (or we can't tell)"""
+
+
+def _long_bracket(code, pos):
+    """End offset of the long string/comment body opened at pos, or None if there is none"""
+    m = LONG_OPEN.match(code, pos)
+    if not m:
+        return None
+    close = code.find(f']{m.group(1)}]', m.end())
+    if close < 0:
+        raise Unsplittable('unterminated long string or comment')
+    return close + len(m.group(1)) + 2
+
+
+def tokenize(code):
+    """(kind, text, start, end) for every token; comments and whitespace are skipped"""
+    tokens = []
+    pos = 0
+    length = len(code)
+    if code.startswith('#'):
+        raise Unsplittable('shebang line')
+    while pos < length:
+        m = SPACE.match(code, pos)
+        if m:
+            pos = m.end()
+            continue
+        if code.startswith('--', pos):
+            end = _long_bracket(code, pos + 2)
+            if end is None:
+                end = code.find('\n', pos)
+                end = length if end < 0 else end
+            pos = end
+            continue
+        c = code[pos]
+        if c == '[':
+            end = _long_bracket(code, pos)
+            if end is not None:
+                tokens.append(('string', code[pos:end], pos, end))
+                pos = end
+                continue
+        if c in '"\'':
+            m = STRING.match(code, pos)
+            if not m:
+                raise Unsplittable('unterminated string')
+            tokens.append(('string', m.group(), pos, m.end()))
+            pos = m.end()
+            continue
+        m = NAME.match(code, pos)
+        if m:
+            word = m.group()
+            tokens.append(('keyword' if word in KEYWORDS else 'name', word, pos, m.end()))
+            pos = m.end()
+            continue
+        m = NUMBER.match(code, pos)
+        if m:
+            tokens.append(('number', m.group(), pos, m.end()))
+            pos = m.end()
+            continue
+        op = next((o for o in OPERATORS if code.startswith(o, pos)), c)
+        tokens.append(('op', op, pos, pos + len(op)))
+        pos += len(op)
+    return tokens
+
+
+def _ends_expression(token):
+    return token[0] in ('name', 'number', 'string') or token[1] in EXPRESSION_END
+
+
+def statements(tokens):
+    """Split tokens into top-level statements (lists of tokens)"""
+    result = []
+    depth = brackets = 0
+    loop_header = False
+    prev = None
+    for token in tokens:
+        kind, text = token[0], token[1]
+        if depth == 0 and brackets == 0:
+            if text == '::':
+                raise Unsplittable('top-level label')
+            if prev is None or prev[1] == ';':
+                start = True
+            elif kind == 'keyword' and text in STATEMENT_KEYWORDS:
+                start = True
+            elif text == 'do':
+                start = not loop_header
+            elif kind == 'name' or text == 'function':
+                start = _ends_expression(prev)
+            else:
+                start = False
+            if start:
+                result.append([])
+            if text in ('while', 'for'):
+                loop_header = True
+            elif text == 'do':
+                loop_header = False
+        if kind == 'keyword':
+            if text in OPENERS:
+                depth += 1
+            elif text in CLOSERS:
+                depth -= 1
+        elif text in ('(', '[', '{'):
+            brackets += 1
+        elif text in (')', ']', '}'):
+            brackets -= 1
+        if depth < 0 or brackets < 0:
+            raise Unsplittable('unbalanced blocks')
+        result[-1].append(token)
+        prev = token
+    if depth or brackets:
+        # Also what Luau if-expressions look like to this scanner
+        raise Unsplittable('unbalanced blocks')
+    return result
+
+
+def _references(statement):
+    """Names the statement could read or write as variables (an over-estimate)"""
+    names = set()
+    prev = None
+    for token in statement:
+        if token[0] == 'name' and not (prev and prev[1] in ('.', ':')):
+            names.add(token[1])
+        prev = token
+    return names
+
+
+def _declaration(statement):
+    """
+    (names declared as top-level locals, the function's own name, replacement
+    for the `local ...` head, end offset of the head, index of the first token
+    after the declared names) or None
+    """
+    if statement[0][1] != 'local':
+        return None
+    if len(statement) > 2 and statement[1][1] == 'function' and statement[2][0] == 'name':
+        name = statement[2][1]
+        return [name], name, f'{name} = function', statement[2][3], 3
+    names = []
+    i = 1
+    while i < len(statement) and statement[i][0] == 'name':
+        names.append(statement[i][1])
+        i += 1
+        if i < len(statement) and statement[i][1] == ',':
+            i += 1
+            continue
+        break
+    if not names or (i < len(statement) and statement[i][1] not in ('=', ';')):
+        # <const>/<close> attributes, Luau type annotations, something we don't follow
+        raise Unsplittable('unsupported local declaration')
+    if i < len(statement) and statement[i][1] == '=':
+        # `local a, b = ...` -> `a, b = ...`
+        return names, None, '', statement[1][2], i
+    # A bare `local a, b`: the prelude declares them
+    return names, None, '', statement[i - 1][3], i
+
+
+def plan(code):
+    """
+    (prelude, pieces): the prelude declares every top-level local, pieces are
+    the top-level statements rewritten to assign them. Raises Unsplittable.
+    """
+    tokens = tokenize(code)
+    if not tokens:
+        raise Unsplittable('empty')
+    parsed = statements(tokens)
+    declarations = [_declaration(s) for s in parsed]
+    top_level = {name for d in declarations if d for name in d[0]}
+
+    declared = []
+    pieces = []
+    for index, statement in enumerate(parsed):
+        start = 0 if index == 0 else statement[0][2]
+        end = parsed[index + 1][0][2] if index + 1 < len(parsed) else len(code)
+        text = code[start:end]
+        d = declarations[index]
+        own = set(d[0]) if d else set()
+        visible = set(declared) | ({d[1]} if d and d[1] else set())
+        # Reading a top-level local before its declaration means a global (or an older local) today
+        early = (_references(statement[d[4]:] if d else statement) & top_level) - visible
+        if early:
+            raise Unsplittable(f'{sorted(early)[0]} is used before its local declaration')
+        if own & set(declared):
+            raise Unsplittable(f'{sorted(own & set(declared))[0]} is declared twice')
+        if d:
+            head = statement[0][2] - start
+            text = text[:head] + d[2] + text[d[3] - start:]
+            declared.extend(d[0])
+        pieces.append(text)
+
+    prelude = f"local {', '.join(declared)}\n" if declared else ''
+    return prelude, pieces
+
+
+def group(pieces, count):
+    """Contiguous runs of pieces with roughly equal byte counts, at most count of them"""
+    total = sum(len(p) for p in pieces)
+    target = total / count
+    parts = [[]]
+    size = 0
+    for piece in pieces:
+        if parts[-1] and size >= target * len(parts) and len(parts) < count:
+            parts.append([])
+        parts[-1].append(piece)
+        size += len(piece)
+    return [''.join(part) for part in parts]
+
+
+def assemble(prelude, outputs):
+    return prelude + ''.join(f'do\n{output}\nend\n' for output in outputs)
+
+
+def steps(preset):
+    """(steps for the first part, steps for the other parts, steps for a final whole-file pass), as lists"""
+    names = [name for name in Config.STEPS if Config.PRESETS[preset].get(name)]
+    part = [n for n in names if n != 'watermark' and n not in WHOLE_FILE_STEPS]
+    final = [n for n in names if n in WHOLE_FILE_STEPS]
+    # One watermark, last as everywhere: on the final pass when there is one, else on the first part
+    watermark = ['watermark'] if 'watermark' in names else []
+    if final:
+        final = final + watermark
+        first = part
+    else:
+        first = part + watermark
+    return first, part, final
+
+
+def worthwhile(code, preset):
+    return (
+        Config.SPLIT_ENABLED
+        and preset in Config.SPLIT_PRESETS
+        and len(code) >= Config.SPLIT_MIN_BYTES
+    )
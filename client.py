@@ -0,0 +1,266 @@
+"""
+Client for the obfuscation daemon (daemon.py) on Config.DAEMON_SOCKET.
+
+Frames are a JSON header line followed by `size` bytes of body. A request is
+one frame ({"op": "obfuscate", "preset", "debug", "source", "progress",
+"size"} + source code, {"op": "rate_limit", "keys", "cost"},
+{"op": "verify", "split", "size"} + source code and output, or
+{"op": "summary"}); the daemon answers with any
+number of {"event": "queued", "position", "eta"} and {"event": "start",
+"estimate"} frames (only when progress is true) and then one
+{"event": "result", ..., "size"} frame carrying the output.
+
+When the daemon isn't reachable every call runs the pipeline in-process
+instead, so a front end started on its own still works.
+"""
+import json
+import socket
+import asyncio
+from config import Config
+from ratelimit import limiter
+from verify import verifier
+import service
+
+_warned = False
+
+
+class ProtocolError(Exception):
+    """The daemon sent something that isn't a frame"""
+
+
+def encode_frame(header, body=b''):
+    header = dict(header, size=len(body))
+    return json.dumps(header).encode() + b'\n' + body
+
+
+def _decode_header(line):
+    try:
+        header = json.loads(line)
+        size = int(header.get('size', 0))
+    except (ValueError, TypeError, AttributeError):
+        raise ProtocolError(f'bad frame header: {line[:200]!r}')
+    return header, size
+
+
+async def read_frame(reader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError('connection closed')
+    header, size = _decode_header(line)
+    body = await reader.readexactly(size) if size else b''
+    return header, body
+
+
+def read_frame_sync(stream):
+    line = stream.readline()
+    if not line:
+        raise ConnectionError('connection closed')
+    header, size = _decode_header(line)
+    body = stream.read(size) if size else b''
+    if len(body) != size:
+        raise ConnectionError('connection closed')
+    return header, body
+
+
+def _fallback(e):
+    global _warned
+    if not _warned:
+        _warned = True
+        print(f"Obfuscation daemon unavailable ({e}), running jobs in-process")
+
+
+def _result(header, body):
+    header.pop('event', None)
+    header.pop('size', None)
+    if header.get('success') and 'output' not in header:
+        header['output'] = body.decode(errors='replace')
+    return header
+
+
+async def obfuscate(code, preset='min', debug=False, source='bot', on_queue=None, on_start=None):
+    """Async obfuscation through the daemon; same arguments and result as service.run()"""
+    try:
+        reader, writer = await asyncio.open_unix_connection(Config.DAEMON_SOCKET)
+    except OSError as e:
+        _fallback(e)
+        return await service.run(code, preset, debug, source, on_queue, on_start)
+
+    try:
+        request = {
+            'op': 'obfuscate', 'preset': preset, 'debug': debug, 'source': source,
+            'progress': bool(on_queue or on_start),
+        }
+        writer.write(encode_frame(request, code.encode()))
+        await writer.drain()
+        while True:
+            header, body = await read_frame(reader)
+            event = header.get('event')
+            if event == 'queued' and on_queue:
+                await on_queue(header['position'], header['eta'])
+            elif event == 'start' and on_start:
+                await on_start(header['estimate'])
+            elif event == 'result':
+                return _result(header, body)
+    except (ConnectionError, asyncio.IncompleteReadError, ProtocolError) as e:
+        return {'success': False, 'error': f'Obfuscation daemon: {e}'}
+    finally:
+        writer.close()
+
+
+def _connect():
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(Config.OBFUSCATION_TIMEOUT + Config.QUEUE_WAIT_TIMEOUT + 30)
+    try:
+        sock.connect(Config.DAEMON_SOCKET)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def daemon_running():
+    """Whether the daemon answers on its socket"""
+    try:
+        _connect().close()
+    except OSError:
+        return False
+    return True
+
+
+def obfuscate_sync(code, preset='min', debug=False, source='web', on_queue=None, on_start=None):
+    """
+    Blocking version of obfuscate() for the threaded web server; the
+    callbacks are plain functions here.
+    """
+    try:
+        sock = _connect()
+    except OSError as e:
+        _fallback(e)
+
+        async def queued(position, eta):
+            on_queue(position, eta)
+
+        async def started(estimate):
+            on_start(estimate)
+
+        return asyncio.run(service.run(
+            code, preset, debug, source,
+            queued if on_queue else None,
+            started if on_start else None
+        ))
+
+    with sock, sock.makefile('rb') as stream:
+        try:
+            request = {
+                'op': 'obfuscate', 'preset': preset, 'debug': debug, 'source': source,
+                'progress': bool(on_queue or on_start),
+            }
+            sock.sendall(encode_frame(request, code.encode()))
+            while True:
+                header, body = read_frame_sync(stream)
+                event = header.get('event')
+                if event == 'queued' and on_queue:
+                    on_queue(header['position'], header['eta'])
+                elif event == 'start' and on_start:
+                    on_start(header['estimate'])
+                elif event == 'result':
+                    return _result(header, body)
+        except (OSError, ProtocolError) as e:
+            return {'success': False, 'error': f'Obfuscation daemon: {e}'}
+
+
+async def rate_limit(keys, cost=1):
+    """limiter.take() in the daemon, so every front end draws from the same buckets"""
+    try:
+        reader, writer = await asyncio.open_unix_connection(Config.DAEMON_SOCKET)
+    except OSError:
+        return limiter.take(keys, cost)
+    try:
+        writer.write(encode_frame({'op': 'rate_limit', 'keys': keys, 'cost': cost}))
+        await writer.drain()
+        header, _ = await read_frame(reader)
+        return header['allowed'], header['retry_after']
+    except (ConnectionError, asyncio.IncompleteReadError, ProtocolError, KeyError):
+        return limiter.take(keys, cost)
+    finally:
+        writer.close()
+
+
+def rate_limit_sync(keys, cost=1):
+    try:
+        sock = _connect()
+    except OSError:
+        return limiter.take(keys, cost)
+    with sock, sock.makefile('rb') as stream:
+        try:
+            sock.sendall(encode_frame({'op': 'rate_limit', 'keys': keys, 'cost': cost}))
+            header, _ = read_frame_sync(stream)
+            return header['allowed'], header['retry_after']
+        except (OSError, ProtocolError, KeyError):
+            return limiter.take(keys, cost)
+
+
+async def verify(code, output):
+    """verifier.verify() in the daemon, so every front end shares its verdicts and its limit"""
+    data = code.encode()
+    try:
+        reader, writer = await asyncio.open_unix_connection(Config.DAEMON_SOCKET)
+    except OSError:
+        return await verifier.verify_async(code, output)
+    try:
+        writer.write(encode_frame({'op': 'verify', 'split': len(data)}, data + output.encode()))
+        await writer.drain()
+        header, _ = await read_frame(reader)
+        return _result(header, b'')
+    except (ConnectionError, asyncio.IncompleteReadError, ProtocolError) as e:
+        return {'verdict': 'inconclusive', 'reason': f'Obfuscation daemon: {e}', 'seconds': 0, 'cached': False}
+    finally:
+        writer.close()
+
+
+def verify_sync(code, output):
+    data = code.encode()
+    try:
+        sock = _connect()
+    except OSError:
+        return verifier.verify(code, output)
+    with sock, sock.makefile('rb') as stream:
+        try:
+            sock.sendall(encode_frame({'op': 'verify', 'split': len(data)}, data + output.encode()))
+            header, _ = read_frame_sync(stream)
+            return _result(header, b'')
+        except (OSError, ProtocolError) as e:
+            return {'verdict': 'inconclusive', 'reason': f'Obfuscation daemon: {e}', 'seconds': 0, 'cached': False}
+
+
+async def summary():
+    """service.summary() of the daemon (or of this process without one)"""
+    # The local summary probes and lists directories: not on the event loop
+    try:
+        reader, writer = await asyncio.open_unix_connection(Config.DAEMON_SOCKET)
+    except OSError:
+        return dict(await asyncio.to_thread(service.summary), daemon=False)
+    try:
+        writer.write(encode_frame({'op': 'summary'}))
+        await writer.drain()
+        header, _ = await read_frame(reader)
+        return _result(header, b'')
+    except (ConnectionError, asyncio.IncompleteReadError, ProtocolError):
+        # The daemon went away mid-call
+        return dict(await asyncio.to_thread(service.summary), daemon=False)
+    finally:
+        writer.close()
+
+
+def summary_sync():
+    try:
+        sock = _connect()
+    except OSError:
+        return dict(service.summary(), daemon=False)
+    with sock, sock.makefile('rb') as stream:
+        try:
+            sock.sendall(encode_frame({'op': 'summary'}))
+            header, _ = read_frame_sync(stream)
+            return _result(header, b'')
+        except (OSError, ProtocolError):
+            return dict(service.summary(), daemon=False)
@@ -4,24 +4,135 @@ class Config:
     # Discord
     DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
     BOT_PREFIX = os.getenv('BOT_PREFIX', '!')
+    DEV_GUILD_ID = os.getenv('DEV_GUILD_ID')  # sync slash commands to this server only (development)
+    FORCE_COMMAND_SYNC = os.getenv('SYNC_COMMANDS') == '1'  # sync even when the commands look unchanged
     
     # Paths
-    HERCULES_PATH = '/app/hercules/src'
-    UPLOAD_FOLDER = '/app/uploads'
-    OUTPUT_FOLDER = '/app/outputs'
+    HERCULES_PATH = os.getenv('HERCULES_PATH', '/app/hercules/src')
+    UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', '/app/uploads')
+    WORK_FOLDER = os.path.join(UPLOAD_FOLDER, 'work')  # per-job workspaces
+    TMPFS_WORK_FOLDER = os.getenv('TMPFS_WORK_FOLDER', '/dev/shm/hercules-work')  # preferred when /dev/shm exists
+    OUTPUT_FOLDER = os.getenv('OUTPUT_FOLDER', '/app/outputs')
+    CACHE_FOLDER = os.path.join(OUTPUT_FOLDER, 'cache')
+    RUN_FOLDER = os.getenv('RUN_FOLDER', '/app/run')
+    QUEUE_FOLDER = os.path.join(RUN_FOLDER, 'queue')
+    JOBS_FOLDER = os.path.join(RUN_FOLDER, 'jobs')
+    METRICS_FOLDER = os.path.join(RUN_FOLDER, 'metrics')
+    DAEMON_SOCKET = os.path.join(RUN_FOLDER, 'hercules.sock')  # daemon.py, shared by server.py and bot.py
+    STATS_DB = os.path.join(RUN_FOLDER, 'stats.sqlite3')
     
     # Limits
     MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
     MAX_CODE_LENGTH = 500000
     OBFUSCATION_TIMEOUT = 300  # 5 minutes
-    COOLDOWN_SECONDS = 30
+    MAX_BATCH_FILES = 100
+    MAX_BATCH_BYTES = 20 * 1024 * 1024
+    
+    # Rate limits (ratelimit.py): token buckets per scope, (jobs per minute, burst); leave a scope out to not limit it
+    RATE_LIMITS = {
+        'user': (2, 4),  # Discord users
+        'guild': (30, 60),  # Discord servers
+        'ip': (6, 12),  # web clients
+    } if os.getenv('RATE_LIMIT', '1') != '0' else {}
+    # Tokens a job takes by preset ('custom': step lists); RATE_LIMIT_WEIGHTED=0 makes every job cost 1
+    RATE_LIMIT_COSTS = {'min': 1, 'mid': 2, 'max': 4, 'custom': 2} if os.getenv('RATE_LIMIT_WEIGHTED', '1') != '0' else {}
+    RATE_LIMIT_MAX_KEYS = 50000
+    # Behind a proxy (Render) the client address is the last X-Forwarded-For entry
+    TRUST_FORWARDED_FOR = os.getenv('TRUST_FORWARDED_FOR', '1' if os.getenv('RENDER') else '0') == '1'
+    
+    # Resource limits for every Hercules process (own process group, killed as a whole on timeout)
+    JOB_MEMORY_BYTES = int(os.getenv('JOB_MEMORY_MB', 1024)) * 1024 * 1024  # RLIMIT_AS
+    MAX_OUTPUT_BYTES = int(os.getenv('MAX_OUTPUT_MB', 64)) * 1024 * 1024  # RLIMIT_FSIZE and worker frame size
+    
+    # Result cache
+    CACHE_MEMORY_ENTRIES = int(os.getenv('CACHE_MEMORY_ENTRIES', 256))
+    CACHE_MEMORY_BYTES = int(os.getenv('CACHE_MEMORY_MB', 64)) * 1024 * 1024
+    CACHE_DISK_BYTES = int(os.getenv('CACHE_DISK_MB', 512)) * 1024 * 1024
+    
+    # Warm worker pool (lua/hercules_worker.lua, copied next to hercules.lua)
+    WORKER_SCRIPT = 'hercules_worker.lua'
+    WORKER_POOL_SIZE = int(os.getenv('WORKER_POOL_SIZE', 2))
+    WORKER_MAX_JOBS = int(os.getenv('WORKER_MAX_JOBS', 200))
+    WORKER_MAX_RSS_GROWTH = int(os.getenv('WORKER_MAX_RSS_GROWTH_MB', 256)) * 1024 * 1024
+    WORKER_START_TIMEOUT = 15
+    PIPE_SCRIPT = 'hercules_pipe.lua'  # one-shot stdin/stdout mode
+    LUA_CANDIDATES = ['lua', 'lua5.4', 'lua54']  # probed once at startup, first working one wins
+    
+    # Pre-flight syntax check (preflight.py, lua/hercules_syntax.lua): code neither Lua nor Hercules can parse never reaches the queue
+    SYNTAX_CHECK = os.getenv('SYNTAX_CHECK', '1') != '0'
+    SYNTAX_SCRIPT = 'hercules_syntax.lua'
+    SYNTAX_CHECKERS = int(os.getenv('SYNTAX_CHECKERS', 2))
+    SYNTAX_CHECK_TIMEOUT = 5
+    SYNTAX_CACHE_ENTRIES = 4096
+    
+    # Behavioural verification of results (verify.py, lua/hercules_verify.lua), after delivery
+    VERIFY_OUTPUT = os.getenv('VERIFY_OUTPUT', '1') != '0'
+    VERIFY_SCRIPT = 'hercules_verify.lua'
+    VERIFY_TIMEOUT = 10
+    VERIFY_INSTRUCTIONS = 10_000_000  # the original's budget; more and the verdict is inconclusive
+    VERIFY_SLOWDOWN = 100  # the obfuscated chunk may use this many instructions per one of the original's
+    VERIFY_CONCURRENCY = int(os.getenv('VERIFY_CONCURRENCY', 1))
+    VERIFY_MAX_PENDING = 20
+    VERIFY_CACHE_ENTRIES = 4096
+    
+    # Job queue shared by all processes (0 = size from the cgroup CPU quota)
+    MAX_CONCURRENT_JOBS = int(os.getenv('MAX_CONCURRENT_JOBS', 0))
+    MAX_QUEUE_DEPTH = int(os.getenv('MAX_QUEUE_DEPTH', 20))
+    QUEUE_WAIT_TIMEOUT = 240
+    QUEUE_DEFAULT_JOB_SECONDS = 5.0
+    JOB_TTL = 3600  # async job records and results
+    
+    # Split mode: large files obfuscated as several parts in parallel on idle queue slots (chunking.py)
+    SPLIT_ENABLED = os.getenv('SPLIT_MODE', '1') != '0'
+    SPLIT_PRESETS = ['min', 'mid']  # max is dominated by whole-file steps (the VM)
+    SPLIT_MIN_BYTES = int(os.getenv('SPLIT_MIN_KB', 64)) * 1024
+    SPLIT_MAX_PARTS = int(os.getenv('SPLIT_MAX_PARTS', 0))  # 0 = up to every queue slot
+    
+    # Cost model (per-job timeouts and ETAs learned from recorded runs)
+    COST_HISTORY_SIZE = 500  # runs kept per pipeline (preset or step list)
+    COST_MIN_SAMPLES = 10  # until then jobs get OBFUSCATION_TIMEOUT and nothing is rejected
+    MIN_JOB_TIMEOUT = 10
+    TIMEOUT_MARGIN = 3.0  # timeout = predicted upper bound * margin, capped at OBFUSCATION_TIMEOUT
+    
+    # Metrics (each process writes its own snapshot, /metrics adds them up)
+    METRICS_FLUSH_SECONDS = 5
+    
+    # Background self-test (selftest.py) behind /api/test, /test and /health
+    SELF_TEST_INTERVAL = int(os.getenv('SELF_TEST_INTERVAL', 300))
+    SELF_TEST_MAX_AGE = 3 * SELF_TEST_INTERVAL  # older results count as stale
+    
+    # Persistent job stats (stats.py): one-minute rows, written in batches
+    STATS_RETENTION_DAYS = 30
+    STATS_FLUSH_SECONDS = 10
     
     # Web
     WEB_PORT = int(os.getenv('PORT', 10000))
+    PUBLIC_URL = os.getenv('PUBLIC_URL', os.getenv('RENDER_EXTERNAL_URL', '')).rstrip('/')  # for result links
+    
+    # Delivery of results
+    COMPRESSION_LEVEL = 6
+    MIN_COMPRESS_BYTES = 1024  # smaller results are sent as-is
+    DISCORD_UPLOAD_LIMIT = int(os.getenv('DISCORD_UPLOAD_MB', 25)) * 1024 * 1024  # when the guild doesn't say
     
     # Admin
     ADMIN_IDS = [x.strip() for x in os.getenv('ADMIN_IDS', '').split(',') if x.strip()]
     
+    # Every Hercules step in the order pipelines run them, with its hercules.lua flag (None: no flag)
+    STEPS = {
+        'string_to_expressions': '--ST',
+        'string_encoding': '--SE',
+        'control_flow': '--CF',
+        'variable_renaming': '--VR',
+        'garbage_code': '--GC',
+        'opaque_predicates': '--OP',
+        'function_inlining': '--FI',
+        'compressor': '--CP',
+        'wrap_in_function': '--WIF',
+        'virtual_machine': '--VM',
+        'antitamper': '--AT',
+        'watermark': None,  # last, so the watermark survives the other steps
+    }
+    
     # Obfuscation Presets
     PRESETS = {
         'min': {
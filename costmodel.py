@@ -0,0 +1,222 @@
+import os
+import re
+import json
+import time
+import threading
+from config import Config
+
+# Lua strings, names, numbers and single-character operators; close enough to
+# the real token stream to predict how much work the obfuscation passes get
+TOKEN = re.compile(r'"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'|[A-Za-z_]\w*|\d[\w.]*|\S')
+
+
+def count_tokens(code):
+    return sum(1 for _ in TOKEN.finditer(code))
+
+
+class JobTooLarge(Exception):
+    """Raised when a job is predicted to run longer than OBFUSCATION_TIMEOUT"""
+
+    def __init__(self, message, estimate):
+        super().__init__(message)
+        self.estimate = estimate
+
+
+def _solve(a, b):
+    """Solve the small linear system a x = b by Gaussian elimination"""
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        if abs(m[pivot][col]) < 1e-12:
+            return None
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(n):
+            if r != col:
+                f = m[r][col] / m[col][col]
+                m[r] = [x - f * y for x, y in zip(m[r], m[col])]
+    return [m[i][n] / m[i][i] for i in range(n)]
+
+
+def _features(size, tokens):
+    return [1.0, size / 1024, tokens / 1000]
+
+
+def _fit(samples):
+    """
+    Least squares fit of seconds ~ 1 + KB + thousands of tokens (slightly
+    ridge-regularised, since size and token count move together).
+    Returns (coefficients, residual standard deviation).
+    """
+    xtx = [[0.0] * 3 for _ in range(3)]
+    xty = [0.0] * 3
+    for size, tokens, seconds in samples:
+        x = _features(size, tokens)
+        for i in range(3):
+            xty[i] += x[i] * seconds
+            for j in range(3):
+                xtx[i][j] += x[i] * x[j]
+    for i in (1, 2):
+        xtx[i][i] += 1e-3 * len(samples)
+    coef = _solve(xtx, xty)
+    if coef is None:
+        return None
+
+    def predict(size, tokens):
+        return sum(c * x for c, x in zip(coef, _features(size, tokens)))
+
+    residuals = [seconds - predict(size, tokens) for size, tokens, seconds in samples]
+    sigma = (sum(r * r for r in residuals) / max(1, len(samples) - 3)) ** 0.5
+    return coef, sigma
+
+
+class CostModel:
+    """
+    Predicts the wall time of a job from its size, token count and pipeline
+    (one model per preset and per step list, named as pipelines names them),
+    trained on the runs recorded in a history file shared by every process.
+    Used for per-job timeouts, rejecting jobs that could never finish and ETAs.
+    """
+
+    REFIT_INTERVAL = 5
+
+    def __init__(self, path, history_size, min_samples):
+        self.path = path
+        self.history_size = history_size
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._models = {}
+        self._checked = 0
+        self._stamp = None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def record(self, preset, code, seconds, tokens=None):
+        """Append one finished run; short appends to an O_APPEND file don't interleave"""
+        sample = {
+            'preset': preset,
+            'size': len(code),
+            'tokens': count_tokens(code) if tokens is None else tokens,
+            'seconds': round(seconds, 4),
+        }
+        try:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(sample) + '\n')
+        except OSError:
+            pass
+
+    def _load(self):
+        """Read the history and keep the newest history_size samples per preset"""
+        samples = {}
+        lines = 0
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        s = json.loads(line)
+                        samples.setdefault(s['preset'], []).append((s['size'], s['tokens'], s['seconds']))
+                    except (ValueError, KeyError):
+                        continue
+        except OSError:
+            return {}
+        samples = {preset: runs[-self.history_size:] for preset, runs in samples.items()}
+        if lines > 2 * self.history_size * max(1, len(samples)):
+            self._compact(samples)
+        return samples
+
+    def _compact(self, samples):
+        # A run recorded by another process while this rewrite happens is lost, which is fine for a sample
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                for preset, runs in samples.items():
+                    for size, tokens, seconds in runs:
+                        f.write(json.dumps({'preset': preset, 'size': size, 'tokens': tokens, 'seconds': seconds}) + '\n')
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def _refresh(self):
+        now = time.time()
+        if now - self._checked < self.REFIT_INTERVAL:
+            return
+        self._checked = now
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_mtime, st.st_size)
+        except OSError:
+            stamp = None
+        if stamp == self._stamp:
+            return
+        models = {}
+        for preset, runs in self._load().items():
+            if len(runs) >= self.min_samples:
+                fit = _fit(runs)
+                if fit:
+                    models[preset] = fit + (len(runs),)
+        self._models = models
+        self._stamp = stamp
+
+    def estimate(self, code, preset):
+        """
+        Predicted seconds, the timeout to run the job with and whether the
+        prediction comes from recorded history or the untrained default.
+        """
+        with self._lock:
+            self._refresh()
+            model = self._models.get(preset)
+        tokens = count_tokens(code)
+
+        if not model:
+            return {
+                'seconds': Config.QUEUE_DEFAULT_JOB_SECONDS,
+                'timeout': Config.OBFUSCATION_TIMEOUT,
+                'tokens': tokens,
+                'trained': False,
+                'samples': 0,
+            }
+
+        coef, sigma, count = model
+        seconds = max(0.05, sum(c * x for c, x in zip(coef, _features(len(code), tokens))))
+        upper = seconds + 3 * sigma
+        timeout = min(Config.OBFUSCATION_TIMEOUT, max(Config.MIN_JOB_TIMEOUT, upper * Config.TIMEOUT_MARGIN))
+        return {
+            'seconds': round(seconds, 2),
+            'timeout': round(timeout, 1),
+            'tokens': tokens,
+            'trained': True,
+            'samples': count,
+        }
+
+    def admit(self, code, preset):
+        """Estimate a job, raising JobTooLarge if it should not be started at all"""
+        estimate = self.estimate(code, preset)
+        if estimate['trained'] and estimate['seconds'] > Config.OBFUSCATION_TIMEOUT:
+            raise JobTooLarge(
+                f"Estimated {estimate['seconds']:.0f}s with preset '{preset}', over the "
+                f"{Config.OBFUSCATION_TIMEOUT}s limit. Try a lighter preset or split the file",
+                estimate
+            )
+        return estimate
+
+    def summary(self):
+        with self._lock:
+            self._refresh()
+            models = dict(self._models)
+        return {
+            preset: {
+                'samples': count,
+                'base_seconds': round(coef[0], 3),
+                'seconds_per_kb': round(coef[1], 4),
+                'seconds_per_ktoken': round(coef[2], 4),
+                'sigma': round(sigma, 3),
+            }
+            for preset, (coef, sigma, count) in models.items()
+        }
+
+
+cost_model = CostModel(
+    os.path.join(Config.RUN_FOLDER, 'cost_history.jsonl'),
+    Config.COST_HISTORY_SIZE,
+    Config.COST_MIN_SAMPLES,
+)
@@ -0,0 +1,133 @@
+"""
+Node-local obfuscation daemon.
+
+The one process on the node that schedules, caches and runs obfuscation jobs
+and owns the warm worker pool; server.py and bot.py talk to it through
+client.py over a Unix socket. Run it with `python3 daemon.py` before the
+front ends (start.sh does).
+"""
+import os
+import asyncio
+import socket
+from config import Config
+from client import encode_frame, read_frame, ProtocolError
+from workers import pool
+from preflight import checker
+from workspace import start_janitor
+from probe import capabilities
+from ratelimit import limiter
+from verify import verifier
+import service
+import selftest
+import metrics
+
+
+async def send(writer, header, body=b''):
+    writer.write(encode_frame(header, body))
+    await writer.drain()
+
+
+async def handle(reader, writer):
+    try:
+        header, body = await read_frame(reader)
+        op = header.get('op')
+        if op == 'obfuscate':
+            # Progress frames only for clients that asked; with hundreds waiting every job start moves them all
+            progress = header.get('progress', True)
+
+            async def on_queue(position, eta):
+                await send(writer, {'event': 'queued', 'position': position, 'eta': eta})
+
+            async def on_start(estimate):
+                await send(writer, {'event': 'start', 'estimate': estimate})
+
+            async def client_gone():
+                # Clients send nothing more: anything read now is the EOF of one that went away
+                try:
+                    await reader.read(1)
+                except ConnectionError:
+                    pass
+
+            job = asyncio.create_task(service.run(
+                body.decode('utf-8', errors='replace'),
+                header.get('preset', 'min'),
+                bool(header.get('debug')),
+                header.get('source', 'web'),
+                on_queue if progress else None,
+                on_start if progress else None
+            ))
+            gone = asyncio.create_task(client_gone())
+            await asyncio.wait({job, gone}, return_when=asyncio.FIRST_COMPLETED)
+            if not job.done():
+                job.cancel()
+                await asyncio.wait({job})
+                return
+            gone.cancel()
+            result = job.result()
+            output = result.pop('output', None)
+            await send(writer, dict(result, event='result'), output.encode() if output is not None else b'')
+        elif op == 'rate_limit':
+            allowed, retry_after = limiter.take(list(header.get('keys', [])), header.get('cost', 1))
+            await send(writer, {'event': 'result', 'allowed': allowed, 'retry_after': retry_after})
+        elif op == 'verify':
+            split = int(header.get('split', 0))
+            result = await verifier.verify_async(body[:split].decode(errors='replace'), body[split:].decode(errors='replace'))
+            await send(writer, dict(result, event='result'))
+        elif op == 'summary':
+            summary = await asyncio.to_thread(service.summary)
+            await send(writer, dict(summary, event='result', daemon=True, pid=os.getpid()))
+        else:
+            await send(writer, {'event': 'result', 'success': False, 'error': f'Unknown op: {op}'})
+    except (ConnectionError, asyncio.IncompleteReadError, ProtocolError):
+        # Client went away (a cancelled command, a closed browser tab) while we were writing to it
+        pass
+    finally:
+        writer.close()
+
+
+def claim_socket(path):
+    """Remove a stale socket file, refusing to start if another daemon answers on it"""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+    raise SystemExit(f"Another daemon is already listening on {path}")
+
+
+async def main():
+    os.makedirs(os.path.dirname(Config.DAEMON_SOCKET), exist_ok=True)
+    claim_socket(Config.DAEMON_SOCKET)
+
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, capabilities)
+    loop.run_in_executor(None, pool.warm)
+    if Config.SYNTAX_CHECK:
+        loop.run_in_executor(None, checker.pool.warm)
+    start_janitor()
+    metrics.registry.start_flusher()
+    selftest.start_prober()
+
+    # Every pending web request holds a connection; don't refuse bursts of them
+    server = await asyncio.start_unix_server(handle, path=Config.DAEMON_SOCKET, backlog=1024)
+    os.chmod(Config.DAEMON_SOCKET, 0o660)
+    print(f"Obfuscation daemon listening on {Config.DAEMON_SOCKET}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        pool.shutdown()
+        checker.pool.shutdown()
+        try:
+            os.remove(Config.DAEMON_SOCKET)
+        except OSError:
+            pass
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
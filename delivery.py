@@ -0,0 +1,65 @@
+import io
+import zlib
+import zipfile
+from config import Config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CHUNK_SIZE = 64 * 1024
+
+
+def negotiate(accept_encoding):
+    """Best content coding the client accepts: 'br', 'gzip' or None"""
+    offered = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            offered[name] = q
+    for coding in (('br', 'gzip') if brotli else ('gzip',)):
+        if offered.get(coding, offered.get('*', 0)) > 0:
+            return coding
+    return None
+
+
+def _compressor(encoding):
+    if encoding == 'br':
+        # Quality 5 is close to gzip's speed with noticeably smaller output
+        c = brotli.Compressor(quality=5)
+        return c.process, c.finish
+    c = zlib.compressobj(Config.COMPRESSION_LEVEL, zlib.DEFLATED, 31)
+    return c.compress, c.flush
+
+
+def compress_file(path, encoding):
+    """Yield a file compressed with `encoding` chunk by chunk, never holding all of it"""
+    compress, finish = _compressor(encoding)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            data = compress(chunk)
+            if data:
+                yield data
+    yield finish()
+
+
+def zip_output(data, name='obfuscated.lua'):
+    """A single-file zip of an output, for uploads that don't fit as plain text"""
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as archive:
+        archive.writestr(name, data)
+    out.seek(0)
+    return out
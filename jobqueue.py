@@ -0,0 +1,330 @@
+import os
+import fcntl
+import asyncio
+import threading
+import time
+import uuid
+from config import Config
+
+
+def cgroup_cpu_limit():
+    """CPUs available to this container, from the cgroup quota when there is one"""
+    quota = None
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            q, p = f.read().split()[:2]
+            if q != 'max':
+                quota = int(q) / int(p)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+                q = int(f.read())
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+                p = int(f.read())
+            if q > 0 and p > 0:
+                quota = q / p
+        except (OSError, ValueError):
+            pass
+
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = os.cpu_count() or 1
+    if quota:
+        cpus = min(cpus, quota)
+    return max(1, int(cpus))
+
+
+class QueueFull(Exception):
+    """Raised when the queue is at MAX_QUEUE_DEPTH (or the wait timed out)"""
+
+    def __init__(self, message, retry_after=0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Slot:
+    """A held concurrency slot; the flock is dropped by the kernel if we die"""
+
+    def __init__(self, queue, fd, index, waited, record=True):
+        self.queue = queue
+        self.fd = fd
+        self.index = index
+        self.waited = waited
+        self.record = record
+        self.start = time.time()
+
+    def release(self):
+        if self.fd is None:
+            return
+        if self.record:
+            self.queue._record(time.time() - self.start)
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        self.fd = None
+        self.queue._notify()
+
+
+class Ticket:
+    """A place in the queue, ordered by creation time across all processes"""
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.name = f'{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.path = os.path.join(queue.tickets_dir, self.name)
+        self.created = time.time()
+        with open(self.path, 'w'):
+            pass
+
+    def position(self):
+        """0-based position among waiting jobs"""
+        # Waiters in one process share a listing per poll; a ticket missing from it is newer than the listing
+        for max_age in (self.queue.POLL_INTERVAL / 2, 0):
+            try:
+                return self.queue._tickets(max_age).index(self.name)
+            except ValueError:
+                pass
+        return 0
+
+    def eta(self, position=None):
+        if position is None:
+            position = self.position()
+        return self.queue.eta(position)
+
+    def cancel(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+        self.queue._listed_at = 0
+
+    def try_acquire(self):
+        position = self.position()
+        if position >= self.queue.concurrency:
+            return None, position
+        for index in range(self.queue.concurrency):
+            fd = self.queue._try_lock(index)
+            if fd is not None:
+                self.cancel()
+                return Slot(self.queue, fd, index, time.time() - self.created), position
+        return None, position
+
+
+class JobQueue:
+    """
+    Bounded FIFO queue with a fixed number of concurrency slots, shared by
+    every process on the node (gunicorn workers and the bot) through files
+    in QUEUE_FOLDER. Slots are flock()ed files, waiting jobs are ticket files.
+    Waiters poll; a slot freed in this process also wakes the waiters here
+    that are now at the head of the queue.
+    """
+
+    POLL_INTERVAL = 0.1
+    MAX_POLL_INTERVAL = 1.0  # for waiters far back in the queue
+
+    def __init__(self, directory, concurrency, max_depth):
+        self.directory = directory
+        self.tickets_dir = os.path.join(directory, 'tickets')
+        self.concurrency = concurrency
+        self.max_depth = max_depth
+        self._listing = []
+        self._listed_at = 0
+        self._waiting = {}  # ticket name -> wake-up callable, for waiters in this process
+        os.makedirs(self.tickets_dir, exist_ok=True)
+
+    def _slot_path(self, index):
+        return os.path.join(self.directory, f'slot-{index}.lock')
+
+    def _try_lock(self, index):
+        fd = os.open(self._slot_path(index), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except OSError:
+            os.close(fd)
+            return None
+
+    def _tickets(self, max_age=0):
+        """Live tickets in queue order; max_age allows reusing a listing that recent"""
+        if max_age and time.monotonic() - self._listed_at < max_age:
+            return self._listing
+        listed_at = time.monotonic()
+        try:
+            names = sorted(os.listdir(self.tickets_dir))
+        except OSError:
+            return []
+        alive = []
+        for name in names:
+            try:
+                pid = int(name.split('-')[1])
+            except (IndexError, ValueError):
+                pid = None
+            # Tickets left behind by a crashed process would block the queue forever
+            if pid is not None and not _pid_alive(pid):
+                try:
+                    os.remove(os.path.join(self.tickets_dir, name))
+                except OSError:
+                    pass
+                continue
+            alive.append(name)
+        self._listing, self._listed_at = alive, listed_at
+        return alive
+
+    def _poll_interval(self, position):
+        return min(self.MAX_POLL_INTERVAL, self.POLL_INTERVAL * (1 + position // self.concurrency))
+
+    def _notify(self):
+        """A slot was freed: wake whoever can take it now instead of at their next poll"""
+        self._listed_at = 0
+        for name in self._tickets()[:self.concurrency]:
+            wake = self._waiting.get(name)
+            if wake:
+                wake()
+
+    def _avg_path(self):
+        return os.path.join(self.directory, 'avg_seconds')
+
+    def average_job_seconds(self):
+        try:
+            with open(self._avg_path()) as f:
+                return float(f.read())
+        except (OSError, ValueError):
+            return Config.QUEUE_DEFAULT_JOB_SECONDS
+
+    def _record(self, seconds):
+        """Fold a finished job into the shared moving average"""
+        avg = self.average_job_seconds() * 0.8 + seconds * 0.2
+        tmp = f'{self._avg_path()}.{os.getpid()}.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                f.write(f'{avg:.3f}')
+            os.replace(tmp, self._avg_path())
+        except OSError:
+            pass
+
+    def depth(self):
+        return len(self._tickets())
+
+    def running(self):
+        busy = 0
+        for index in range(self.concurrency):
+            fd = self._try_lock(index)
+            if fd is None:
+                busy += 1
+            else:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+        return busy
+
+    def eta(self, position):
+        """Seconds until a job at this queue position should start"""
+        return (position // self.concurrency + 1) * self.average_job_seconds()
+
+    def take_idle(self, count):
+        """
+        Up to count more slots for a running job that can use them (split
+        mode), taken only while nobody is waiting. Not counted in the
+        average job time.
+        """
+        slots = []
+        if count <= 0 or self._tickets():
+            return slots
+        for index in range(self.concurrency):
+            if len(slots) >= count:
+                break
+            fd = self._try_lock(index)
+            if fd is not None:
+                slots.append(Slot(self, fd, index, 0, record=False))
+        return slots
+
+    def enter(self):
+        ticket = Ticket(self)
+        position = ticket.position()
+        if position >= self.max_depth:
+            ticket.cancel()
+            raise QueueFull('Server busy', int(self.eta(position)))
+        return ticket
+
+    def wait(self, ticket, timeout=None, on_update=None):
+        """
+        Block until the ticket gets a slot.
+        on_update(position, eta) is called whenever the position changes.
+        """
+        deadline = time.time() + (timeout or Config.QUEUE_WAIT_TIMEOUT)
+        last = None
+        woken = threading.Event()
+        self._waiting[ticket.name] = woken.set
+        try:
+            while True:
+                slot, position = ticket.try_acquire()
+                if slot:
+                    return slot
+                if time.time() > deadline:
+                    raise QueueFull('Timed out waiting in queue', int(self.eta(position)))
+                if on_update and position != last:
+                    last = position
+                    on_update(position, self.eta(position))
+                woken.wait(self._poll_interval(position))
+                woken.clear()
+        finally:
+            self._waiting.pop(ticket.name, None)
+            ticket.cancel()
+
+    async def wait_async(self, ticket, on_update=None, timeout=None):
+        """
+        Await a slot without blocking the event loop.
+        on_update(position, eta) is awaited whenever the position changes.
+        """
+        deadline = time.time() + (timeout or Config.QUEUE_WAIT_TIMEOUT)
+        last = None
+        loop = asyncio.get_running_loop()
+        woken = asyncio.Event()
+        self._waiting[ticket.name] = lambda: loop.call_soon_threadsafe(woken.set)
+        try:
+            while True:
+                slot, position = ticket.try_acquire()
+                if slot:
+                    return slot
+                if time.time() > deadline:
+                    raise QueueFull('Timed out waiting in queue', int(self.eta(position)))
+                if on_update and position != last:
+                    last = position
+                    await on_update(position, self.eta(position))
+                try:
+                    await asyncio.wait_for(woken.wait(), self._poll_interval(position))
+                except asyncio.TimeoutError:
+                    pass
+                woken.clear()
+        finally:
+            self._waiting.pop(ticket.name, None)
+            ticket.cancel()
+
+    def summary(self):
+        depth = self.depth()
+        return {
+            'concurrency': self.concurrency,
+            'running': self.running(),
+            'queued': depth,
+            'max_depth': self.max_depth,
+            'avg_job_seconds': round(self.average_job_seconds(), 2),
+            'eta_seconds': round(self.eta(depth), 1),
+        }
+
+
+job_queue = JobQueue(
+    Config.QUEUE_FOLDER,
+    Config.MAX_CONCURRENT_JOBS or cgroup_cpu_limit(),
+    Config.MAX_QUEUE_DEPTH,
+)
@@ -0,0 +1,330 @@
+import os
+import json
+import time
+import shutil
+import uuid
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from jobqueue import job_queue, QueueFull
+from costmodel import JobTooLarge
+from preflight import InvalidCode
+from cache import cache
+
+FINISHED = ('done', 'failed')
+
+
+class JobStore:
+    """
+    Job records and results on disk, so any gunicorn worker can answer
+    status and result requests for a job started by another one.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id, ext):
+        return os.path.join(self.directory, f'{job_id}.{ext}')
+
+    def _write(self, path, text):
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def get(self, job_id):
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id, 'json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, job):
+        job['updated'] = time.time()
+        self._write(self._path(job['id'], 'json'), json.dumps(job))
+
+    def save_result(self, job_id, output):
+        self._write(self._path(job_id, 'lua'), output)
+
+    def link_result(self, job_id, source):
+        """Use an existing file (a cache entry) as the result without copying it"""
+        path = self._path(job_id, 'lua')
+        try:
+            os.link(source, path)
+        except OSError:
+            shutil.copyfile(source, path)
+
+    def result_path(self, job_id):
+        return self._path(job_id, 'lua')
+
+    def add(self, preset, original_size, output=None, source=None, **fields):
+        """
+        Record an already finished result as a done job so it can be downloaded
+        from /api/jobs/<id>/result. Pass the output text or a file to link.
+        """
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': 'done',
+            'preset': preset,
+            'created': time.time(),
+            'original_size': original_size,
+            'debug_requested': False,
+        }
+        job.update(fields)
+        if source is not None:
+            self.link_result(job['id'], source)
+        else:
+            self.save_result(job['id'], output)
+        self.save(job)
+        return job
+
+    def expire(self, ttl):
+        """Remove jobs last touched more than ttl seconds ago"""
+        cutoff = time.time() - ttl
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+class JobManager:
+    """
+    Runs submitted jobs on background threads so request threads return at once.
+    run(code, preset, debug, on_queue, on_start) does the actual obfuscation
+    (client.obfuscate_sync) and returns a service.run() result; asyncio front
+    ends pass run_async (client.obfuscate) and use submit_async() instead.
+    verify(code, output) (client.verify_sync) checks finished outputs.
+    """
+
+    def __init__(self, store, run=None, run_async=None, verify=None):
+        self.store = store
+        self.run = run
+        self.run_async = run_async
+        self.verify = verify
+        self.tasks = set()
+        # Threads for blocking runs; asyncio front ends run jobs as tasks and need none
+        self.executor = ThreadPoolExecutor(
+            max_workers=job_queue.concurrency + Config.MAX_QUEUE_DEPTH,
+            thread_name_prefix='job'
+        ) if run else None
+        # Waiting on verdicts must never take threads jobs need
+        self.verifications = ThreadPoolExecutor(max_workers=Config.VERIFY_MAX_PENDING, thread_name_prefix='verify')
+        threading.Thread(target=self._janitor, daemon=True).start()
+
+    def _janitor(self):
+        while True:
+            self.store.expire(Config.JOB_TTL)
+            time.sleep(300)
+
+    def _new(self, preset, code, show_debug):
+        return {
+            'id': uuid.uuid4().hex,
+            'status': 'queued',
+            'preset': preset,
+            'created': time.time(),
+            'original_size': len(code),
+            'debug_requested': bool(show_debug),
+        }
+
+    def _finish(self, job, result):
+        if result['success']:
+            source = cache.file(result['key']) if result.get('key') else None
+            if source:
+                self.store.link_result(job['id'], source)
+            else:
+                self.store.save_result(job['id'], result['output'])
+            job.update(
+                status='done',
+                time_taken=result['time'],
+                obfuscated_size=result['obfuscated'],
+                cached=result.get('cached', False),
+                coalesced=result.get('coalesced', False),
+            )
+            if result.get('queue_wait') is not None:
+                job['queue_wait'] = f"{result['queue_wait']:.2f}s"
+        else:
+            job.update(status='failed', error=result['error'])
+        job.pop('position', None)
+        job.pop('eta', None)
+        if job['debug_requested']:
+            job['debug'] = result.get('debug')
+        self.store.save(job)
+
+    def _queued(self, job, position, eta):
+        job.update(position=position, eta=eta)
+        self.store.save(job)
+
+    def _started(self, job, estimate):
+        job.pop('position', None)
+        job.pop('eta', None)
+        job.update(
+            status='running',
+            started=time.time(),
+            estimate=estimate['seconds'] if estimate['trained'] else None,
+        )
+        self.store.save(job)
+
+    def _accept(self, job, result):
+        """Handle a result that came back before the job was ever queued or started"""
+        if result.get('busy'):
+            raise QueueFull(result['error'], result['retry_after'])
+        if result.get('too_large'):
+            raise JobTooLarge(result['error'], {'seconds': result['estimate']})
+        if result.get('invalid'):
+            raise InvalidCode(result['error'], result['line'], result['column'])
+        self._finish(job, result)
+        return job
+
+    def verify_later(self, job_id, code, output):
+        """
+        Verify a finished job's output in the background: its record gets
+        verification {'verdict': 'pending'} now and the verdict once it is in.
+        Returns the pending value.
+        """
+        job = self.store.get(job_id)
+        if job is None or self.verify is None:
+            return None
+        job['verification'] = {'verdict': 'pending'}
+        self.store.save(job)
+
+        def check():
+            try:
+                verdict = self.verify(code, output)
+            except Exception as e:
+                verdict = {'verdict': 'inconclusive', 'reason': str(e)}
+            job['verification'] = verdict
+            self.store.save(job)
+
+        self.verifications.submit(check)
+        return job['verification']
+
+    def _verify_if(self, verify, job, code, result):
+        if verify and self.verify and result['success']:
+            job['verification'] = self.verify_later(job['id'], code, result['output'])
+
+    def submit(self, code, preset, show_debug=False, verify=False):
+        """
+        Start a job and return its record as soon as it is queued, running or
+        finished (a cache hit). Raises QueueFull when there is no room,
+        JobTooLarge when it is predicted to run past the limit and InvalidCode
+        when it doesn't compile. With verify the output is verified once the
+        job is done (see verify_later()).
+        """
+        job = self._new(preset, code, show_debug)
+        accepted = threading.Event()
+        early = {}
+
+        def on_queue(position, eta):
+            self._queued(job, position, eta)
+            accepted.set()
+
+        def on_start(estimate):
+            self._started(job, estimate)
+            accepted.set()
+
+        def execute():
+            try:
+                result = self.run(code, preset, show_debug, on_queue, on_start)
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+            if not accepted.is_set():
+                # Turned away or answered from the cache: submit() deals with it
+                early['result'] = result
+                accepted.set()
+                return
+            self._finish(job, result)
+            self._verify_if(verify, job, code, result)
+
+        self.executor.submit(execute)
+        accepted.wait()
+
+        result = early.get('result')
+        if result is None:
+            # The job thread keeps updating its own copy
+            return dict(job)
+        self._accept(job, result)
+        self._verify_if(verify, job, code, result)
+        return job
+
+    async def submit_async(self, code, preset, show_debug=False, verify=False):
+        """submit() for an event loop: the job runs as a task, job files are written off the loop"""
+        job = self._new(preset, code, show_debug)
+        accepted = asyncio.Event()
+        early = {}
+
+        async def on_queue(position, eta):
+            await asyncio.to_thread(self._queued, job, position, eta)
+            accepted.set()
+
+        async def on_start(estimate):
+            await asyncio.to_thread(self._started, job, estimate)
+            accepted.set()
+
+        async def execute():
+            try:
+                result = await self.run_async(code, preset, show_debug, on_queue, on_start)
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+            if not accepted.is_set():
+                early['result'] = result
+                accepted.set()
+                return
+            await asyncio.to_thread(self._finish, job, result)
+            await asyncio.to_thread(self._verify_if, verify, job, code, result)
+
+        # Keep a reference, the loop only holds tasks weakly
+        task = asyncio.create_task(execute())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        await accepted.wait()
+
+        result = early.get('result')
+        if result is None:
+            return dict(job)
+        await asyncio.to_thread(self._accept, job, result)
+        await asyncio.to_thread(self._verify_if, verify, job, code, result)
+        return job
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def events(self, job_id, poll=0.5):
+        """Yield the job record every time it changes, until it finishes"""
+        last = None
+        deadline = time.time() + Config.OBFUSCATION_TIMEOUT + Config.QUEUE_WAIT_TIMEOUT
+        while time.time() < deadline:
+            job = self.store.get(job_id)
+            if job is None:
+                return
+            if job.get('updated') != last:
+                last = job.get('updated')
+                yield job
+            if job['status'] in FINISHED:
+                return
+            time.sleep(poll)
+
+    async def events_async(self, job_id, poll=0.5):
+        """events() without blocking the event loop"""
+        last = None
+        deadline = time.time() + Config.OBFUSCATION_TIMEOUT + Config.QUEUE_WAIT_TIMEOUT
+        while time.time() < deadline:
+            job = await asyncio.to_thread(self.store.get, job_id)
+            if job is None:
+                return
+            if job.get('updated') != last:
+                last = job.get('updated')
+                yield job
+            if job['status'] in FINISHED:
+                return
+            await asyncio.sleep(poll)
@@ -0,0 +1,22 @@
+--[[
+    One-shot Hercules filter: source on stdin, obfuscated code on stdout,
+    diagnostics on stderr. Steps are passed as "step,step,..." in arg[1].
+
+    Exit codes: 0 success, 1 obfuscation failed, 2 Hercules could not be loaded.
+]]
+
+local shim = require("hercules_shim")
+
+local ok, err = shim.load()
+if not ok then
+    io.stderr:write("hercules_pipe: cannot load pipeline: ", err, "\n")
+    os.exit(2)
+end
+
+local code = io.stdin:read("a") or ""
+local output, job_err = shim.obfuscate(code, arg[1] or "")
+if not output then
+    io.stderr:write(job_err, "\n")
+    os.exit(1)
+end
+shim.write(output)
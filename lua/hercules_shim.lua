@@ -0,0 +1,88 @@
+--[[
+    Hercules in-process entry point.
+    Loads the Hercules pipeline once and obfuscates source strings with an
+    explicit list of steps, so callers don't need a file on disk or a fresh
+    interpreter per job. Copied next to hercules.lua at build time.
+]]
+
+local shim = {}
+
+local real_stdout = io.stdout
+
+-- Hercules reports progress with print(); keep stdout free for our callers
+print = function(...)
+    local parts = {}
+    for i = 1, select("#", ...) do
+        parts[#parts + 1] = tostring((select(i, ...)))
+    end
+    io.stderr:write(table.concat(parts, "\t"), "\n")
+end
+io.output(io.stderr)
+
+local config, Pipeline
+
+function shim.load()
+    local ok, err = pcall(function()
+        config = require("config")
+        Pipeline = require("pipeline")
+    end)
+    if not ok then
+        return false, tostring(err)
+    end
+    if type(Pipeline) ~= "table" or type(Pipeline.process) ~= "function" then
+        return false, "pipeline.process not found"
+    end
+    return true
+end
+
+local function set_step(settings, name, enabled)
+    local value = settings[name]
+    if type(value) == "table" then
+        value.enabled = enabled
+    elseif type(value) == "boolean" or (value == nil and enabled) then
+        settings[name] = {enabled = enabled}
+    end
+end
+
+-- Enable exactly the given steps ("a,b,c"), disabling everything else
+function shim.configure(steps)
+    local settings = config and config.settings
+    if type(settings) ~= "table" then
+        return
+    end
+    local enabled = {}
+    for name in (steps or ""):gmatch("[^,%s]+") do
+        enabled[name] = true
+    end
+    for name, value in pairs(settings) do
+        if type(value) == "table" and value.enabled ~= nil then
+            value.enabled = enabled[name] == true
+        end
+    end
+    for name in pairs(enabled) do
+        set_step(settings, name, true)
+    end
+    if settings.watermark_enabled ~= nil then
+        settings.watermark_enabled = enabled.watermark == true
+    end
+end
+
+function shim.obfuscate(code, steps)
+    shim.configure(steps)
+    math.randomseed(os.time(), math.floor(os.clock() * 1e6))
+    local ok, result = pcall(Pipeline.process, code)
+    if not ok then
+        return nil, tostring(result)
+    end
+    if type(result) ~= "string" then
+        return nil, "pipeline returned " .. type(result)
+    end
+    return result
+end
+
+function shim.write(data)
+    real_stdout:write(data)
+    real_stdout:flush()
+end
+
+return shim
@@ -0,0 +1,40 @@
+--[[
+    Long-lived syntax checker for the pre-flight check (preflight.py).
+
+    Same protocol as hercules_worker.lua, so the same pool runs it:
+        checker -> READY <lua version>\n
+        caller  -> JOB <n> <ignored>\n<n bytes of source>
+        checker -> OK 0\n                          (or ERR <n>\n<compiler message>)
+    Sources are compiled, never run. The checker exits on EOF.
+]]
+
+local compile = loadstring or function(source, name)
+    return load(source, name, "t")
+end
+
+local function frame(kind, body)
+    io.stdout:write(kind .. " " .. #body .. "\n" .. body)
+    io.stdout:flush()
+end
+
+io.stdout:write("READY " .. _VERSION .. "\n")
+io.stdout:flush()
+
+while true do
+    local header = io.stdin:read("l")
+    if not header then
+        break
+    end
+    local size = header:match("^JOB (%d+)")
+    if not size then
+        frame("ERR", "bad header: " .. header)
+    else
+        local source = io.stdin:read(tonumber(size)) or ""
+        local chunk, err = compile(source, "=input")
+        if chunk then
+            frame("OK", "")
+        else
+            frame("ERR", tostring(err))
+        end
+    end
+end
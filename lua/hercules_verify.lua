@@ -0,0 +1,201 @@
+--[[
+    Behavioural check of obfuscated output (verify.py).
+
+    Runs the original and then the obfuscated chunk, each in a fresh stubbed
+    environment (no files, processes or real globals) under an instruction
+    budget, and reports what each printed and returned.
+
+    Usage: lua hercules_verify.lua <original bytes> <budget> <slowdown>
+    stdin: the original source followed by the obfuscated source
+    stdout, one frame per chunk, original first:
+        RUN <ok|error|timeout|invalid> <n> <m>\n<n bytes of transcript><m bytes of error>
+    The obfuscated chunk gets `slowdown` instructions for every one the
+    original used, on top of the budget.
+]]
+
+local split, budget, slowdown = tonumber(arg[1]), tonumber(arg[2]), tonumber(arg[3])
+local input = io.read("*a")
+local sources = { input:sub(1, split), input:sub(split + 1) }
+
+local STEP = 1000  -- instructions between budget checks
+local MAX_TRANSCRIPT = 65536
+local OUT_OF_BUDGET = {}
+
+local SAFE = {
+    "assert", "error", "ipairs", "next", "pairs", "pcall", "rawequal", "rawget", "rawlen", "rawset",
+    "select", "setmetatable", "getmetatable", "tonumber", "tostring", "type", "unpack", "xpcall",
+}
+local LIBRARIES = { "string", "table", "math", "bit32", "utf8" }
+-- Roblox globals scripts commonly touch: they absorb any index or call
+local STUBS = {
+    "game", "workspace", "script", "Instance", "Enum", "Vector2", "Vector3", "CFrame",
+    "Color3", "UDim", "UDim2", "BrickColor", "Ray", "TweenInfo", "task",
+}
+
+local unpack = table.unpack or unpack
+
+local function pack(...)
+    return { n = select("#", ...), ... }
+end
+
+local function copy(t)
+    local c = {}
+    for k, v in pairs(t) do
+        c[k] = v
+    end
+    return c
+end
+
+local function compile(source, env, name)
+    if setfenv then
+        local chunk, err = loadstring(source, name)
+        if chunk then
+            setfenv(chunk, env)
+        end
+        return chunk, err
+    end
+    return load(source, name, "t", env)
+end
+
+local function stub(name)
+    return setmetatable({}, {
+        __index = function(_, key)
+            return stub(name .. "." .. tostring(key))
+        end,
+        __call = function()
+            return stub(name .. "()")
+        end,
+        __tostring = function()
+            return name
+        end,
+        __concat = function(a, b)
+            return tostring(a) .. tostring(b)
+        end,
+    })
+end
+
+-- Addresses differ between runs: print "table", not "table: 0x55d0..."
+local function show(value)
+    local text = tostring(value)
+    return (text:gsub("^(%a+): 0?x?%x+$", "%1"))
+end
+
+local function environment(transcript, hook)
+    local env = {}
+    for _, name in ipairs(SAFE) do
+        env[name] = _G[name]
+    end
+    for _, name in ipairs(LIBRARIES) do
+        if _G[name] then
+            env[name] = copy(_G[name])
+        end
+    end
+    for _, name in ipairs(STUBS) do
+        env[name] = stub(name)
+    end
+    env._G = env
+    env._VERSION = _VERSION
+    env.os = { time = os.time, clock = os.clock, date = os.date, difftime = os.difftime }
+    env.wait = function(seconds)
+        return seconds or 0.03
+    end
+    env.tick = os.clock
+
+    local size = 0
+    env.print = function(...)
+        local parts = {}
+        for i = 1, select("#", ...) do
+            parts[i] = show((select(i, ...)))
+        end
+        local line = table.concat(parts, "\t")
+        size = size + #line + 1
+        if size <= MAX_TRANSCRIPT then
+            transcript[#transcript + 1] = line
+        end
+    end
+
+    env.loadstring = function(source, name)
+        return compile(source, env, name or "=chunk")
+    end
+    env.load = function(source, name, _, scope)
+        if type(source) ~= "string" then
+            return nil, "only string chunks can be loaded here"
+        end
+        return compile(source, scope or env, name or "=chunk")
+    end
+    if setfenv then
+        env.getfenv = function()
+            return env
+        end
+        env.setfenv = setfenv
+    end
+
+    -- Hooks are per coroutine: new ones get the budget too
+    local coroutines = copy(coroutine)
+    coroutines.create = function(f)
+        local co = coroutine.create(f)
+        debug.sethook(co, hook, "", STEP)
+        return co
+    end
+    coroutines.wrap = function(f)
+        local co = coroutines.create(f)
+        return function(...)
+            local results = pack(coroutine.resume(co, ...))
+            if not results[1] then
+                error(results[2], 0)
+            end
+            return unpack(results, 2, results.n)
+        end
+    end
+    env.coroutine = coroutines
+    return env
+end
+
+local function run(source, limit)
+    local transcript = {}
+    local used = 0
+    local function hook()
+        used = used + STEP
+        if used > limit then
+            error(OUT_OF_BUDGET, 0)
+        end
+    end
+
+    local env = environment(transcript, hook)
+    local chunk, err = compile(source, env, "=chunk")
+    if not chunk then
+        return "invalid", "", tostring(err), 0
+    end
+    if math.randomseed then
+        math.randomseed(1)
+    end
+
+    debug.sethook(hook, "", STEP)
+    local results = pack(pcall(chunk))
+    debug.sethook()
+
+    if used > limit then
+        return "timeout", table.concat(transcript, "\n"), "", used
+    end
+    if not results[1] then
+        return "error", table.concat(transcript, "\n"), show(results[2]), used
+    end
+    if results.n > 1 then
+        local values = {}
+        for i = 2, results.n do
+            values[#values + 1] = show(results[i])
+        end
+        transcript[#transcript + 1] = "return\t" .. table.concat(values, "\t")
+    end
+    return "ok", table.concat(transcript, "\n"), "", used
+end
+
+local function frame(status, transcript, err)
+    io.write("RUN ", status, " ", #transcript, " ", #err, "\n", transcript, err)
+    io.flush()
+end
+
+local status, transcript, err, used = run(sources[1], budget)
+frame(status, transcript, err)
+status, transcript, err = run(sources[2], budget + used * slowdown)
+frame(status, transcript, err)
@@ -0,0 +1,41 @@
+--[[
+    Long-lived Hercules worker.
+
+    Protocol (stdin/stdout, one job at a time):
+        worker -> READY <lua version>\n            (or FAIL <n>\n<n bytes>)
+        caller -> JOB <n> <step,step,...>\n<n bytes of source>
+        worker -> OK <n>\n<n bytes of output>      (or ERR <n>\n<n bytes>)
+    The worker exits on EOF.
+]]
+
+local shim = require("hercules_shim")
+
+local function frame(kind, body)
+    shim.write(kind .. " " .. #body .. "\n" .. body)
+end
+
+local ok, err = shim.load()
+if not ok then
+    frame("FAIL", err)
+    os.exit(1)
+end
+shim.write("READY " .. _VERSION .. "\n")
+
+while true do
+    local header = io.stdin:read("l")
+    if not header then
+        break
+    end
+    local size, steps = header:match("^JOB (%d+) ?(.*)$")
+    if not size then
+        frame("ERR", "bad header: " .. header)
+    else
+        local code = io.stdin:read(tonumber(size)) or ""
+        local output, job_err = shim.obfuscate(code, steps)
+        if output then
+            frame("OK", output)
+        else
+            frame("ERR", job_err)
+        end
+    end
+end
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import threading
+from config import Config
+
+TIME_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Metric:
+    def __init__(self, registry, name, help, kind):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.lock = registry.lock
+        self.samples = {}
+        registry.metrics[name] = self
+
+    @staticmethod
+    def _key(labels):
+        return json.dumps(sorted(labels.items()))
+
+
+class Counter(Metric):
+    def __init__(self, registry, name, help):
+        super().__init__(registry, name, help, 'counter')
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    def __init__(self, registry, name, help):
+        super().__init__(registry, name, help, 'gauge')
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.samples[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    def __init__(self, registry, name, help, buckets):
+        super().__init__(registry, name, help, 'histogram')
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            sample = self.samples.get(key)
+            if sample is None:
+                sample = self.samples[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample['buckets'][i] += 1
+            sample['sum'] += value
+            sample['count'] += 1
+
+
+class Registry:
+    """
+    Per-process metrics, written to METRICS_FOLDER/<pid>.json so that /metrics
+    can add up the gunicorn workers and the bot.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.flusher = None
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: {
+                    'kind': m.kind,
+                    'help': m.help,
+                    'buckets': getattr(m, 'buckets', None),
+                    'samples': json.loads(json.dumps(m.samples)),
+                }
+                for name, m in self.metrics.items()
+            }
+
+    def flush(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{os.getpid()}.json')
+            tmp = f'{path}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'pid': os.getpid(), 'time': time.time(), 'metrics': self.snapshot()}, f)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def start_flusher(self):
+        """Write this process' metrics every METRICS_FLUSH_SECONDS"""
+        if self.flusher is not None and self.flusher[0] == os.getpid():
+            return
+
+        def loop():
+            while True:
+                time.sleep(Config.METRICS_FLUSH_SECONDS)
+                self.flush()
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        self.flusher = (os.getpid(), thread)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(total, name, metric, alive):
+    if metric['kind'] == 'gauge' and not alive:
+        return
+    entry = total.setdefault(name, {'kind': metric['kind'], 'help': metric['help'],
+                                    'buckets': metric['buckets'], 'samples': {}})
+    for key, value in metric['samples'].items():
+        if metric['kind'] == 'histogram':
+            current = entry['samples'].get(key)
+            if current is None or len(current['buckets']) != len(value['buckets']):
+                entry['samples'][key] = value
+            else:
+                current['buckets'] = [a + b for a, b in zip(current['buckets'], value['buckets'])]
+                current['sum'] += value['sum']
+                current['count'] += value['count']
+        else:
+            entry['samples'][key] = entry['samples'].get(key, 0) + value
+
+
+def collect():
+    """Sum the snapshots of every process; gauges only count live processes"""
+    registry.flush()
+    total = {}
+    try:
+        names = os.listdir(registry.directory)
+    except OSError:
+        names = []
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(registry.directory, name)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        alive = _pid_alive(data.get('pid', 0))
+        for metric_name, metric in data.get('metrics', {}).items():
+            _merge(total, metric_name, metric, alive)
+    return total
+
+
+def _labels(key, extra=None):
+    pairs = [tuple(p) for p in json.loads(key)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{str(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(extra_gauges=None):
+    """Prometheus text exposition format"""
+    total = collect()
+    for name, (help, value) in (extra_gauges or {}).items():
+        total[name] = {'kind': 'gauge', 'help': help, 'buckets': None, 'samples': {'[]': value}}
+
+    lines = []
+    for name in sorted(total):
+        metric = total[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        for key, value in sorted(metric['samples'].items()):
+            if metric['kind'] == 'histogram':
+                for bound, count in zip(metric['buckets'], value['buckets']):
+                    lines.append(f"{name}_bucket{_labels(key, ('le', bound))} {count}")
+                lines.append(f"{name}_bucket{_labels(key, ('le', '+Inf'))} {value['count']}")
+                lines.append(f"{name}_sum{_labels(key)} {_number(value['sum'])}")
+                lines.append(f"{name}_count{_labels(key)} {value['count']}")
+            else:
+                lines.append(f"{name}{_labels(key)} {_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry(Config.METRICS_FOLDER)
+
+jobs_total = Counter(registry, 'hercules_jobs_total', 'Obfuscation requests by source, preset and outcome')
+cache_lookups = Counter(registry, 'hercules_cache_lookups_total', 'Result cache lookups by result')
+queue_wait = Histogram(registry, 'hercules_queue_wait_seconds', 'Time spent waiting for a job slot', TIME_BUCKETS)
+run_seconds = Histogram(registry, 'hercules_run_seconds', 'Hercules wall time per job by preset and mode', TIME_BUCKETS)
+read_seconds = Histogram(registry, 'hercules_output_read_seconds', 'Time to read the obfuscated output', TIME_BUCKETS)
+input_bytes = Histogram(registry, 'hercules_input_bytes', 'Submitted source size', SIZE_BUCKETS)
+output_bytes = Histogram(registry, 'hercules_output_bytes', 'Obfuscated output size', SIZE_BUCKETS)
+coalesced_jobs = Counter(registry, 'hercules_coalesced_jobs_total', 'Requests that shared an identical job already running')
+timeouts = Counter(registry, 'hercules_timeouts_total', 'Jobs that hit their timeout')
+failures = Counter(registry, 'hercules_failures_total', 'Failed jobs by reason')
+kills = Counter(registry, 'hercules_process_kills_total', 'Hercules process groups killed, by reason')
+limit_hits = Counter(registry, 'hercules_limit_hits_total', 'Jobs stopped by a resource limit, by limit')
+pool_workers = Gauge(registry, 'hercules_pool_workers', 'Warm Lua workers in this process')
+bot_ready_seconds = Gauge(registry, 'hercules_bot_ready_seconds', 'Seconds from bot start to gateway ready')
+verifications = Counter(registry, 'hercules_verifications_total', 'Behavioural verifications of results, by verdict')
+command_syncs = Counter(registry, 'hercules_command_syncs_total', 'Slash command syncs at bot start, by result')
+
+
+def record_run(preset, code, result):
+    """Account one workers.execute() result"""
+    mode = result['mode']
+    run_seconds.observe(result['elapsed'], preset=preset, mode=mode)
+    input_bytes.observe(len(code.encode()), preset=preset)
+    if 'read_seconds' in result:
+        read_seconds.observe(result['read_seconds'], preset=preset, mode=mode)
+    if result['success']:
+        output_bytes.observe(len(result['output'].encode()), preset=preset)
+        return
+    reason = result.get('reason', 'unknown')
+    failures.inc(preset=preset, reason=reason)
+    if reason == 'timeout':
+        timeouts.inc(preset=preset, mode=mode)
+    elif reason == 'limit':
+        limit_hits.inc(preset=preset, mode=mode, limit=result.get('limit', 'unknown'))
@@ -0,0 +1,81 @@
+"""
+Step pipelines: the presets and step lists chosen by callers.
+
+A pipeline is named by a preset ('min', 'mid', 'max') or by its steps,
+comma separated in Config.STEPS order ('variable_renaming,compressor'). The
+name travels as `preset` through the daemon, job records and the bot, so
+nothing in between needs to know the difference.
+
+The warm workers and the pipe shim run the steps one at a time in
+Config.STEPS order (the shim only switches steps on, Hercules would pick
+its own order otherwise), and the output after every step is cached under
+the steps so far. A pipeline that starts with steps already run on the same
+file, whichever preset or list ran them, resumes after them
+(workers.run_pipeline). The CLI fallback runs Hercules's own order, so its
+results are not cached under these keys.
+"""
+from config import Config
+from cache import cache
+
+
+class StepError(ValueError):
+    """Unknown step or empty step list"""
+
+
+def parse(steps):
+    """Pipeline name for a caller's step list (a list or 'a,b,c'); raises StepError"""
+    if isinstance(steps, str):
+        steps = steps.split(',')
+    if not isinstance(steps, (list, tuple)):
+        raise StepError('steps must be a list or a comma separated string')
+    names = {str(s).strip() for s in steps} - {''}
+    unknown = sorted(names - set(Config.STEPS))
+    if unknown:
+        raise StepError(f"Unknown step '{unknown[0]}' (steps: {', '.join(Config.STEPS)})")
+    if not names:
+        raise StepError('No steps given')
+    return ','.join(s for s in Config.STEPS if s in names)
+
+
+def steps(name):
+    """Steps of a pipeline in the order they run"""
+    if name in Config.PRESETS:
+        enabled = {s for s, on in Config.PRESETS[name].items() if on}
+    else:
+        enabled = set(name.split(','))
+    return [s for s in Config.STEPS if s in enabled]
+
+
+def label(name):
+    """The preset, or 'custom' for a step list (metrics labels, rate limit costs)"""
+    return name if name in Config.PRESETS else 'custom'
+
+
+def key(code, steps):
+    """Cache key of code after the given steps"""
+    return cache.key(code, ','.join(steps))
+
+
+def cached_prefix(code, steps):
+    """(number of leading steps already cached, their output) for the longest cached proper prefix"""
+    for done in range(len(steps) - 1, 0, -1):
+        k = key(code, steps[:done])
+        # Check the disk first so the misses here don't count as cache misses
+        if cache.file(k):
+            output = cache.get(k)
+            if output is not None:
+                return done, output
+    return 0, code
+
+
+def cli_flags(name):
+    """hercules.lua flags for a pipeline; a step without a flag runs as Hercules configures it"""
+    if name in Config.PRESETS:
+        return [f'--{name}']
+    return [Config.STEPS[s] for s in steps(name) if Config.STEPS[s]]
+
+
+def closest_preset(name):
+    """The preset running most of a pipeline's steps, the smallest of those"""
+    wanted = set(steps(name))
+    return max(Config.PRESETS, key=lambda p: (len(wanted & set(steps(p))), -len(steps(p))))
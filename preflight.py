@@ -0,0 +1,125 @@
+"""
+Pre-flight syntax check: code that doesn't compile is turned away with the
+line and column of the error before it is admitted to the queue, instead of
+after a full Hercules run.
+
+A few long-lived `lua hercules_syntax.lua` checkers (a LuaWorkerPool with
+another script) compile submissions with the same interpreter Hercules runs
+on; nothing is executed. That grammar is stricter than the Luau/Roblox
+code Hercules takes (`+=`, `continue`, type annotations), so a failure only
+rejects the code once Hercules itself, with every step off, can't take it
+either. Verdicts are kept by content hash, so a file that is submitted again
+(another preset, a retry) is not compiled twice. When no checker can run,
+one times out or Hercules can't be asked, the job goes ahead and Hercules
+reports the problem as before.
+"""
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from config import Config
+from workers import LuaWorkerPool, pool, run_pipe
+
+MESSAGE = re.compile(r'^input:(\d+): (.*)$', re.S)
+NEAR = re.compile(r"near (?:'(.*)'|(<eof>))$", re.S)
+
+
+class InvalidCode(Exception):
+    """Raised when a submission does not compile"""
+
+    def __init__(self, message, line=None, column=None):
+        super().__init__(message)
+        self.line = line
+        self.column = column
+
+
+def locate(code, message):
+    """{'line', 'column', 'message'} from a Lua compiler message about code"""
+    m = MESSAGE.match(message.strip())
+    if not m:
+        return {'line': None, 'column': None, 'message': message.strip()}
+    line, text = int(m.group(1)), m.group(2)
+    lines = code.split('\n')
+    column = None
+    near = NEAR.search(text)
+    if near and 0 < line <= len(lines):
+        if near.group(2):
+            column = len(lines[line - 1]) + 1
+        else:
+            found = lines[line - 1].find(near.group(1).split('\n')[0])
+            column = found + 1 if found >= 0 else None
+    return {'line': line, 'column': column, 'message': text}
+
+
+def describe(error):
+    """One-line message for an error from check()"""
+    if error['line'] is None:
+        return f"Syntax error: {error['message']}"
+    where = f"line {error['line']}" + (f", column {error['column']}" if error['column'] else '')
+    return f"Syntax error at {where}: {error['message']}"
+
+
+def _hercules_rejects(code, timeout):
+    """
+    Whether Hercules fails on code with every step off (only its parser then
+    has anything to do): True or False, None when it couldn't be asked. An
+    idle warm worker, else the pipe shim.
+    """
+    result = pool.run(code, None, timeout, steps='', wait=False)
+    if result is None:
+        result = run_pipe(code, None, timeout, steps='')
+    if result is None or not (result['success'] or result.get('reason') == 'input'):
+        return None
+    return not result['success']
+
+
+class SyntaxChecker:
+    def __init__(self, size, max_entries):
+        self.pool = LuaWorkerPool(size, Config.SYNTAX_SCRIPT)
+        self.max_entries = max_entries
+        self.verdicts = OrderedDict()  # sha256 -> None (compiles) or error, least recently used first
+        self.lock = threading.Lock()
+        self.stats = {'checked': 0, 'hits': 0, 'invalid': 0, 'dialect': 0, 'skipped': 0}
+
+    def check(self, code, timeout=Config.SYNTAX_CHECK_TIMEOUT):
+        """None when code compiles (or can't be checked), else {'line', 'column', 'message'}"""
+        digest = hashlib.sha256(code.encode()).digest()
+        with self.lock:
+            if digest in self.verdicts:
+                self.verdicts.move_to_end(digest)
+                self.stats['hits'] += 1
+                return self.verdicts[digest]
+
+        result = self.pool.run(code, None, timeout, steps='')
+        if result is None or not (result['success'] or result.get('reason') == 'input'):
+            with self.lock:
+                self.stats['skipped'] += 1
+            return None
+        error = None if result['success'] else locate(code, result['error'])
+        rejected = _hercules_rejects(code, timeout) if error else False
+        if rejected is None:
+            with self.lock:
+                self.stats['skipped'] += 1
+            return None
+
+        with self.lock:
+            self.stats['checked'] += 1
+            if rejected:
+                self.stats['invalid'] += 1
+            elif error:
+                # Luau or another dialect only Hercules's parser takes
+                self.stats['dialect'] += 1
+                error = None
+            self.verdicts[digest] = error
+            while len(self.verdicts) > self.max_entries:
+                self.verdicts.popitem(last=False)
+        return error
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats, entries=len(self.verdicts), enabled=Config.SYNTAX_CHECK)
+        pool = self.pool.summary()
+        return dict(stats, checkers=pool['live'], disabled=pool['disabled'])
+
+
+checker = SyntaxChecker(Config.SYNTAX_CHECKERS, Config.SYNTAX_CACHE_ENTRIES)
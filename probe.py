@@ -0,0 +1,172 @@
+import os
+import re
+import fcntl
+import json
+import time
+import shutil
+import subprocess
+import threading
+from config import Config
+from cache import hercules_revision
+from workspace import Workspace
+import pipelines
+import sandbox
+
+# Messages that mean the environment is broken rather than the submitted code
+ENVIRONMENT_ERRORS = re.compile(
+    r"module '[^']+' not found|cannot open hercules|hercules\.lua: No such file|"
+    r"command not found|Permission denied",
+    re.IGNORECASE
+)
+
+_lock = threading.Lock()
+_capabilities = None
+
+
+def _path():
+    return os.path.join(Config.RUN_FOLDER, 'capabilities.json')
+
+
+def _fingerprint():
+    """Anything that would change the probe result"""
+    parts = [hercules_revision()]
+    for name in Config.LUA_CANDIDATES:
+        path = shutil.which(name)
+        if path:
+            try:
+                parts.append(f'{path}:{int(os.stat(path).st_mtime)}')
+            except OSError:
+                pass
+    return '|'.join(parts)
+
+
+def _run(cmd, timeout):
+    return sandbox.run(cmd, timeout, text=True)
+
+
+def _probe():
+    caps = {
+        'interpreter': None,
+        'version': None,
+        'hercules': os.path.exists(os.path.join(Config.HERCULES_PATH, 'hercules.lua')),
+        'preset_flags': False,
+        'step_flags': [],
+        'cli': False,
+        'errors': [],
+        'probed_at': time.time(),
+        'fingerprint': _fingerprint(),
+    }
+
+    for name in Config.LUA_CANDIDATES:
+        if not shutil.which(name):
+            continue
+        try:
+            r = subprocess.run([name, '-v'], capture_output=True, text=True, timeout=5)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            caps['errors'].append(f'{name}: {e}')
+            continue
+        version = (r.stdout or r.stderr).strip()
+        if r.returncode == 0 and version.startswith('Lua'):
+            caps['interpreter'] = name
+            caps['version'] = version
+            break
+        caps['errors'].append(f'{name}: {version[:100]}')
+
+    if not caps['interpreter'] or not caps['hercules']:
+        if not caps['hercules']:
+            caps['errors'].append(f'hercules.lua not found in {Config.HERCULES_PATH}')
+        return caps
+
+    # Do the preset flags work? A tiny real run answers it for good.
+    for flags in (['--min'], []):
+        error = _works(caps['interpreter'], flags)
+        if error is None:
+            caps['cli'] = True
+            caps['preset_flags'] = bool(flags)
+            break
+        caps['errors'].append(f"{' '.join(flags) or 'plain'} run failed: {error}")
+    else:
+        # Nothing worked: keep the preset flag so errors still mention the real command
+        caps['preset_flags'] = True
+
+    # And each step's own flag, for step lists
+    if caps['cli'] and caps['preset_flags']:
+        for flag in Config.STEPS.values():
+            if flag and _works(caps['interpreter'], [flag]) is None:
+                caps['step_flags'].append(flag)
+    return caps
+
+
+def _works(interpreter, flags):
+    """None when a tiny real run with these flags writes its output, else what went wrong"""
+    try:
+        with Workspace() as workspace:
+            workspace.write_input('print("probe")')
+            r = _run([interpreter, 'hercules.lua', workspace.input_file] + flags, 60)
+            if workspace.output_path() is not None:
+                return None
+            return (r.stderr or r.stdout).strip()[:200]
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return str(e)
+
+
+def capabilities(refresh=False):
+    """
+    Interpreter and flag support, probed once and shared by every process
+    through RUN_FOLDER/capabilities.json.
+    """
+    global _capabilities
+    with _lock:
+        if _capabilities is not None and not refresh:
+            return _capabilities
+
+        os.makedirs(Config.RUN_FOLDER, exist_ok=True)
+        # One process probes, the others wait and read its result
+        with open(f'{_path()}.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not refresh:
+                try:
+                    with open(_path()) as f:
+                        stored = json.load(f)
+                    if stored.get('fingerprint') == _fingerprint() and 'step_flags' in stored:
+                        _capabilities = stored
+                        return _capabilities
+                except (OSError, ValueError):
+                    pass
+
+            _capabilities = _probe()
+            try:
+                tmp = f'{_path()}.{os.getpid()}.tmp'
+                with open(tmp, 'w') as f:
+                    json.dump(_capabilities, f)
+                os.replace(tmp, _path())
+            except OSError:
+                pass
+
+        print(f"Capabilities: {_capabilities['interpreter']} ({_capabilities['version']}), "
+              f"preset flags: {_capabilities['preset_flags']}, step flags: {len(_capabilities['step_flags'])}")
+        return _capabilities
+
+
+def interpreter():
+    return capabilities()['interpreter'] or 'lua'
+
+
+def cli_command(input_file, preset):
+    """
+    (command line, whether it runs exactly the pipeline's steps) for this
+    environment; preset is a pipeline name. A step list with a flag
+    hercules.lua doesn't take runs as the closest preset instead.
+    """
+    cmd = [interpreter(), 'hercules.lua', input_file]
+    caps = capabilities()
+    if not caps['preset_flags']:
+        return cmd, False
+    flags = pipelines.cli_flags(preset)
+    if preset not in Config.PRESETS and not set(flags) <= set(caps['step_flags']):
+        return cmd + pipelines.cli_flags(pipelines.closest_preset(preset)), False
+    return cmd + flags, True
+
+
+def is_environment_error(text):
+    return bool(ENVIRONMENT_ERRORS.search(text or ''))
@@ -0,0 +1,106 @@
+"""
+Token-bucket rate limits for the web API and the bot.
+
+Buckets are keyed by scope and id ('user:1234', 'guild:42', 'ip:203.0.113.7'),
+each scope with its own rate and bucket size from Config.RATE_LIMITS, and a
+job takes as many tokens as its preset weighs (Config.RATE_LIMIT_COSTS). The
+limiter lives in the obfuscation daemon so every front end and gunicorn
+worker draws from the same buckets (client.rate_limit); a front end running
+without the daemon uses its own.
+
+Memory stays bounded: a bucket that has refilled is the same as no bucket
+and is dropped, and past RATE_LIMIT_MAX_KEYS the least recently used go.
+"""
+import math
+import time
+import threading
+from collections import OrderedDict
+from config import Config
+import pipelines
+
+
+class RateLimiter:
+    def __init__(self, limits, max_keys):
+        self.limits = limits  # scope -> (tokens per minute, bucket size)
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()  # key -> (tokens, updated), least recently used first
+        self.lock = threading.Lock()
+        self.stats = {'allowed': 0, 'limited': 0, 'expired': 0, 'evicted': 0}
+
+    def _limit(self, key):
+        """(tokens per second, bucket size) for a key"""
+        per_minute, size = self.limits[key.split(':', 1)[0]]
+        return per_minute / 60, size
+
+    def _level(self, key, now):
+        rate, size = self._limit(key)
+        tokens, updated = self.buckets.get(key, (size, now))
+        return min(size, tokens + (now - updated) * rate)
+
+    def _expire(self, now):
+        """Drop refilled buckets from the cold end, then whatever is past max_keys (caller holds lock)"""
+        while self.buckets:
+            key = next(iter(self.buckets))
+            if self._level(key, now) < self._limit(key)[1]:
+                break
+            del self.buckets[key]
+            self.stats['expired'] += 1
+        while len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+            self.stats['evicted'] += 1
+
+    def take(self, keys, cost=1):
+        """
+        Take cost tokens from every bucket in keys, or from none of them.
+        Returns (allowed, whole seconds until it would be). Keys of scopes
+        without a limit are ignored.
+        """
+        now = time.monotonic()
+        with self.lock:
+            wait = 0
+            levels = {}
+            for key in keys:
+                if key.split(':', 1)[0] not in self.limits:
+                    continue
+                rate, size = self._limit(key)
+                # A job never needs more than a full bucket, or heavy ones could never run
+                need = min(cost, size)
+                level = self._level(key, now)
+                levels[key] = level - need
+                if level < need:
+                    wait = max(wait, (need - level) / rate)
+            if wait:
+                self.stats['limited'] += 1
+                return False, math.ceil(wait)
+            for key, level in levels.items():
+                self.buckets[key] = (level, now)
+                self.buckets.move_to_end(key)
+            self._expire(now)
+            self.stats['allowed'] += 1
+            return True, 0
+
+    def summary(self):
+        with self.lock:
+            return dict(self.stats, keys=len(self.buckets))
+
+
+limiter = RateLimiter(Config.RATE_LIMITS, Config.RATE_LIMIT_MAX_KEYS)
+
+
+def cost(preset, jobs=1):
+    """Tokens for jobs with this preset (a pipeline name)"""
+    return Config.RATE_LIMIT_COSTS.get(pipelines.label(preset), 1) * jobs
+
+
+def web_keys(remote, forwarded_for=None):
+    """Bucket keys of a web request"""
+    ip = remote
+    if Config.TRUST_FORWARDED_FOR and forwarded_for:
+        # Our proxy appends the address it saw; anything before that is up to the client
+        ip = forwarded_for.split(',')[-1].strip()
+    return [f'ip:{ip or "unknown"}']
+
+
+def refused(retry_after):
+    """A result in service.run()'s shape for views.refusal()"""
+    return {'success': False, 'rate_limited': True, 'error': 'Rate limit exceeded', 'retry_after': retry_after}
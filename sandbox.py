@@ -0,0 +1,145 @@
+import os
+import re
+import signal
+import resource
+import subprocess
+import tempfile
+from config import Config
+from workspace import default_root
+import metrics
+
+# Signals the kernel sends when a process runs past its rlimits
+LIMIT_SIGNALS = {signal.SIGXCPU: 'cpu', signal.SIGXFSZ: 'output'}
+OUT_OF_MEMORY = re.compile(r'not enough memory', re.IGNORECASE)
+STDERR_TAIL = 65536
+
+
+def cpu_used(pid):
+    """CPU seconds (user + system) a process has used so far"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def set_cpu_limit(pid, seconds, hard=False):
+    """
+    Let the process use `seconds` more CPU from now. The soft limit sends
+    SIGXCPU; a hard one (one-shot processes only, since it can't be raised
+    again) follows up with SIGKILL.
+    """
+    if not hasattr(resource, 'prlimit'):
+        return
+    soft = int(cpu_used(pid) + seconds) + 1
+    try:
+        resource.prlimit(pid, resource.RLIMIT_CPU, (soft, soft + 5 if hard else resource.RLIM_INFINITY))
+    except (OSError, ValueError):
+        pass
+
+
+def apply_limits(pid, cpu_seconds=None, hard=True):
+    """RLIMIT_AS, RLIMIT_FSIZE and optionally RLIMIT_CPU on a freshly started process"""
+    if not hasattr(resource, 'prlimit'):
+        return
+    # Set from outside with prlimit() rather than preexec_fn, which isn't safe with threads
+    for limit, value in ((resource.RLIMIT_AS, Config.JOB_MEMORY_BYTES),
+                         (resource.RLIMIT_FSIZE, Config.MAX_OUTPUT_BYTES)):
+        if value:
+            try:
+                resource.prlimit(pid, limit, (value, value))
+            except (OSError, ValueError):
+                pass
+    if cpu_seconds:
+        set_cpu_limit(pid, cpu_seconds, hard)
+
+
+def spawn(cmd, cpu_seconds=None, hard=True, **kwargs):
+    """Popen in a new session (so its whole process group can be killed) with limits applied"""
+    proc = subprocess.Popen(cmd, start_new_session=True, **kwargs)
+    apply_limits(proc.pid, cpu_seconds, hard)
+    return proc
+
+
+def kill_group(proc, reason=None):
+    """SIGKILL the process and everything it started; counted when a reason is given"""
+    if proc.returncode is not None:
+        # Already reaped, the pid may belong to someone else by now
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        return
+    if reason:
+        metrics.kills.inc(reason=reason)
+
+
+def limit_hit(returncode, stderr=''):
+    """Which limit stopped a process: 'cpu', 'output', 'memory' or None"""
+    if returncode is not None and returncode > 128:
+        # Killed child of a shell wrapper
+        returncode = 128 - returncode
+    if returncode is not None and returncode < 0:
+        limit = LIMIT_SIGNALS.get(-returncode)
+        if limit:
+            return limit
+        if -returncode == signal.SIGKILL:
+            # Nobody else SIGKILLs our runs except the hard CPU limit (or the OOM killer)
+            return 'cpu'
+    if stderr and OUT_OF_MEMORY.search(stderr):
+        return 'memory'
+    return None
+
+
+def describe(limit):
+    return {
+        'cpu': 'CPU time limit exceeded',
+        'output': f'Output larger than {Config.MAX_OUTPUT_BYTES // (1024 * 1024)}MB',
+        'memory': f'Memory limit ({Config.JOB_MEMORY_BYTES // (1024 * 1024)}MB) exceeded',
+    }[limit]
+
+
+def run(cmd, timeout, input=None, text=False, cwd=None, cpu_seconds=None):
+    """
+    subprocess.run() for Hercules: own process group, rlimits, and stdout/stderr
+    written to unlinked files so RLIMIT_FSIZE caps them too. On timeout the
+    whole group is killed. The CompletedProcess gets two extra attributes:
+    timed_out and limit (see limit_hit()).
+    """
+    root = default_root()
+    os.makedirs(root, exist_ok=True)
+    with tempfile.TemporaryFile(dir=root) as out, tempfile.TemporaryFile(dir=root) as err:
+        proc = spawn(
+            cmd,
+            cpu_seconds=cpu_seconds or timeout,
+            cwd=cwd or Config.HERCULES_PATH,
+            stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+            stdout=out,
+            stderr=err,
+        )
+        timed_out = False
+        try:
+            proc.communicate(input, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            kill_group(proc, 'timeout')
+            proc.wait()
+        except BaseException:
+            kill_group(proc, 'error')
+            proc.wait()
+            raise
+
+        out.seek(0)
+        stdout = out.read()
+        size = err.seek(0, os.SEEK_END)
+        err.seek(max(0, size - STDERR_TAIL))
+        stderr = err.read()
+
+    if text:
+        stdout = stdout.decode(errors='replace')
+        stderr = stderr.decode(errors='replace')
+    r = subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+    r.timed_out = timed_out
+    r.limit = None if timed_out else limit_hit(proc.returncode, stderr if text else stderr.decode(errors='replace'))
+    return r
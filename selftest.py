@@ -0,0 +1,184 @@
+"""
+Background self-test: the Lua interpreter, the Hercules checkout, `hercules.lua
+--help` and one real obfuscation, run every SELF_TEST_INTERVAL seconds.
+
+The result goes to RUN_FOLDER/selftest.json, so /api/test, the bot's /test and
+!test and /health only read it and never start a process themselves. The
+daemon runs the test, taking a queue slot for the obfuscation like any job;
+the web servers and the bot only take over while no daemon answers, as
+their in-process fallback does for jobs. A lock file and the age of the
+shared result make sure only one process runs the test at a time.
+"""
+import os
+import json
+import time
+import fcntl
+import threading
+from config import Config
+from probe import capabilities
+from workers import run_pipeline, run_cli
+from jobqueue import job_queue, QueueFull
+from service import clean_ansi
+import client
+import sandbox
+
+TEST_CODE = 'print("test")'
+
+_started = None
+_latest = (None, None)  # (mtime, result) of the last read
+
+
+def _path():
+    return os.path.join(Config.RUN_FOLDER, 'selftest.json')
+
+
+def run():
+    """Run every check now; returns {'ok', 'checked_at', 'seconds', 'report'}"""
+    start = time.time()
+    results = []
+    ok = True
+
+    # Test 1: Lua, from the shared probe instead of another `lua -v`
+    caps = capabilities()
+    if caps['interpreter']:
+        results.append(f"✅ Lua: {caps['interpreter']} ({caps['version']})")
+    else:
+        ok = False
+        results.append(f"❌ Lua: none of {', '.join(Config.LUA_CANDIDATES)} works")
+
+    # Test 2: Hercules path
+    try:
+        files = os.listdir(Config.HERCULES_PATH)
+        results.append(f"✅ Hercules path exists: {Config.HERCULES_PATH}")
+        results.append(f"   Files: {', '.join(files[:10])}")
+        if 'hercules.lua' in files:
+            results.append("✅ hercules.lua found")
+        else:
+            ok = False
+            results.append("❌ hercules.lua NOT found!")
+    except Exception as e:
+        ok = False
+        results.append(f"❌ Hercules path: {e}")
+
+    # Test 3: Hercules help
+    try:
+        r = sandbox.run([caps['interpreter'] or 'lua', 'hercules.lua', '--help'], 10, text=True)
+        if r.timed_out:
+            raise TimeoutError('timed out after 10s')
+        output = clean_ansi(r.stdout or r.stderr)[:500]
+        results.append(f"✅ Hercules --help:\n{output}")
+    except Exception as e:
+        results.append(f"❌ Hercules help: {e}")
+
+    # Test 4: Simple obfuscation on the runners jobs use, in a queue slot but past the cache
+    try:
+        slot = job_queue.wait(job_queue.enter())
+    except QueueFull as e:
+        results.append(f"⚠️ Test obfuscation skipped: {e}")
+    else:
+        slot.record = False  # not a job for the average job time
+        try:
+            result = run_pipeline(TEST_CODE, 'min', 30, resume=False) or run_cli(TEST_CODE, 'min', 30)
+            if result['success']:
+                results.append(f"✅ Test obfuscation SUCCESS ({len(result['output'])} bytes, {result['mode']}, {result['elapsed']:.2f}s)")
+            else:
+                ok = False
+                results.append(f"❌ Test obfuscation FAILED ({result['mode']}): {clean_ansi(result['error'])[:300]}")
+                if result.get('stderr'):
+                    results.append(f"   STDERR: {clean_ansi(result['stderr'])[:200]}")
+        except Exception as e:
+            ok = False
+            results.append(f"❌ Test obfuscation: {e}")
+        finally:
+            slot.release()
+
+    return {
+        'ok': ok,
+        'checked_at': time.time(),
+        'seconds': round(time.time() - start, 2),
+        'report': '\n'.join(results),
+    }
+
+
+def latest():
+    """The last stored result with its age and whether it is stale, or None before the first one"""
+    global _latest
+    try:
+        mtime = os.stat(_path()).st_mtime
+        if mtime != _latest[0]:
+            with open(_path()) as f:
+                _latest = (mtime, json.load(f))
+    except (OSError, ValueError):
+        return None
+    result = dict(_latest[1])
+    result['age'] = round(time.time() - result['checked_at'], 1)
+    result['stale'] = result['age'] > Config.SELF_TEST_MAX_AGE
+    return result
+
+
+def report():
+    """Text for /api/test and the bot's test commands"""
+    result = latest()
+    if result is None:
+        return '⏳ The first self-test is still running, try again in a few seconds'
+    when = f"🕒 Checked {result['age']:.0f}s ago in {result['seconds']:.1f}s"
+    if result['stale']:
+        when += ' (stale: nothing has re-run it since)'
+    return f"{when}\n{result['report']}"
+
+
+def readiness():
+    """(ready, reason) from the stored result, for /health"""
+    result = latest()
+    if result is None:
+        return False, 'self-test pending'
+    if result['stale']:
+        return False, f"self-test stale ({result['age']:.0f}s old)"
+    if not result['ok']:
+        return False, 'self-test failed'
+    return True, 'ok'
+
+
+def _probe_if_due():
+    result = latest()
+    if result is not None and result['age'] < Config.SELF_TEST_INTERVAL:
+        return
+    os.makedirs(Config.RUN_FOLDER, exist_ok=True)
+    with open(f'{_path()}.lock', 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return  # another process is running it
+        # It may have finished while we were looking
+        result = latest()
+        if result is not None and result['age'] < Config.SELF_TEST_INTERVAL:
+            return
+        result = run()
+        tmp = f'{_path()}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp, _path())
+        print(f"Self-test {'passed' if result['ok'] else 'FAILED'} in {result['seconds']:.1f}s")
+
+
+def start_prober(fallback=False):
+    """
+    Keep the shared self-test result fresh from this process, once per
+    process. With fallback (front ends), only while no daemon answers.
+    """
+    global _started
+    if _started == os.getpid():
+        return
+    _started = os.getpid()
+
+    def loop():
+        while True:
+            try:
+                if not (fallback and client.daemon_running()):
+                    _probe_if_due()
+            except Exception as e:
+                print(f"Self-test failed to run: {e}")
+            # Check a few times per interval so a process can take over from one that died
+            time.sleep(max(1, Config.SELF_TEST_INTERVAL / 4))
+
+    threading.Thread(target=loop, daemon=True).start()
@@ -1,164 +1,35 @@
-from flask import Flask, request, jsonify, render_template_string
-import subprocess
+from flask import Flask, Response, request, jsonify, render_template_string, send_file, stream_with_context
+import json
 import os
-import uuid
 import time
-import re
 from config import Config
+from jobqueue import job_queue, QueueFull
+from costmodel import JobTooLarge
+from preflight import InvalidCode
+from jobs import JobStore, JobManager, FINISHED
+from workspace import start_janitor
+from concurrent.futures import ThreadPoolExecutor
+import batch
+from batch import BatchError
+import delivery
+from uploads import read_submission, UploadError
+from views import HTML, api_result, refusal, publish, job_view, stats_args
+from stats import stats_store
+import selftest
+import ratelimit
+import client
+import metrics
 
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = Config.MAX_BATCH_BYTES
 
 os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(Config.OUTPUT_FOLDER, exist_ok=True)
 
-def clean_ansi(text):
-    return re.sub(r'\x1b\[[0-9;]*m', '', text)
-
-HTML = '''
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Hercules Obfuscator</title>
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <style>
-        *{box-sizing:border-box;margin:0;padding:0}
-        body{font-family:system-ui;background:linear-gradient(135deg,#0f0f23,#1a1a3e);min-height:100vh;color:#fff;padding:20px}
-        .container{max-width:900px;margin:0 auto}
-        h1{text-align:center;color:#ff6b6b;margin-bottom:30px}
-        .card{background:rgba(255,255,255,0.05);border-radius:15px;padding:25px;border:1px solid rgba(255,255,255,0.1);margin-bottom:20px}
-        textarea{width:100%;height:200px;padding:15px;border:2px solid rgba(255,107,107,0.3);border-radius:10px;background:rgba(0,0,0,0.3);color:#fff;font-family:monospace}
-        select,input{width:100%;padding:12px;border-radius:8px;background:rgba(0,0,0,0.3);color:#fff;border:1px solid rgba(255,255,255,0.2);margin:10px 0}
-        label{color:#ff6b6b;display:block;margin:15px 0 8px}
-        .btn{background:linear-gradient(135deg,#ff6b6b,#ee5a5a);color:#fff;border:none;padding:15px 40px;font-size:16px;font-weight:bold;border-radius:10px;cursor:pointer;display:inline-block;margin:10px}
-        .btn:hover{transform:translateY(-2px)}
-        .btn:disabled{opacity:0.5}
-        .btn-test{background:linear-gradient(135deg,#00d4ff,#0099cc)}
-        .status{padding:15px;border-radius:10px;margin:15px 0;display:none}
-        .success{background:rgba(0,255,100,0.1);border:1px solid #00ff64;color:#00ff64;display:block}
-        .error{background:rgba(255,0,0,0.1);border:1px solid #ff6464;color:#ff6464;display:block}
-        .loading{background:rgba(255,200,0,0.1);border:1px solid #ffc800;color:#ffc800;display:block}
-        .debug{background:rgba(0,0,0,0.3);padding:15px;border-radius:10px;margin:15px 0;font-family:monospace;font-size:12px;white-space:pre-wrap;max-height:300px;overflow-y:auto}
-        .checkbox{display:flex;align-items:center;gap:10px}
-        .checkbox input{width:auto}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>🛡️ Hercules Obfuscator</h1>
-        
-        <div class="card">
-            <button class="btn btn-test" onclick="runTest()">🧪 Test Hercules</button>
-            <div id="testResult" class="debug" style="display:none"></div>
-        </div>
-        
-        <div class="card">
-            <label>📄 Lua Code</label>
-            <textarea id="code" placeholder="Paste your Lua code here...">print("Hello World")</textarea>
-            
-            <label>⚡ Preset</label>
-            <select id="preset">
-                <option value="min" selected>Minimum - Light</option>
-                <option value="mid">Medium - Balanced</option>
-                <option value="max">Maximum - Heavy</option>
-            </select>
-            
-            <div class="checkbox">
-                <input type="checkbox" id="showDebug" checked>
-                <label for="showDebug" style="margin:0">Show Debug Info</label>
-            </div>
-            
-            <div style="text-align:center">
-                <button class="btn" id="btn" onclick="obfuscate()">🛡️ Obfuscate</button>
-            </div>
-            
-            <div class="status" id="status"></div>
-            <div id="debugInfo" class="debug" style="display:none"></div>
-            
-            <div id="result" style="display:none">
-                <label>📤 Output</label>
-                <textarea id="output" readonly style="height:300px"></textarea>
-                <button class="btn" onclick="download()" style="background:#00d4ff">⬇️ Download</button>
-            </div>
-        </div>
-    </div>
-    <script>
-    async function runTest() {
-        const testResult = document.getElementById('testResult');
-        testResult.style.display = 'block';
-        testResult.textContent = '🔄 Running tests...';
-        
-        try {
-            const res = await fetch('/api/test');
-            const data = await res.json();
-            testResult.textContent = data.result;
-        } catch(e) {
-            testResult.textContent = '❌ Test failed: ' + e.message;
-        }
-    }
-    
-    async function obfuscate() {
-        const code = document.getElementById('code').value.trim();
-        const preset = document.getElementById('preset').value;
-        const showDebug = document.getElementById('showDebug').checked;
-        const status = document.getElementById('status');
-        const debugInfo = document.getElementById('debugInfo');
-        const btn = document.getElementById('btn');
-        
-        if (!code) { 
-            status.className = 'status error'; 
-            status.textContent = '❌ Enter code!'; 
-            return; 
-        }
-        
-        btn.disabled = true; 
-        btn.textContent = '⏳ Processing...';
-        status.className = 'status loading'; 
-        status.textContent = '🔄 Obfuscating...';
-        document.getElementById('result').style.display = 'none';
-        debugInfo.style.display = 'none';
-        
-        try {
-            const res = await fetch('/api/obfuscate', {
-                method: 'POST', 
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({code, preset, debug: showDebug})
-            });
-            const data = await res.json();
-            
-            if (data.debug && showDebug) {
-                debugInfo.textContent = data.debug;
-                debugInfo.style.display = 'block';
-            }
-            
-            if (data.success) {
-                status.className = 'status success';
-                status.textContent = '✅ Done! Time: ' + data.time_taken + ' | Size: ' + data.original_size + ' → ' + data.obfuscated_size + ' bytes';
-                document.getElementById('output').value = data.output;
-                document.getElementById('result').style.display = 'block';
-            } else {
-                status.className = 'status error';
-                status.textContent = '❌ ' + data.error;
-            }
-        } catch(e) {
-            status.className = 'status error';
-            status.textContent = '❌ ' + e.message;
-        }
-        
-        btn.disabled = false; 
-        btn.textContent = '🛡️ Obfuscate';
-    }
-    
-    function download() {
-        const blob = new Blob([document.getElementById('output').value], {type: 'text/plain'});
-        const a = document.createElement('a'); 
-        a.href = URL.createObjectURL(blob);
-        a.download = 'obfuscated.lua'; 
-        a.click();
-    }
-    </script>
-</body>
-</html>
-'''
+# Jobs run in the obfuscation daemon (daemon.py); these only matter when it is down and client.py runs them here
+metrics.registry.start_flusher()
+start_janitor()
+selftest.start_prober(fallback=True)
 
 @app.route('/')
 def index():
@@ -166,185 +37,210 @@ def index():
 
 @app.route('/api/test')
 def api_test():
-    results = []
-    
-    # Test 1: Lua version
+    """The last background self-test (selftest.py); nothing is run on request"""
+    ready, status = selftest.readiness()
+    return jsonify({'result': selftest.report(), 'ready': ready, 'status': status})
+
+def refused_response(refused):
+    status, body, headers = refused
+    return jsonify(body), status, headers
+
+def rate_limited(cost):
+    """A 429 response when this client is over its rate limit, else None"""
+    keys = ratelimit.web_keys(request.remote_addr, request.headers.get('X-Forwarded-For'))
+    allowed, retry_after = client.rate_limit_sync(keys, cost)
+    return None if allowed else refused_response(refusal(ratelimit.refused(retry_after)))
+
+@app.route('/api/obfuscate', methods=['POST'])
+def api_obfuscate():
+    """
+    Obfuscate and wait for the result. The response has metadata and a
+    result_url to download the output from; pass "inline": true to also get
+    the output in the JSON. The code can be sent as JSON, as a raw body or as
+    a multipart file upload (see uploads.read_submission). "steps" (a list or
+    "a,b,c") runs those Hercules steps instead of the preset. Unless
+    "verify" is false the output is then checked against the original in the
+    background; the verdict shows up under verification at status_url.
+    """
     try:
-        r = subprocess.run(['lua', '-v'], capture_output=True, text=True, timeout=5)
-        results.append(f"✅ Lua: {clean_ansi(r.stdout or r.stderr).strip()}")
-    except Exception as e:
-        results.append(f"❌ Lua: {e}")
+        code, options = read_submission(request)
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    preset = options['preset']
+    show_debug = options['debug']
+    limited = rate_limited(ratelimit.cost(preset))
+    if limited:
+        return limited
     
-    # Test 2: Hercules path
     try:
-        files = os.listdir(Config.HERCULES_PATH)
-        results.append(f"✅ Hercules path exists: {Config.HERCULES_PATH}")
-        results.append(f"   Files: {', '.join(files[:10])}")
-        if 'hercules.lua' in files:
-            results.append("✅ hercules.lua found")
-        else:
-            results.append("❌ hercules.lua NOT found!")
+        result = client.obfuscate_sync(code, preset, show_debug, 'web')
     except Exception as e:
-        results.append(f"❌ Hercules path: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+    refused = refusal(result)
+    if refused:
+        return refused_response(refused)
     
-    # Test 3: Hercules help
+    response = publish(jobs.store, api_result(result, show_debug), preset, result.get('key'), options['inline'])
+    if options['verify'] and response['success']:
+        response['verification'] = jobs.verify_later(response['job_id'], code, result['output'])
+        response['status_url'] = f"/api/jobs/{response['job_id']}"
+    return jsonify(response)
+
+def run_queued(code, preset):
+    """Run one job, waiting for room in the queue instead of failing fast"""
+    deadline = time.time() + Config.QUEUE_WAIT_TIMEOUT
+    while True:
+        result = client.obfuscate_sync(code, preset, source='batch')
+        if not result.get('busy') or time.time() > deadline:
+            return result
+        time.sleep(min(max(result['retry_after'], 1), 5))
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    """
+    Obfuscate a multi-file project. Accepts a zip and/or several .lua files
+    (multipart), a 'preset' for the whole batch and optional per-file 'presets'.
+    Returns a zip with the outputs and batch_report.json.
+    """
     try:
-        r = subprocess.run(
-            ['lua', 'hercules.lua', '--help'],
-            cwd=Config.HERCULES_PATH,
-            capture_output=True, text=True, timeout=10
-        )
-        output = clean_ansi(r.stdout or r.stderr)[:500]
-        results.append(f"✅ Hercules --help:\n{output}")
-    except Exception as e:
-        results.append(f"❌ Hercules help: {e}")
+        uploads = [(f.filename or '', f.read()) for key in request.files for f in request.files.getlist(key)]
+        preset = request.form.get('preset', 'min')
+        if preset not in batch.PRESET_NAMES:
+            preset = 'min'
+        presets = batch.parse_presets(request.form.get('presets'))
+        files = batch.collect(uploads)
+    except BatchError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    limited = rate_limited(sum(ratelimit.cost(batch.preset_for(name, preset, presets)) for name, _ in files))
+    if limited:
+        return limited
+    
+    started = time.time()
+    
+    def run_one(item):
+        name, code = item
+        file_preset = batch.preset_for(name, preset, presets)
+        file_started = time.time()
+        return batch.entry(name, file_preset, code, run_queued(code, file_preset), file_started)
     
-    # Test 4: Simple obfuscation
+    # One thread per concurrency slot: the batch never floods the shared queue
+    with ThreadPoolExecutor(max_workers=min(job_queue.concurrency, len(files))) as executor:
+        entries = list(executor.map(run_one, files))
+    
+    summary = batch.summarize(entries, started)
+    response = send_file(
+        batch.build_zip(entries, summary),
+        mimetype='application/zip',
+        as_attachment=True,
+        download_name='obfuscated.zip'
+    )
+    response.headers['X-Batch-Summary'] = json.dumps(summary)
+    return response
+
+@app.route('/api/queue')
+def api_queue():
+    return jsonify(job_queue.summary())
+
+def run_job(code, preset, show_debug, on_queue, on_start):
+    return client.obfuscate_sync(code, preset, show_debug, 'web', on_queue, on_start)
+
+jobs = JobManager(JobStore(Config.JOBS_FOLDER), run_job, verify=client.verify_sync)
+
+@app.route('/api/jobs', methods=['POST'])
+def api_submit_job():
     try:
-        test_file = os.path.join(Config.UPLOAD_FOLDER, 'test_temp.lua')
-        with open(test_file, 'w') as f:
-            f.write('print("test")')
-        
-        r = subprocess.run(
-            ['lua', 'hercules.lua', test_file, '--min'],
-            cwd=Config.HERCULES_PATH,
-            capture_output=True, text=True, timeout=30
-        )
-        
-        output_file = test_file.replace('.lua', '_obfuscated.lua')
-        if os.path.exists(output_file):
-            with open(output_file, 'r') as f:
-                content = f.read()
-            results.append(f"✅ Test obfuscation SUCCESS ({len(content)} bytes)")
-            os.remove(output_file)
-        else:
-            results.append(f"❌ No output file")
-            results.append(f"   STDOUT: {clean_ansi(r.stdout)[:200]}")
-            results.append(f"   STDERR: {clean_ansi(r.stderr)[:200]}")
-        
-        os.remove(test_file)
+        code, options = read_submission(request)
+        limited = rate_limited(ratelimit.cost(options['preset']))
+        if limited:
+            return limited
+        job = jobs.submit(code, options['preset'], options['debug'], options['verify'])
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    except JobTooLarge as e:
+        return refused_response(refusal({'too_large': True, 'error': str(e), 'estimate': e.estimate['seconds']}))
+    except InvalidCode as e:
+        return refused_response(refusal({'invalid': True, 'error': str(e), 'line': e.line, 'column': e.column}))
+    except QueueFull as e:
+        return refused_response(refusal({'busy': True, 'error': str(e), 'retry_after': e.retry_after}))
     except Exception as e:
-        results.append(f"❌ Test obfuscation: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
     
-    return jsonify({'result': '\n'.join(results)})
+    return jsonify(job_view(job)), 202
 
-@app.route('/api/obfuscate', methods=['POST'])
-def api_obfuscate():
-    debug_info = []
+@app.route('/api/jobs/<job_id>')
+def api_job_status(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job_view(job))
+
+@app.route('/api/jobs/<job_id>/events')
+def api_job_events(job_id):
+    if not jobs.get(job_id):
+        return jsonify({'error': 'Unknown job'}), 404
     
+    def stream():
+        for job in jobs.events(job_id):
+            yield f"event: {job['status']}\ndata: {json.dumps(job_view(job))}\n\n"
+    
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/jobs/<job_id>/result')
+def api_job_result(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job['status'] not in FINISHED:
+        return jsonify({'error': 'Job not finished', 'status': job['status']}), 409
+    if job['status'] == 'failed':
+        return jsonify({'error': job.get('error', 'Obfuscation failed')}), 422
+    return send_result(jobs.store.result_path(job_id), request.args.get('download') == '1')
+
+def send_result(path, as_attachment, download_name='obfuscated.lua'):
+    """Stream a result from disk, gzip/brotli compressed when the client accepts it"""
+    encoding = delivery.negotiate(request.headers.get('Accept-Encoding'))
     try:
-        data = request.json
-        code = data.get('code', '')
-        preset = data.get('preset', 'min')
-        show_debug = data.get('debug', False)
-        
-        if not code:
-            return jsonify({'success': False, 'error': 'No code provided'})
-        
-        if preset not in ['min', 'mid', 'max']:
-            preset = 'min'
-        
-        req_id = str(uuid.uuid4())[:8]
-        input_file = os.path.join(Config.UPLOAD_FOLDER, f'{req_id}.lua')
-        
-        debug_info.append(f"📁 File: {input_file}")
-        debug_info.append(f"📏 Code: {len(code)} bytes")
-        debug_info.append(f"⚙️ Preset: {preset}")
-        
-        with open(input_file, 'w') as f:
-            f.write(code)
-        
-        cmd = ['lua', 'hercules.lua', input_file, f'--{preset}']
-        debug_info.append(f"🔧 Command: {' '.join(cmd)}")
-        
-        start = time.time()
-        result = subprocess.run(
-            cmd, 
-            cwd=Config.HERCULES_PATH, 
-            capture_output=True, 
-            text=True, 
-            timeout=Config.OBFUSCATION_TIMEOUT
-        )
-        elapsed = time.time() - start
-        
-        debug_info.append(f"⏱️ Time: {elapsed:.2f}s")
-        debug_info.append(f"📤 Exit: {result.returncode}")
-        
-        stdout = clean_ansi(result.stdout or '')
-        stderr = clean_ansi(result.stderr or '')
-        
-        if stdout:
-            debug_info.append(f"📝 STDOUT:\n{stdout[:300]}")
-        if stderr:
-            debug_info.append(f"⚠️ STDERR:\n{stderr[:300]}")
-        
-        # Find output
-        output_file = None
-        base_name = f'{req_id}_obfuscated.lua'
-        
-        locations = [
-            input_file.replace('.lua', '_obfuscated.lua'),
-            os.path.join(Config.HERCULES_PATH, base_name),
-            os.path.join(Config.UPLOAD_FOLDER, base_name),
-        ]
-        
-        # Scan for any obfuscated file
-        for d in [Config.HERCULES_PATH, Config.UPLOAD_FOLDER]:
-            try:
-                for f in os.listdir(d):
-                    if '_obfuscated.lua' in f:
-                        locations.append(os.path.join(d, f))
-                        debug_info.append(f"🔍 Found: {f}")
-            except:
-                pass
-        
-        for loc in locations:
-            if os.path.exists(loc):
-                output_file = loc
-                debug_info.append(f"✅ Output: {loc}")
-                break
-        
-        if output_file:
-            with open(output_file, 'r') as f:
-                output = f.read()
-            
-            os.remove(input_file)
-            os.remove(output_file)
-            
-            return jsonify({
-                'success': True,
-                'output': output,
-                'time_taken': f'{elapsed:.2f}s',
-                'original_size': len(code),
-                'obfuscated_size': len(output),
-                'debug': '\n'.join(debug_info) if show_debug else None
-            })
-        else:
-            os.remove(input_file) if os.path.exists(input_file) else None
-            debug_info.append("❌ No output file found")
-            return jsonify({
-                'success': False, 
-                'error': stderr or stdout or 'No output',
-                'debug': '\n'.join(debug_info) if show_debug else None
-            })
-            
-    except subprocess.TimeoutExpired:
-        return jsonify({
-            'success': False, 
-            'error': 'Timeout',
-            'debug': '\n'.join(debug_info)
-        })
-    except Exception as e:
-        debug_info.append(f"❌ Exception: {e}")
-        return jsonify({
-            'success': False, 
-            'error': str(e),
-            'debug': '\n'.join(debug_info)
-        })
+        size = os.path.getsize(path)
+    except OSError:
+        return jsonify({'error': 'Result expired'}), 410
+    if encoding is None or size < Config.MIN_COMPRESS_BYTES:
+        response = send_file(path, mimetype='text/plain', as_attachment=as_attachment, download_name=download_name)
+    else:
+        response = Response(stream_with_context(delivery.compress_file(path, encoding)), mimetype='text/plain')
+        response.headers['Content-Encoding'] = encoding
+        response.headers['X-Uncompressed-Length'] = str(size)
+        if as_attachment:
+            response.headers['Content-Disposition'] = f'attachment; filename={download_name}'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+@app.route('/api/stats')
+def api_stats():
+    """Job counts, latency percentiles and bytes over the last ?hours= (24) in ?step= minute buckets (60)"""
+    return jsonify(stats_store.query(*stats_args(request.args)))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    body = metrics.render({
+        'hercules_queue_depth': ('Jobs waiting for a slot (node-wide)', job_queue.depth()),
+        'hercules_active_jobs': ('Jobs holding a slot (node-wide)', job_queue.running()),
+        'hercules_queue_concurrency': ('Configured concurrency slots', job_queue.concurrency),
+    })
+    return Response(body, mimetype='text/plain; version=0.0.4')
 
 @app.route('/health')
 def health():
-    return jsonify({'status': 'healthy'})
+    """
+    Liveness for the platform's health check: always 200 while the process
+    answers. ready and self_test tell whether the background self-test has
+    passed recently (a failing Hercules must not get the service restarted).
+    """
+    ready, status = selftest.readiness()
+    return jsonify(dict(client.summary_sync(), status='healthy', ready=ready, self_test=status))
 
 if __name__ == '__main__':
     print(f"Hercules Path: {Config.HERCULES_PATH}")
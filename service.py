@@ -0,0 +1,234 @@
+"""
+The obfuscation pipeline: cache, cost estimate, queue, run. Normally only the
+daemon (daemon.py) runs it; front ends reach it through client.py, which
+falls back to calling it in-process when the daemon is not running.
+"""
+import re
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
+from cache import cache, cached_result
+from workers import pool, execute, debug_lines
+from jobqueue import job_queue, QueueFull
+from costmodel import cost_model, JobTooLarge
+from probe import capabilities
+from ratelimit import limiter
+from stats import stats_store
+from preflight import checker, describe
+from verify import verifier
+from config import Config
+import chunking
+import pipelines
+import metrics
+
+
+# Cache key -> {'future', 'merged'} of the job computing it, in this process (normally the daemon)
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def clean_ansi(text):
+    """Remove ANSI color codes from text"""
+    return re.sub(r'\x1b\[[0-9;]*m', '', text)
+
+
+def _account(source, preset, outcome, started, code, output=None):
+    """Count a job in the Prometheus metrics and the persistent stats"""
+    metrics.jobs_total.inc(source=source, preset=preset, outcome=outcome)
+    stats_store.record(source, preset, outcome, time.time() - started, len(code), len(output or ''))
+
+
+async def run(code, preset='min', debug=False, source='web', on_queue=None, on_start=None):
+    """
+    Obfuscate one submission. preset is a pipeline name: a preset or a
+    step list from pipelines.parse().
+    on_queue(position, eta) is awaited while the job waits for a free slot,
+    on_start(estimate) once it has one and is about to run. eta includes the
+    job's own predicted run time.
+
+    Returns a dict with success, output, time, original, obfuscated, cached
+    and key (the cache key) on success, queue_position (where the job
+    entered the queue) once it ran; error on failure, plus busy and
+    retry_after when the queue is full, too_large and estimate when the job
+    was refused up front, or invalid, line and column when the code doesn't
+    compile. A request identical (same code and steps) to one that is
+    already running gets that job's result with coalesced set, and the job
+    that ran reports how many requests shared it in merged.
+    """
+    started = time.time()
+    # Keyed by the steps, so a step list equal to a preset shares its entries
+    # Off the loop: a disk read, and the first lookup fingerprints the Hercules checkout
+    key, cached = await asyncio.to_thread(cached_result, code, ','.join(pipelines.steps(preset)))
+    label = pipelines.label(preset)
+    if cached:
+        _account(source, label, 'cached', started, code, cached['output'])
+        cached.update(key=key, debug=f"⚡ Cache hit: {key[:16]}" if debug else None)
+        return cached
+
+    # Milliseconds to turn away code Hercules would only fail on after a full run
+    if Config.SYNTAX_CHECK:
+        error = await asyncio.to_thread(checker.check, code)
+        if error:
+            _account(source, label, 'invalid', started, code)
+            return {'success': False, 'invalid': True, 'error': describe(error), 'line': error['line'], 'column': error['column']}
+
+    try:
+        # Tokenizing the source and re-reading the run history would stall every other connection
+        estimate = await asyncio.to_thread(cost_model.admit, code, preset)
+    except JobTooLarge as e:
+        _account(source, label, 'rejected', started, code)
+        return {'success': False, 'too_large': True, 'error': str(e), 'estimate': e.estimate['seconds']}
+
+    # Identical requests already running (a script posted in a busy guild) share that job
+    with _inflight_lock:
+        leader = _inflight.get(key)
+        if leader:
+            leader['merged'] += 1
+        else:
+            entry = _inflight[key] = {'future': Future(), 'merged': 0}
+
+    if leader:
+        # Same code and steps, so the leader's estimate too; callers waiting for
+        # the job to start (JobManager.submit) must not wait for it to finish
+        if on_start:
+            await on_start(estimate)
+        try:
+            shared = await asyncio.shield(asyncio.wrap_future(leader['future']))
+        except asyncio.CancelledError:
+            if not leader['future'].cancelled():
+                raise
+            # Its client went away before it finished: run it ourselves
+            return await run(code, preset, debug, source, on_queue, on_start)
+        metrics.coalesced_jobs.inc(preset=label)
+        # The shared job's own outcome, with successes kept apart from jobs that ran
+        outcome = 'coalesced' if shared['success'] else 'busy' if shared.get('busy') else 'failed'
+        _account(source, label, outcome, started, code, shared.get('output'))
+        result = dict(shared, coalesced=True)
+        if 'debug' in result:
+            result['debug'] = f"🔗 Shared an identical job already running\n{shared['debug'] or ''}" if debug else None
+        return result
+
+    try:
+        result = await _run_admitted(code, preset, key, label, estimate, source, started, on_queue, on_start)
+    except BaseException as e:
+        with _inflight_lock:
+            del _inflight[key]
+        if isinstance(e, Exception):
+            entry['future'].set_exception(e)
+        else:
+            entry['future'].cancel()
+        raise
+    with _inflight_lock:
+        del _inflight[key]
+    entry['future'].set_result(result)
+
+    # Followers got the same dict: change a copy
+    result = dict(result)
+    if entry['merged']:
+        result['merged'] = entry['merged']
+    if 'debug' in result:
+        if not debug:
+            result['debug'] = None
+        elif entry['merged']:
+            result['debug'] = f"🔗 Shared with {entry['merged']} identical request(s)\n{result['debug']}"
+    return result
+
+
+async def _run_admitted(code, preset, key, label, estimate, source, started, on_queue=None, on_start=None):
+    """Queue and run an admitted job nobody else is running; the result keeps its debug text"""
+    positions = []
+
+    async def queued(position, eta):
+        if not positions:
+            positions.append(position)
+        if on_queue:
+            await on_queue(position, round(eta + estimate['seconds'], 1))
+
+    try:
+        ticket = job_queue.enter()
+        slot = await job_queue.wait_async(ticket, queued)
+    except QueueFull as e:
+        _account(source, label, 'busy', started, code)
+        return {'success': False, 'busy': True, 'error': str(e), 'retry_after': e.retry_after}
+
+    metrics.queue_wait.observe(slot.waited, preset=label)
+    # Large files can use slots nobody is waiting for to run in split mode
+    extra = []
+    if chunking.worthwhile(code, preset):
+        extra = job_queue.take_idle((Config.SPLIT_MAX_PARTS or job_queue.concurrency) - 1)
+    job = None
+    try:
+        if on_start:
+            await on_start(estimate)
+        job = asyncio.ensure_future(_run_job(code, preset, key, estimate, 1 + len(extra)))
+        result = await asyncio.shield(job)
+    finally:
+        held = [slot] + extra
+        if job is None or job.done():
+            for s in held:
+                s.release()
+        else:
+            # Cancelled mid-run (its client went away): the thread can't be stopped, so it keeps its slots until it ends
+            job.add_done_callback(lambda _: [s.release() for s in held])
+    _account(source, label, 'done' if result['success'] else 'failed', started, code, result.get('output'))
+
+    result['queue_wait'] = round(slot.waited, 3)
+    result['queue_position'] = positions[0] if positions else 0
+    result['estimate'] = estimate['seconds'] if estimate['trained'] else None
+    if slot.waited > 0.5:
+        result['debug'] = f"🚦 Queued: {slot.waited:.2f}s\n" + result['debug']
+    return result
+
+
+async def _run_job(code, preset, key, estimate, parts=1):
+    """Run one job on a warm worker, the pipe shim or the hercules.lua CLI"""
+    debug_info = [
+        f"⚙️ Preset: {preset}",
+        f"📏 Code: {len(code)} bytes, {estimate['tokens']} tokens",
+        f"⏱️ Estimate: {estimate['seconds']:.1f}s{'' if estimate['trained'] else ' (default)'}, timeout {estimate['timeout']:.0f}s"
+    ]
+
+    try:
+        result = await asyncio.to_thread(execute, code, preset, estimate['timeout'], estimate['tokens'], parts)
+    except Exception as e:
+        debug_info.append(f"❌ Exception: {e}")
+        return {'success': False, 'error': str(e), 'debug': '\n'.join(debug_info)}
+
+    debug_info.extend(debug_lines(result, clean_ansi))
+
+    if not result['success']:
+        return {'success': False, 'error': clean_ansi(result['error']), 'debug': '\n'.join(debug_info)}
+
+    output = result['output']
+    # Only cache runs that applied the requested steps in pipeline order; the CLI
+    # runs Hercules's own order (and without flag support, not even those steps)
+    if result['mode'] != 'cli':
+        await asyncio.to_thread(cache.put, key, output)
+
+    return {
+        'success': True,
+        'output': output,
+        'time': f"{result['elapsed']:.2f}s",
+        'original': len(code),
+        'obfuscated': len(output),
+        'cached': False,
+        'key': key,
+        'command': result.get('command', result['mode']),
+        'debug': '\n'.join(debug_info),
+    }
+
+
+def summary():
+    """State of everything the pipeline owns, for /health and !debug"""
+    return {
+        'cache': cache.summary(),
+        'workers': pool.summary(),
+        'queue': job_queue.summary(),
+        'cost_model': cost_model.summary(),
+        'rate_limits': limiter.summary(),
+        'syntax_check': checker.summary(),
+        'verification': verifier.summary(),
+        'in_flight': len(_inflight),
+        'capabilities': capabilities(),
+    }
@@ -1,21 +1,35 @@
 #!/bin/bash
 echo "Starting Hercules Obfuscator Services..."
 
-mkdir -p /app/uploads /app/outputs /app/logs
+mkdir -p /app/uploads /app/outputs /app/logs /app/run
 
-# Start web server
-gunicorn --bind 0.0.0.0:10000 --workers 2 --timeout 300 server:app &
+# Start the obfuscation daemon: one queue, cache and warm worker pool for the web server and the bot
+python3 daemon.py &
+DAEMON_PID=$!
+
+# Start web server (WEB_SERVER=aiohttp for the single-process async front end)
+if [ "$WEB_SERVER" = "aiohttp" ]; then
+    python3 aioserver.py &
+else
+    # Threaded workers: job status streams and /health never wait behind obfuscation
+    gunicorn --bind 0.0.0.0:10000 --workers 2 --worker-class gthread --threads 16 --timeout 300 server:app &
+fi
 WEB_PID=$!
 
-sleep 3
+# The bot only needs the daemon (and runs jobs itself until it is up); don't make it wait longer
+for _ in $(seq 1 50); do
+    [ -S "${RUN_FOLDER:-/app/run}/hercules.sock" ] && break
+    sleep 0.1
+done
 
 # Start Discord bot
 python3 bot.py &
 BOT_PID=$!
 
+echo "Daemon PID: $DAEMON_PID"
 echo "Web Server PID: $WEB_PID"
 echo "Discord Bot PID: $BOT_PID"
 
-trap "kill $WEB_PID $BOT_PID 2>/dev/null; exit" SIGTERM SIGINT
+trap "kill $WEB_PID $BOT_PID $DAEMON_PID 2>/dev/null; exit" SIGTERM SIGINT
 wait -n
-kill $WEB_PID $BOT_PID 2>/dev/null
+kill $WEB_PID $BOT_PID $DAEMON_PID 2>/dev/null
@@ -0,0 +1,222 @@
+"""
+Persistent job statistics: one row per minute, source, preset and outcome in
+a SQLite file (Config.STATS_DB), with the job count, input/output bytes and a
+latency histogram. Rows older than STATS_RETENTION_DAYS are dropped as new
+minutes come in, so the file stays bounded.
+
+record() only adds to an in-memory row for the current minute; a thread
+writes those rows every STATS_FLUSH_SECONDS in one transaction. Any process
+can record (the daemon, or a front end running jobs itself) and any process
+can query(): SQLite takes care of the locking.
+"""
+import os
+import math
+import time
+import atexit
+import sqlite3
+import threading
+from array import array
+from config import Config
+
+# Latency histogram bounds in seconds: 10ms to ~10 minutes in steps of 25%
+LATENCY_BUCKETS = tuple(0.01 * 1.25 ** i for i in range(50))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS minutes (
+    minute INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    preset TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    jobs INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    bytes_in INTEGER NOT NULL,
+    bytes_out INTEGER NOT NULL,
+    latency BLOB NOT NULL,
+    PRIMARY KEY (minute, source, preset, outcome)
+) WITHOUT ROWID
+"""
+
+
+def _bucket(seconds):
+    """Index of the latency bucket for seconds (the last one also takes everything longer)"""
+    if seconds <= LATENCY_BUCKETS[0]:
+        return 0
+    return min(len(LATENCY_BUCKETS) - 1, math.ceil(math.log(seconds / LATENCY_BUCKETS[0], 1.25)))
+
+
+def _empty_row():
+    return [0, 0.0, 0, 0, array('I', bytes(4 * len(LATENCY_BUCKETS)))]
+
+
+def _merge(row, jobs, seconds, bytes_in, bytes_out, latency):
+    row[0] += jobs
+    row[1] += seconds
+    row[2] += bytes_in
+    row[3] += bytes_out
+    for i, count in enumerate(latency):
+        row[4][i] += count
+
+
+def percentile(histogram, q):
+    """Seconds at quantile q of a latency histogram (midpoint of the bucket it falls in), or None"""
+    total = sum(histogram)
+    if not total:
+        return None
+    seen = 0
+    for i, count in enumerate(histogram):
+        seen += count
+        if seen >= q * total:
+            low = LATENCY_BUCKETS[i - 1] if i else LATENCY_BUCKETS[0] / 1.25
+            return round(math.sqrt(low * LATENCY_BUCKETS[i]), 3)
+    return round(LATENCY_BUCKETS[-1], 3)
+
+
+def _describe(row):
+    jobs, seconds, bytes_in, bytes_out, latency = row
+    return {
+        'jobs': jobs,
+        'avg_seconds': round(seconds / jobs, 3) if jobs else None,
+        'p50_seconds': percentile(latency, 0.5),
+        'p95_seconds': percentile(latency, 0.95),
+        'p99_seconds': percentile(latency, 0.99),
+        'bytes_in': bytes_in,
+        'bytes_out': bytes_out,
+    }
+
+
+class StatsStore:
+    def __init__(self, path, retention_days, flush_seconds):
+        self.path = path
+        self.retention = retention_days * 24 * 60
+        self.flush_seconds = flush_seconds
+        self.pending = {}  # (minute, source, preset, outcome) -> row
+        self.lock = threading.Lock()
+        self.flusher = None
+        self.pruned = 0
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=10)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute(SCHEMA)
+        return db
+
+    def record(self, source, preset, outcome, seconds, bytes_in=0, bytes_out=0):
+        """Count one finished (or refused) job; seconds is its end to end latency"""
+        key = (int(time.time() // 60), source, preset, outcome)
+        with self.lock:
+            row = self.pending.get(key)
+            if row is None:
+                row = self.pending[key] = _empty_row()
+            row[0] += 1
+            row[1] += seconds
+            row[2] += bytes_in
+            row[3] += bytes_out
+            row[4][_bucket(seconds)] += 1
+        self._start_flusher()
+
+    def _start_flusher(self):
+        if self.flusher == os.getpid():
+            return
+        with self.lock:
+            if self.flusher == os.getpid():
+                return
+            self.flusher = os.getpid()
+
+        def loop():
+            while True:
+                time.sleep(self.flush_seconds)
+                self.flush()
+
+        threading.Thread(target=loop, daemon=True).start()
+        atexit.register(self.flush)
+
+    def flush(self):
+        """Add the pending rows to the database and drop minutes past the retention"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        try:
+            db = self._connect()
+            try:
+                with db:
+                    for key, row in pending.items():
+                        stored = db.execute(
+                            'SELECT jobs, seconds, bytes_in, bytes_out, latency FROM minutes '
+                            'WHERE minute = ? AND source = ? AND preset = ? AND outcome = ?', key
+                        ).fetchone()
+                        if stored:
+                            latency = array('I')
+                            latency.frombytes(stored[4])
+                            _merge(row, *stored[:4], latency)
+                        db.execute(
+                            'INSERT OR REPLACE INTO minutes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            key + tuple(row[:4]) + (row[4].tobytes(),)
+                        )
+                    now = int(time.time() // 60)
+                    # Once a minute is enough; the primary key makes it a range delete
+                    if now != self.pruned:
+                        self.pruned = now
+                        db.execute('DELETE FROM minutes WHERE minute < ?', (now - self.retention,))
+            finally:
+                db.close()
+        except sqlite3.Error as e:
+            print(f"Stats flush failed: {e}")
+
+    def query(self, hours=24, step_minutes=60):
+        """
+        Totals by preset and outcome and a series in step_minutes buckets
+        over the last `hours`, for /api/stats and the bot's /stats.
+        """
+        now = int(time.time() // 60)
+        since = now - int(hours * 60)
+        step = max(1, int(step_minutes))
+        try:
+            db = self._connect()
+            try:
+                rows = db.execute(
+                    'SELECT minute, source, preset, outcome, jobs, seconds, bytes_in, bytes_out, latency '
+                    'FROM minutes WHERE minute > ?', (since,)
+                ).fetchall()
+            finally:
+                db.close()
+        except sqlite3.Error as e:
+            print(f"Stats query failed: {e}")
+            rows = []
+        # Rows not flushed yet
+        with self.lock:
+            rows += [key + tuple(row[:4]) + (row[4].tobytes(),) for key, row in self.pending.items() if key[0] > since]
+
+        overall = _empty_row()
+        by_preset = {}
+        by_outcome = {}
+        by_source = {}
+        series = {}
+        for minute, source, preset, outcome, jobs, seconds, bytes_in, bytes_out, blob in rows:
+            latency = array('I')
+            latency.frombytes(blob)
+            values = (jobs, seconds, bytes_in, bytes_out, latency)
+            _merge(overall, *values)
+            for groups, name in ((by_preset, preset), (by_outcome, outcome), (by_source, source)):
+                _merge(groups.setdefault(name, _empty_row()), *values)
+            point = series.setdefault((minute - since - 1) // step, {'row': _empty_row(), 'outcomes': {}})
+            _merge(point['row'], *values)
+            point['outcomes'][outcome] = point['outcomes'].get(outcome, 0) + jobs
+
+        return {
+            'from': (since + 1) * 60,
+            'to': (now + 1) * 60,
+            'step_seconds': step * 60,
+            'total': _describe(overall),
+            'presets': {name: _describe(row) for name, row in sorted(by_preset.items())},
+            'outcomes': {name: _describe(row) for name, row in sorted(by_outcome.items())},
+            'sources': {name: _describe(row) for name, row in sorted(by_source.items())},
+            'series': [
+                dict(_describe(point['row']), time=(since + 1 + index * step) * 60, outcomes=point['outcomes'])
+                for index, point in sorted(series.items())
+            ],
+        }
+
+
+stats_store = StatsStore(Config.STATS_DB, Config.STATS_RETENTION_DAYS, Config.STATS_FLUSH_SECONDS)
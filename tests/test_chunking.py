@@ -0,0 +1,132 @@
+"""
+Split mode's scanner (chunking.py): where parts are cut, what comes back
+together, and which files it refuses. Run with `python -m unittest`.
+"""
+import unittest
+from config import Config
+import chunking
+
+try:
+    import lupa
+except ImportError:
+    lupa = None
+
+MODULE = '''local a = 1
+local s = [==[
+end
+local b = 2 ]] still inside
+]==]
+--[[ function f() end
+local c = 3 ]]
+local M = {}
+function M.add(x, y)
+    return x + y -- end
+end
+function M.greet(name)
+    return "hello, " .. name .. " ]] end"
+end
+local function twice(f, x)
+    return f(f(x, a), a)
+end
+print(#s, M.add(2, 3), M.greet("world"), twice(M.add, 1))
+'''
+
+
+def split(code, parts):
+    """What run_split obfuscates and reassembles, with the identity as the obfuscator"""
+    prelude, pieces = chunking.plan(code)
+    return chunking.assemble(prelude, chunking.group(pieces, parts))
+
+
+def printed(code):
+    """Lines the code prints on Lua (lupa)"""
+    lines = []
+    lua = lupa.LuaRuntime()
+    lua.globals().print = lambda *args: lines.append('\t'.join(str(arg) for arg in args))
+    lua.execute(code)
+    return lines
+
+
+class PlanTest(unittest.TestCase):
+    def test_statements_inside_long_strings_and_comments_are_not_cut(self):
+        prelude, pieces = chunking.plan(MODULE)
+        self.assertEqual(prelude, 'local a, s, M, twice\n')
+        self.assertEqual(len(pieces), 7)
+        self.assertTrue(pieces[1].startswith('s = [==[\nend\n'))
+        self.assertTrue(pieces[1].endswith('local c = 3 ]]\n'))
+        self.assertTrue(pieces[3].startswith('function M.add'))
+        self.assertTrue(pieces[4].endswith('" ]] end"\nend\n'))
+
+    def test_pieces_are_the_source_with_local_heads_rewritten(self):
+        _, pieces = chunking.plan(MODULE)
+        expected = (MODULE.replace('local a =', 'a =').replace('local s =', 's =')
+                    .replace('local M =', 'M =').replace('local function twice', 'twice = function'))
+        self.assertEqual(''.join(pieces), expected)
+
+    def test_groups_keep_pieces_contiguous_and_in_order(self):
+        _, pieces = chunking.plan(MODULE)
+        for parts in range(1, len(pieces) + 1):
+            groups = chunking.group(pieces, parts)
+            self.assertLessEqual(len(groups), parts)
+            self.assertEqual(''.join(groups), ''.join(pieces))
+
+    def test_unsplittable_code(self):
+        cases = {
+            'if-expression': 'local x = if a then 1 else 2\nprint(x)\n',
+            'attribute': 'local x <const> = 1\nprint(x)\n',
+            'type annotation': 'local x: number = 1\nprint(x)\n',
+            'used before declaration': 'print(x)\nlocal x = 1\n',
+            'declared twice': 'local x = 1\nlocal x = 2\n',
+            'top-level label': '::top::\nprint(1)\n',
+            'unterminated long string': 'local s = [[never closed\n',
+            'unterminated long comment': 'print(1)\n--[==[ never closed ]]\n',
+            'shebang': '#!/usr/bin/lua\nprint(1)\n',
+        }
+        for name, code in cases.items():
+            with self.subTest(name):
+                with self.assertRaises(chunking.Unsplittable):
+                    chunking.plan(code)
+
+
+@unittest.skipIf(lupa is None, 'needs lupa')
+class RoundTripTest(unittest.TestCase):
+    def test_reassembled_code_prints_the_same(self):
+        expected = printed(MODULE)
+        for parts in range(1, 8):
+            with self.subTest(parts=parts):
+                self.assertEqual(printed(split(MODULE, parts)), expected)
+
+    def test_functions_see_locals_declared_in_other_parts(self):
+        code = 'local n = 0\nlocal function bump() n = n + 1 end\nbump()\nbump()\nprint(n)\n'
+        self.assertEqual(printed(split(code, 4)), ['2'])
+
+
+class StepsTest(unittest.TestCase):
+    def test_steps_follow_the_pipeline_order(self):
+        order = list(Config.STEPS)
+        for preset in Config.PRESETS:
+            for steps in chunking.steps(preset):
+                with self.subTest(preset=preset, steps=steps):
+                    self.assertEqual(steps, sorted(steps, key=order.index))
+
+    def test_one_watermark_last(self):
+        for preset in Config.PRESETS:
+            first, rest, final = chunking.steps(preset)
+            with self.subTest(preset=preset):
+                self.assertNotIn('watermark', rest)
+                self.assertEqual((first + final).count('watermark'), 1)
+                self.assertEqual((final or first)[-1], 'watermark')
+
+    def test_whole_file_steps_run_once_at_the_end(self):
+        first, rest, final = chunking.steps('max')
+        self.assertFalse(set(chunking.WHOLE_FILE_STEPS) & set(first + rest))
+        self.assertEqual(final[:-1], [s for s in Config.STEPS if s in chunking.WHOLE_FILE_STEPS])
+
+    def test_min_has_no_final_pass(self):
+        first, rest, final = chunking.steps('min')
+        self.assertEqual(final, [])
+        self.assertEqual(first, rest + ['watermark'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.sansio.multipart import MultipartDecoder, NeedData, Field, File, Data, Epilogue
+from config import Config
+import pipelines
+
+CHUNK_SIZE = 64 * 1024
+RAW_TYPES = ('application/octet-stream', 'text/plain', 'text/x-lua')
+# Room for the other form fields and part headers of a multipart upload
+MULTIPART_OVERHEAD = 16 * 1024
+TRUE = ('1', 'true', 'yes', 'on')
+
+
+class UploadError(Exception):
+    """The submission can't be used; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _too_large():
+    return UploadError(f'Code too large (max {Config.MAX_CODE_LENGTH} bytes)', 413)
+
+
+def read_stream(stream, limit=None):
+    """Read an upload in chunks, giving up as soon as it passes the limit"""
+    limit = limit or Config.MAX_CODE_LENGTH
+    data = bytearray()
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        data += chunk
+        if len(data) > limit:
+            raise _too_large()
+    return bytes(data)
+
+
+async def read_stream_async(read, limit=None):
+    """read_stream() for aiohttp: read is request.content.read or a multipart part's read_chunk"""
+    limit = limit or Config.MAX_CODE_LENGTH
+    data = bytearray()
+    while True:
+        chunk = await read(CHUNK_SIZE)
+        if not chunk:
+            break
+        data += chunk
+        if len(data) > limit:
+            raise _too_large()
+    return bytes(data)
+
+
+def read_multipart(stream, boundary, limit=None):
+    """
+    ({name: bytes} of every part, names of the parts that were file uploads)
+    from a multipart body, decoded as it is read in chunks so an oversized
+    part is refused before the rest of the body is read
+    """
+    limit = limit or Config.MAX_CODE_LENGTH
+    # The decoder holds back data without a line break in it; that buffer counts too
+    decoder = MultipartDecoder(boundary.encode(), max_form_memory_size=limit + MULTIPART_OVERHEAD)
+    fields = {}
+    files = set()
+    part = None
+    total = 0
+    try:
+        while True:
+            event = decoder.next_event()
+            if isinstance(event, NeedData):
+                decoder.receive_data(stream.read(CHUNK_SIZE) or None)
+            elif isinstance(event, (Field, File)):
+                part = fields[event.name] = bytearray()
+                if isinstance(event, File) and event.filename:
+                    files.add(event.name)
+            elif isinstance(event, Data):
+                part += event.data
+                total += len(event.data)
+                if len(part) > limit or total > limit + MULTIPART_OVERHEAD:
+                    raise _too_large()
+            elif isinstance(event, Epilogue):
+                break
+    except RequestEntityTooLarge:
+        raise _too_large()
+    except ValueError:
+        raise UploadError('Malformed multipart upload')
+    return {name: bytes(data) for name, data in fields.items()}, files
+
+
+def decode(data):
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise UploadError('Code is not UTF-8 text')
+
+
+def _flag(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in TRUE
+
+
+def read_submission(request):
+    """
+    Code and options from a JSON body, a raw body (application/octet-stream,
+    text/plain; options in the query string) or a multipart upload with a
+    'file' or 'code' field. Raises UploadError.
+    """
+    mimetype = request.mimetype
+    if mimetype in RAW_TYPES:
+        if request.content_length and request.content_length > Config.MAX_CODE_LENGTH:
+            raise _too_large()
+        code = decode(read_stream(request.stream))
+        options = request.args
+    elif mimetype == 'multipart/form-data':
+        if request.content_length and request.content_length > Config.MAX_CODE_LENGTH + MULTIPART_OVERHEAD:
+            raise _too_large()
+        boundary = request.mimetype_params.get('boundary')
+        if not boundary:
+            raise UploadError('Multipart upload without a boundary')
+        # From the raw stream: request.files would buffer the whole body before we could look at it
+        fields, files = read_multipart(request.stream, boundary)
+        options = {name: decode(data) for name, data in fields.items() if name not in files}
+        code = decode(fields['file']) if 'file' in files else options.get('code', '')
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            raise UploadError('Send JSON, a raw body or a multipart upload')
+        code = data.get('code', '')
+        options = data
+    return _submission(code, options)
+
+
+async def read_submission_async(request):
+    """read_submission() for an aiohttp request, reading the body without blocking the loop"""
+    mimetype = request.content_type
+    if mimetype in RAW_TYPES:
+        if request.content_length and request.content_length > Config.MAX_CODE_LENGTH:
+            raise _too_large()
+        code = decode(await read_stream_async(request.content.read))
+        options = request.query
+    elif mimetype == 'multipart/form-data':
+        if request.content_length and request.content_length > Config.MAX_CODE_LENGTH + MULTIPART_OVERHEAD:
+            raise _too_large()
+        code = None
+        options = {}
+        reader = await request.multipart()
+        async for part in reader:
+            data = decode(await read_stream_async(part.read_chunk))
+            if part.name == 'file' and part.filename:
+                code = data
+            else:
+                options[part.name] = data
+        if code is None:
+            code = options.get('code', '')
+    else:
+        try:
+            data = await request.json() if mimetype == 'application/json' else None
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            raise UploadError('Send JSON, a raw body or a multipart upload')
+        code = data.get('code', '')
+        options = data
+    return _submission(code, options)
+
+
+def _submission(code, options):
+    if not isinstance(code, str):
+        raise UploadError('code must be a string')
+    if len(code) > Config.MAX_CODE_LENGTH:
+        raise _too_large()
+    if not code:
+        raise UploadError('No code provided')
+
+    preset = options.get('preset', 'min')
+    if options.get('steps'):
+        # An explicit step list replaces the preset
+        try:
+            preset = pipelines.parse(options['steps'])
+        except pipelines.StepError as e:
+            raise UploadError(str(e))
+    elif preset not in Config.PRESETS:
+        preset = 'min'
+    return code, {
+        'preset': preset,
+        'debug': _flag(options.get('debug', False)),
+        'inline': _flag(options.get('inline', False)),
+        'verify': Config.VERIFY_OUTPUT and _flag(options.get('verify', True)),
+    }
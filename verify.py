@@ -0,0 +1,178 @@
+"""
+Behavioural verification of obfuscated output.
+
+lua/hercules_verify.lua runs the original and the obfuscated chunk in fresh
+stubbed environments (print captured, Roblox globals absorbing everything,
+no io, debug or os beyond the clock) under an instruction budget, inside a
+sandboxed, time-limited process; the verdict compares what both printed and
+returned:
+
+    passed        same output and return values
+    failed        the obfuscated chunk printed or returned something else,
+                  raised an error the original didn't, or doesn't compile
+    inconclusive  the original itself errors or runs too long in the sandbox
+                  (most real scripts need a game to run in), or the check
+                  couldn't finish
+    skipped       too many verifications waiting
+
+Verification never holds up a result: front ends deliver first and add the
+verdict when it arrives. Verdicts are kept by (input hash, output hash), and
+at most VERIFY_CONCURRENCY run at once so they can't crowd out jobs.
+"""
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from probe import interpreter
+import sandbox
+import metrics
+
+
+def key(code, output):
+    return (hashlib.sha256(code.encode()).hexdigest(), hashlib.sha256(output.encode()).hexdigest())
+
+
+def _frames(stdout):
+    """[(status, transcript, error)] from the script's output"""
+    frames = []
+    rest = stdout
+    while rest:
+        header, _, rest = rest.partition(b'\n')
+        parts = header.decode(errors='replace').split(' ')
+        if len(parts) != 4 or parts[0] != 'RUN' or not (parts[2].isdigit() and parts[3].isdigit()):
+            raise ValueError(f'bad frame: {header[:100]!r}')
+        size, error_size = int(parts[2]), int(parts[3])
+        transcript, error = rest[:size], rest[size:size + error_size]
+        rest = rest[size + error_size:]
+        frames.append((parts[1], transcript.decode(errors='replace'), error.decode(errors='replace')))
+    return frames
+
+
+def _first_difference(expected, got):
+    expected, got = expected.split('\n'), got.split('\n')
+    for i, (a, b) in enumerate(zip(expected, got)):
+        if a != b:
+            return f"output differs at line {i + 1}: expected {a[:80]!r}, got {b[:80]!r}"
+    if len(expected) > len(got):
+        return f"output stops after {len(got)} of {len(expected)} lines"
+    return f"output has {len(got) - len(expected)} extra lines"
+
+
+def compare(original, obfuscated):
+    """(verdict, reason) from the original's and the obfuscated chunk's (status, transcript, error)"""
+    status, transcript, error = original
+    got_status, got_transcript, got_error = obfuscated
+    if status == 'invalid':
+        return 'inconclusive', f"the original doesn't compile on this Lua: {error[:200]}"
+    if status == 'timeout':
+        return 'inconclusive', 'the original runs past the instruction budget'
+    if got_status == 'invalid':
+        return 'failed', f"the obfuscated code doesn't compile: {got_error[:200]}"
+    if got_status == 'timeout':
+        return 'inconclusive', 'the obfuscated code runs past its instruction budget'
+    if status == 'ok' and got_status == 'error':
+        return 'failed', f"the obfuscated code raises an error: {got_error[:200]}"
+    if got_transcript != transcript:
+        return 'failed', _first_difference(transcript, got_transcript)
+    if status == 'error':
+        if got_status == 'error':
+            return 'inconclusive', f"the original raises an error in the sandbox: {error[:200]}"
+        return 'failed', "the obfuscated code runs to the end where the original raises an error"
+    return 'passed', 'same output and return values'
+
+
+class Verifier:
+    def __init__(self, concurrency, max_pending, max_entries):
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='verify')
+        self.max_pending = max_pending
+        self.max_entries = max_entries
+        self.pending = 0
+        self.verdicts = OrderedDict()  # (input hash, output hash) -> verdict, least recently used first
+        self.lock = threading.Lock()
+        self.stats = {'passed': 0, 'failed': 0, 'inconclusive': 0, 'skipped': 0, 'hits': 0}
+
+    def _run(self, code, output):
+        data = code.encode()
+        r = sandbox.run(
+            [interpreter(), Config.VERIFY_SCRIPT, str(len(data)), str(Config.VERIFY_INSTRUCTIONS), str(Config.VERIFY_SLOWDOWN)],
+            Config.VERIFY_TIMEOUT,
+            input=data + output.encode()
+        )
+        if r.timed_out:
+            return 'inconclusive', f'timed out after {Config.VERIFY_TIMEOUT}s', False
+        if r.limit:
+            return 'inconclusive', f'stopped: {sandbox.describe(r.limit)}', False
+        try:
+            frames = _frames(r.stdout)
+        except ValueError:
+            frames = []
+        if len(frames) != 2:
+            stderr = r.stderr.decode(errors='replace').strip()
+            return 'inconclusive', f"verifier failed (exit {r.returncode}): {stderr[-200:]}", False
+        return compare(*frames) + (True,)
+
+    def _admit(self, k):
+        """A cached or skipped verdict, or None after reserving a place in line"""
+        with self.lock:
+            if k in self.verdicts:
+                self.verdicts.move_to_end(k)
+                self.stats['hits'] += 1
+                return dict(self.verdicts[k], cached=True)
+            if self.pending >= self.max_pending:
+                self.stats['skipped'] += 1
+                return {'verdict': 'skipped', 'reason': 'too many verifications waiting', 'seconds': 0, 'cached': False}
+            self.pending += 1
+        return None
+
+    def _finish(self, k, start, verdict, reason, keep):
+        result = {'verdict': verdict, 'reason': reason, 'seconds': round(time.time() - start, 3)}
+        metrics.verifications.inc(verdict=verdict)
+        with self.lock:
+            self.pending -= 1
+            self.stats[verdict] += 1
+            # Timeouts and crashes depend on load, try those again next time
+            if keep:
+                self.verdicts[k] = result
+                while len(self.verdicts) > self.max_entries:
+                    self.verdicts.popitem(last=False)
+        return dict(result, cached=False)
+
+    def verify(self, code, output):
+        """{'verdict', 'reason', 'seconds', 'cached'} for an obfuscation of code into output"""
+        start = time.time()
+        k = key(code, output)
+        result = self._admit(k)
+        if result:
+            return result
+        try:
+            outcome = self.executor.submit(self._run, code, output).result()
+        except Exception as e:
+            outcome = ('inconclusive', f'verifier failed: {e}', False)
+        return self._finish(k, start, *outcome)
+
+    async def verify_async(self, code, output):
+        """verify() without holding a thread of the event loop's executor while it waits"""
+        start = time.time()
+        k = key(code, output)
+        result = self._admit(k)
+        if result:
+            return result
+        try:
+            outcome = await asyncio.get_running_loop().run_in_executor(self.executor, self._run, code, output)
+        except asyncio.CancelledError:
+            with self.lock:
+                self.pending -= 1
+            raise
+        except Exception as e:
+            outcome = ('inconclusive', f'verifier failed: {e}', False)
+        return self._finish(k, start, *outcome)
+
+    def summary(self):
+        with self.lock:
+            return dict(self.stats, pending=self.pending, entries=len(self.verdicts), enabled=Config.VERIFY_OUTPUT)
+
+
+verifier = Verifier(Config.VERIFY_CONCURRENCY, Config.VERIFY_MAX_PENDING, Config.VERIFY_CACHE_ENTRIES)
@@ -0,0 +1,308 @@
+"""
+Pages and response bodies shared by the two web front ends, server.py (Flask
+under gunicorn) and aioserver.py (aiohttp).
+"""
+from config import Config
+from cache import cache
+
+HTML = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Hercules Obfuscator</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <style>
+        *{box-sizing:border-box;margin:0;padding:0}
+        body{font-family:system-ui;background:linear-gradient(135deg,#0f0f23,#1a1a3e);min-height:100vh;color:#fff;padding:20px}
+        .container{max-width:900px;margin:0 auto}
+        h1{text-align:center;color:#ff6b6b;margin-bottom:30px}
+        .card{background:rgba(255,255,255,0.05);border-radius:15px;padding:25px;border:1px solid rgba(255,255,255,0.1);margin-bottom:20px}
+        textarea{width:100%;height:200px;padding:15px;border:2px solid rgba(255,107,107,0.3);border-radius:10px;background:rgba(0,0,0,0.3);color:#fff;font-family:monospace}
+        select,input{width:100%;padding:12px;border-radius:8px;background:rgba(0,0,0,0.3);color:#fff;border:1px solid rgba(255,255,255,0.2);margin:10px 0}
+        label{color:#ff6b6b;display:block;margin:15px 0 8px}
+        .btn{background:linear-gradient(135deg,#ff6b6b,#ee5a5a);color:#fff;border:none;padding:15px 40px;font-size:16px;font-weight:bold;border-radius:10px;cursor:pointer;display:inline-block;margin:10px}
+        .btn:hover{transform:translateY(-2px)}
+        .btn:disabled{opacity:0.5}
+        .btn-test{background:linear-gradient(135deg,#00d4ff,#0099cc)}
+        .status{padding:15px;border-radius:10px;margin:15px 0;display:none}
+        .success{background:rgba(0,255,100,0.1);border:1px solid #00ff64;color:#00ff64;display:block}
+        .error{background:rgba(255,0,0,0.1);border:1px solid #ff6464;color:#ff6464;display:block}
+        .loading{background:rgba(255,200,0,0.1);border:1px solid #ffc800;color:#ffc800;display:block}
+        .debug{background:rgba(0,0,0,0.3);padding:15px;border-radius:10px;margin:15px 0;font-family:monospace;font-size:12px;white-space:pre-wrap;max-height:300px;overflow-y:auto}
+        .checkbox{display:flex;align-items:center;gap:10px}
+        .checkbox input{width:auto}
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>🛡️ Hercules Obfuscator</h1>
+        
+        <div class="card">
+            <button class="btn btn-test" onclick="runTest()">🧪 Test Hercules</button>
+            <div id="testResult" class="debug" style="display:none"></div>
+        </div>
+        
+        <div class="card">
+            <label>📄 Lua Code</label>
+            <textarea id="code" placeholder="Paste your Lua code here...">print("Hello World")</textarea>
+            
+            <label>📁 Or upload a file</label>
+            <input type="file" id="file" accept=".lua,.txt">
+            
+            <label>⚡ Preset</label>
+            <select id="preset">
+                <option value="min" selected>Minimum - Light</option>
+                <option value="mid">Medium - Balanced</option>
+                <option value="max">Maximum - Heavy</option>
+            </select>
+            
+            <label>🧩 Or custom steps</label>
+            <input type="text" id="steps" placeholder="e.g. variable_renaming,control_flow,compressor">
+            
+            <div class="checkbox">
+                <input type="checkbox" id="showDebug" checked>
+                <label for="showDebug" style="margin:0">Show Debug Info</label>
+            </div>
+            
+            <div style="text-align:center">
+                <button class="btn" id="btn" onclick="obfuscate()">🛡️ Obfuscate</button>
+            </div>
+            
+            <div class="status" id="status"></div>
+            <div class="status" id="verifyStatus" style="display:none"></div>
+            <div id="debugInfo" class="debug" style="display:none"></div>
+            
+            <div id="result" style="display:none">
+                <label>📤 Output</label>
+                <textarea id="output" readonly style="height:300px"></textarea>
+                <button class="btn" onclick="download()" style="background:#00d4ff">⬇️ Download</button>
+            </div>
+        </div>
+    </div>
+    <script>
+    async function runTest() {
+        const testResult = document.getElementById('testResult');
+        testResult.style.display = 'block';
+        testResult.textContent = '🔄 Running tests...';
+        
+        try {
+            const res = await fetch('/api/test');
+            const data = await res.json();
+            testResult.textContent = data.result;
+        } catch(e) {
+            testResult.textContent = '❌ Test failed: ' + e.message;
+        }
+    }
+    
+    async function obfuscate() {
+        const code = document.getElementById('code').value.trim();
+        const file = document.getElementById('file').files[0];
+        const preset = document.getElementById('preset').value;
+        const steps = document.getElementById('steps').value.trim();
+        const showDebug = document.getElementById('showDebug').checked;
+        const status = document.getElementById('status');
+        const debugInfo = document.getElementById('debugInfo');
+        const btn = document.getElementById('btn');
+        
+        if (!code && !file) { 
+            status.className = 'status error'; 
+            status.textContent = '❌ Enter code!'; 
+            return; 
+        }
+        
+        btn.disabled = true; 
+        btn.textContent = '⏳ Processing...';
+        status.className = 'status loading'; 
+        status.textContent = '🔄 Obfuscating...';
+        document.getElementById('result').style.display = 'none';
+        document.getElementById('verifyStatus').style.display = 'none';
+        debugInfo.style.display = 'none';
+        
+        try {
+            // Raw body upload: a chosen file goes straight from disk, no JSON escaping either way
+            const query = new URLSearchParams({preset, debug: showDebug ? '1' : '0'});
+            if (steps) query.set('steps', steps);
+            const res = await fetch('/api/jobs?' + query, {
+                method: 'POST', 
+                headers: {'Content-Type': file ? 'application/octet-stream' : 'text/plain; charset=utf-8'},
+                body: file || code
+            });
+            let data = await res.json();
+            
+            if (res.ok) {
+                status.textContent = describeJob(data);
+                data = await followJob(data);
+            }
+            
+            if (data.debug && showDebug) {
+                debugInfo.textContent = data.debug;
+                debugInfo.style.display = 'block';
+            }
+            
+            if (data.status === 'done') {
+                const output = await (await fetch(data.result_url)).text();
+                status.className = 'status success';
+                status.textContent = '✅ Done! Time: ' + data.time_taken + (data.cached ? ' (cached)' : data.coalesced ? ' (shared)' : '') + (data.queue_wait ? ' | Queued: ' + data.queue_wait : '') + ' | Size: ' + data.original_size + ' → ' + data.obfuscated_size + ' bytes';
+                document.getElementById('output').value = output;
+                document.getElementById('result').style.display = 'block';
+                showVerification(data);
+            } else if (data.busy) {
+                status.className = 'status loading';
+                status.textContent = '🚦 ' + data.error + ' - try again in ~' + data.retry_after + 's';
+            } else {
+                status.className = 'status error';
+                status.textContent = '❌ ' + data.error;
+            }
+        } catch(e) {
+            status.className = 'status error';
+            status.textContent = '❌ ' + e.message;
+        }
+        
+        btn.disabled = false; 
+        btn.textContent = '🛡️ Obfuscate';
+    }
+    
+    function describeJob(job) {
+        if (job.status === 'queued') {
+            return '🚦 Queued at position ' + (job.position + 1) + ' (~' + Math.round(job.eta) + 's)';
+        }
+        if (job.status === 'running' && job.estimate) {
+            return '🔄 Obfuscating... ETA ~' + Math.max(1, Math.round(job.estimate)) + 's';
+        }
+        return '🔄 Obfuscating...';
+    }
+    
+    function isFinished(job) {
+        return job.status === 'done' || job.status === 'failed';
+    }
+    
+    // Follow a job over Server-Sent Events, falling back to polling
+    function followJob(job) {
+        const status = document.getElementById('status');
+        return new Promise((resolve) => {
+            if (isFinished(job)) { resolve(job); return; }
+            
+            const poll = async () => {
+                while (true) {
+                    const current = await (await fetch(job.status_url)).json();
+                    status.textContent = describeJob(current);
+                    if (isFinished(current)) { resolve(current); return; }
+                    await new Promise(r => setTimeout(r, 1000));
+                }
+            };
+            
+            if (!window.EventSource) { poll(); return; }
+            const events = new EventSource(job.events_url);
+            const onEvent = (e) => {
+                const current = JSON.parse(e.data);
+                status.textContent = describeJob(current);
+                if (isFinished(current)) { events.close(); resolve(current); }
+            };
+            ['queued', 'running', 'done', 'failed'].forEach(t => events.addEventListener(t, onEvent));
+            events.onerror = () => { events.close(); poll(); };
+        });
+    }
+    
+    // The verdict comes after the output: poll the job until it is in
+    async function showVerification(job) {
+        const box = document.getElementById('verifyStatus');
+        if (!job.verification) return;
+        box.style.display = 'block';
+        box.className = 'status loading';
+        box.textContent = '🧪 Verifying the output...';
+        let verification = job.verification;
+        while (verification.verdict === 'pending') {
+            await new Promise(r => setTimeout(r, 1000));
+            verification = (await (await fetch(job.status_url)).json()).verification;
+        }
+        const icons = {passed: '✅', failed: '⚠️', inconclusive: '❔', skipped: '⏭️'};
+        box.className = 'status ' + (verification.verdict === 'failed' ? 'error' : 'success');
+        box.textContent = (icons[verification.verdict] || '') + ' Verification ' + verification.verdict + ': ' + verification.reason;
+    }
+    
+    function download() {
+        const blob = new Blob([document.getElementById('output').value], {type: 'text/plain'});
+        const a = document.createElement('a'); 
+        a.href = URL.createObjectURL(blob);
+        a.download = 'obfuscated.lua'; 
+        a.click();
+    }
+    </script>
+</body>
+</html>
+'''
+
+def api_result(result, show_debug):
+    """A service.run() result in the shape /api/obfuscate answers with"""
+    debug = result.get('debug') if show_debug else None
+    if not result['success']:
+        return {'success': False, 'error': result['error'], 'debug': debug}
+    response = {
+        'success': True,
+        'output': result['output'],
+        'time_taken': result['time'],
+        'original_size': result['original'],
+        'obfuscated_size': result['obfuscated'],
+        'cached': result.get('cached', False),
+        'coalesced': result.get('coalesced', False),
+        'debug': debug
+    }
+    if result.get('queue_wait') is not None:
+        response['queue_position'] = result.get('queue_position', 0)
+        response['queue_wait'] = f"{result['queue_wait']:.2f}s"
+        response['estimate'] = result.get('estimate')
+    return response
+
+def stats_args(args):
+    """(hours, step in minutes) for stats_store.query() from /api/stats' query string"""
+    try:
+        hours = float(args.get('hours', 24))
+        step = int(args.get('step', 60))
+    except ValueError:
+        hours, step = 24, 60
+    return min(max(hours, 1 / 60), Config.STATS_RETENTION_DAYS * 24), max(1, step)
+
+def refusal(result):
+    """(status, body, headers) for a job that was turned away before running, else None"""
+    if result.get('invalid'):
+        return 400, {'success': False, 'invalid': True, 'error': result['error'], 'line': result['line'], 'column': result['column']}, {}
+    if result.get('too_large'):
+        return 413, {'success': False, 'too_large': True, 'error': result['error'], 'estimate': result['estimate']}, {}
+    if result.get('busy'):
+        body = {'success': False, 'busy': True, 'error': result['error'], 'retry_after': result['retry_after']}
+        return 429, body, {'Retry-After': str(max(1, result['retry_after']))}
+    if result.get('rate_limited'):
+        body = {'success': False, 'rate_limited': True, 'error': result['error'], 'retry_after': result['retry_after']}
+        return 429, body, {'Retry-After': str(max(1, result['retry_after']))}
+    return None
+
+def publish(store, result, preset, cache_key, inline=False):
+    """
+    Keep a successful output on disk as a finished job and answer with its
+    result_url instead of the text itself (unless the client asked for inline).
+    The cache file is hard-linked when there is one, so nothing is copied.
+    """
+    if not result['success']:
+        return result
+    output = result['output'] if inline else result.pop('output')
+    job = store.add(
+        preset,
+        result['original_size'],
+        output=output,
+        source=cache.file(cache_key) if cache_key else None,
+        time_taken=result['time_taken'],
+        obfuscated_size=result['obfuscated_size'],
+        cached=result.get('cached', False),
+        coalesced=result.get('coalesced', False),
+    )
+    result['job_id'] = job['id']
+    result['result_url'] = f"/api/jobs/{job['id']}/result"
+    return result
+
+def job_view(job):
+    view = {k: v for k, v in job.items() if k != 'debug_requested'}
+    view['status_url'] = f"/api/jobs/{job['id']}"
+    view['events_url'] = f"/api/jobs/{job['id']}/events"
+    if job['status'] == 'done':
+        view['result_url'] = f"/api/jobs/{job['id']}/result"
+    return view
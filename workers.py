@@ -0,0 +1,574 @@
+import os
+import select
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from probe import interpreter, cli_command, capabilities, is_environment_error
+from workspace import Workspace
+from costmodel import cost_model
+from cache import cache
+import chunking
+import pipelines
+import sandbox
+import metrics
+
+
+class WorkerError(Exception):
+    """The worker process died, hung or broke the protocol"""
+
+
+class LimitExceeded(WorkerError):
+    """The worker ran into one of its resource limits"""
+
+    def __init__(self, limit):
+        super().__init__(sandbox.describe(limit))
+        self.limit = limit
+
+
+class LuaWorker:
+    """One long-lived `lua hercules_worker.lua` process (or another script speaking its protocol)"""
+
+    def __init__(self, script=Config.WORKER_SCRIPT):
+        # The CPU limit is soft so it can be moved forward before every job
+        self.proc = sandbox.spawn(
+            [interpreter(), script],
+            cpu_seconds=Config.WORKER_START_TIMEOUT,
+            hard=False,
+            cwd=Config.HERCULES_PATH,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0,
+        )
+        self.jobs = 0
+        self.buffer = b''
+        self.stderr_tail = deque(maxlen=50)
+        self.base_rss = None
+        self.read_seconds = 0.0
+        threading.Thread(target=self._drain_stderr, daemon=True).start()
+
+    def _drain_stderr(self):
+        """Keep stderr flowing so chatty passes can't block the pipe"""
+        try:
+            for line in iter(self.proc.stderr.readline, b''):
+                self.stderr_tail.append(line.decode(errors='replace'))
+        except Exception:
+            pass
+
+    def _fill(self, deadline):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise TimeoutError
+        fd = self.proc.stdout.fileno()
+        ready, _, _ = select.select([fd], [], [], remaining)
+        if not ready:
+            raise TimeoutError
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            try:
+                code = self.proc.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                code = None
+            limit = sandbox.limit_hit(code, ''.join(self.stderr_tail))
+            if limit:
+                raise LimitExceeded(limit)
+            raise WorkerError(f'worker exited ({code})')
+        self.buffer += chunk
+
+    def _read_line(self, deadline):
+        while b'\n' not in self.buffer:
+            self._fill(deadline)
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return line.decode(errors='replace')
+
+    def _read_exact(self, size, deadline):
+        while len(self.buffer) < size:
+            self._fill(deadline)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def _read_frame(self, deadline):
+        kind, _, size = self._read_line(deadline).partition(' ')
+        if kind not in ('OK', 'ERR', 'FAIL') or not size.isdigit():
+            raise WorkerError(f'bad frame: {kind} {size}'[:200])
+        if int(size) > Config.MAX_OUTPUT_BYTES:
+            raise LimitExceeded('output')
+        start = time.time()
+        body = self._read_exact(int(size), deadline).decode(errors='replace')
+        self.read_seconds = time.time() - start
+        return kind, body
+
+    def handshake(self, timeout):
+        line = self._read_line(time.time() + timeout)
+        if line.startswith('READY'):
+            self.base_rss = self.rss()
+            return line[6:]
+        kind, _, size = line.partition(' ')
+        if kind == 'FAIL' and size.isdigit():
+            raise WorkerError(self._read_exact(int(size), time.time() + timeout).decode(errors='replace'))
+        raise WorkerError(f'bad handshake: {line[:200]}')
+
+    def run(self, code, steps, timeout):
+        self.stderr_tail.clear()
+        sandbox.set_cpu_limit(self.proc.pid, timeout)
+        data = code.encode()
+        self.proc.stdin.write(f'JOB {len(data)} {steps}\n'.encode() + data)
+        self.proc.stdin.flush()
+        kind, body = self._read_frame(time.time() + timeout)
+        self.jobs += 1
+        # Lua reports a failed allocation as an ordinary error; the worker isn't trustworthy after it
+        if kind != 'OK' and sandbox.OUT_OF_MEMORY.search(body):
+            raise LimitExceeded('memory')
+        return kind == 'OK', body
+
+    def rss(self):
+        try:
+            with open(f'/proc/{self.proc.pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            pass
+        return 0
+
+    def worn_out(self):
+        if self.jobs >= Config.WORKER_MAX_JOBS:
+            return True
+        return self.base_rss is not None and self.rss() - self.base_rss > Config.WORKER_MAX_RSS_GROWTH
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def stop(self, reason=None):
+        try:
+            sandbox.kill_group(self.proc, reason)
+            self.proc.wait(timeout=5)
+        except Exception:
+            pass
+        for pipe in (self.proc.stdin, self.proc.stdout, self.proc.stderr):
+            try:
+                pipe.close()
+            except Exception:
+                pass
+
+
+class LuaWorkerPool:
+    """
+    Pool of warm Hercules workers.
+    Workers are recycled after WORKER_MAX_JOBS jobs or WORKER_MAX_RSS_GROWTH bytes
+    of memory growth, and replaced after a crash or timeout.
+    """
+
+    def __init__(self, size, script=Config.WORKER_SCRIPT):
+        self.size = size
+        self.script = script
+        self.idle = []
+        self.count = 0
+        self.cond = threading.Condition()
+        self.disabled = None
+        self.stats = {'jobs': 0, 'spawned': 0, 'recycled': 0, 'crashed': 0, 'timeouts': 0, 'limits': 0}
+
+    def _spawn(self):
+        worker = LuaWorker(self.script)
+        try:
+            worker.handshake(Config.WORKER_START_TIMEOUT)
+        except (WorkerError, TimeoutError, OSError) as e:
+            worker.stop()
+            raise WorkerError(str(e) or 'worker did not start')
+        with self.cond:
+            self.stats['spawned'] += 1
+        return worker
+
+    def _acquire(self, wait=True):
+        with self.cond:
+            while True:
+                if self.disabled or self.size <= 0:
+                    return None
+                if self.idle:
+                    return self.idle.pop()
+                if self.count < self.size:
+                    self.count += 1
+                    break
+                if not wait:
+                    return None
+                self.cond.wait()
+        try:
+            return self._spawn()
+        except Exception as e:
+            with self.cond:
+                self.count -= 1
+                # The shim itself can't load: stop trying, callers use the CLI path
+                self.disabled = str(e)[:300]
+                self.cond.notify_all()
+            print(f"Worker pool ({self.script}) disabled: {self.disabled}")
+            return None
+
+    def _release(self, worker, reusable, kill_reason=None):
+        if reusable and worker.alive() and not worker.worn_out():
+            with self.cond:
+                self.idle.append(worker)
+                self.cond.notify()
+            return
+        if reusable:
+            with self.cond:
+                self.stats['recycled'] += 1
+        worker.stop(kill_reason)
+        with self.cond:
+            self.count -= 1
+            self.cond.notify()
+
+    def warm(self):
+        """Start workers ahead of the first job"""
+        workers = []
+        for _ in range(self.size):
+            worker = self._acquire()
+            if worker is None:
+                break
+            workers.append(worker)
+        for worker in workers:
+            self._release(worker, True)
+
+    def run(self, code, preset, timeout, steps=None, wait=True):
+        """
+        Obfuscate on a warm worker, with the pipeline's steps unless steps is given.
+        Returns None when the pool is unavailable (or, without wait, fully busy)
+        so callers can fall back.
+        """
+        worker = self._acquire(wait)
+        if worker is None:
+            return None
+
+        start = time.time()
+        reusable = False
+        kill_reason = None
+        try:
+            ok, body = worker.run(code, steps if steps is not None else ','.join(pipelines.steps(preset)), timeout)
+            reusable = True
+            result = {'success': True, 'output': body} if ok else {'success': False, 'error': body, 'reason': 'input'}
+            result['read_seconds'] = worker.read_seconds
+        except TimeoutError:
+            with self.cond:
+                self.stats['timeouts'] += 1
+            kill_reason = 'timeout'
+            result = {'success': False, 'error': 'Timeout', 'reason': 'timeout'}
+        except LimitExceeded as e:
+            with self.cond:
+                self.stats['limits'] += 1
+            kill_reason = e.limit
+            result = {'success': False, 'error': str(e), 'reason': 'limit', 'limit': e.limit}
+        except (WorkerError, OSError) as e:
+            with self.cond:
+                self.stats['crashed'] += 1
+            result = {'success': False, 'error': f'Worker crashed: {e}', 'reason': 'crash'}
+        finally:
+            stderr = ''.join(worker.stderr_tail)
+            self._release(worker, reusable, kill_reason)
+
+        with self.cond:
+            self.stats['jobs'] += 1
+        result['elapsed'] = time.time() - start
+        result['stderr'] = stderr
+        result['mode'] = 'worker'
+        return result
+
+    def summary(self):
+        with self.cond:
+            return dict(
+                self.stats,
+                size=self.size,
+                live=self.count,
+                idle=len(self.idle),
+                disabled=self.disabled,
+                pipe_disabled=pipe_disabled
+            )
+
+    def shutdown(self):
+        with self.cond:
+            idle, self.idle = self.idle, []
+            self.count -= len(idle)
+        for worker in idle:
+            worker.stop()
+
+
+pool = LuaWorkerPool(Config.WORKER_POOL_SIZE)
+
+pipe_disabled = None
+
+
+def run_pipe(code, preset, timeout, steps=None):
+    """
+    One-shot obfuscation through hercules_pipe.lua: source on stdin, result on
+    stdout, nothing on disk. Returns None when the pipe shim is unavailable.
+    """
+    global pipe_disabled
+    if pipe_disabled or not os.path.exists(os.path.join(Config.HERCULES_PATH, Config.PIPE_SCRIPT)):
+        return None
+
+    start = time.time()
+    try:
+        if steps is None:
+            steps = ','.join(pipelines.steps(preset))
+        r = sandbox.run([interpreter(), Config.PIPE_SCRIPT, steps], timeout, input=code.encode())
+    except OSError as e:
+        pipe_disabled = str(e)
+        return None
+
+    stderr = r.stderr.decode(errors='replace')
+    if r.timed_out:
+        return {
+            'success': False,
+            'error': 'Timeout',
+            'reason': 'timeout',
+            'elapsed': time.time() - start,
+            'stderr': stderr,
+            'mode': 'pipe'
+        }
+    if r.limit:
+        return {
+            'success': False,
+            'error': sandbox.describe(r.limit),
+            'reason': 'limit',
+            'limit': r.limit,
+            'elapsed': time.time() - start,
+            'stderr': stderr,
+            'mode': 'pipe'
+        }
+    if r.returncode == 2:
+        pipe_disabled = stderr.strip()[:300] or 'pipe shim failed to load'
+        print(f"Pipe mode disabled: {pipe_disabled}")
+        return None
+
+    result = {'elapsed': time.time() - start, 'stderr': stderr, 'mode': 'pipe'}
+    if r.returncode == 0:
+        result.update(success=True, output=r.stdout.decode(errors='replace'))
+    else:
+        result.update(success=False, error=stderr.strip() or f'Exit code {r.returncode}', reason='input')
+    return result
+
+
+def _run_cli_once(code, preset, timeout):
+    start = time.time()
+    with Workspace() as workspace:
+        workspace.write_input(code)
+        cmd, applied = cli_command(workspace.input_file, preset)
+        result = {
+            'mode': 'cli',
+            'command': ' '.join(cmd),
+            'preset_applied': applied,
+            'stdout': '',
+            'stderr': '',
+        }
+        try:
+            r = sandbox.run(cmd, timeout, text=True)
+        except OSError as e:
+            result.update(success=False, error=str(e), reason='environment', elapsed=time.time() - start)
+            return result
+        result.update(stdout=r.stdout or '', stderr=r.stderr or '', exit_code=r.returncode)
+        if r.timed_out:
+            result.update(success=False, error='Timeout', reason='timeout', elapsed=time.time() - start)
+            return result
+        if r.limit:
+            result.update(success=False, error=sandbox.describe(r.limit), reason='limit', limit=r.limit,
+                          elapsed=time.time() - start)
+            return result
+        read_start = time.time()
+        output = workspace.read_output()
+        result['read_seconds'] = time.time() - read_start
+
+    result['elapsed'] = time.time() - start
+    if output is not None:
+        result.update(success=True, output=output)
+    else:
+        error = (result['stderr'] or result['stdout'] or 'No output file').strip()
+        result.update(
+            success=False,
+            error=error,
+            reason='environment' if is_environment_error(error) else 'input'
+        )
+    return result
+
+
+def run_cli(code, preset, timeout):
+    """
+    Obfuscate through `hercules.lua <file>` in a private workspace with the
+    probed command line. An environment failure triggers one re-probe and
+    retry; failures caused by the input are never retried.
+    """
+    result = _run_cli_once(code, preset, timeout)
+    if result['success'] or result['reason'] != 'environment':
+        return result
+    capabilities(refresh=True)
+    return _run_cli_once(code, preset, timeout)
+
+
+def _run_steps(code, steps, timeout, wait=True, done=None):
+    """
+    Run steps (a list) one at a time in the order given on a warm worker,
+    else the pipe shim (the CLI only takes presets): the shim only switches
+    steps on, so one run with several would apply them in Hercules's own
+    order. done(count, output) is called after every step but the last.
+    Returns None when neither runner is available.
+    """
+    start = time.time()
+    output = code
+    stderr = ''
+    read_seconds = 0.0
+    result = None
+    for index, step in enumerate(steps):
+        remaining = max(1, timeout - (time.time() - start))
+        result = pool.run(output, None, remaining, steps=step, wait=wait)
+        if result is None:
+            result = run_pipe(output, None, remaining, steps=step)
+        if result is None:
+            return None
+        stderr += result['stderr']
+        read_seconds += result.get('read_seconds', 0)
+        if not result['success']:
+            if index:
+                result['error'] = f"{step}: {result['error']}"
+            break
+        output = result['output']
+        if done and index + 1 < len(steps):
+            done(index + 1, output)
+    result.update(elapsed=time.time() - start, stderr=stderr[-2000:], read_seconds=read_seconds)
+    return result
+
+
+def run_split(code, preset, timeout, parts):
+    """
+    Obfuscate code as up to `parts` pieces in parallel (see chunking) and
+    syntax-check the reassembled result. Raises chunking.Unsplittable when
+    the file has to run whole instead; timeouts and limits are returned as
+    they are, the whole file would only hit them too.
+    """
+    start = time.time()
+    prelude, pieces = chunking.plan(code)
+    groups = chunking.group(pieces, parts)
+    if len(groups) < 2:
+        raise chunking.Unsplittable('nothing to split')
+    first, rest, final = chunking.steps(preset)
+
+    def run_part(index):
+        return _run_steps(groups[index], first if index == 0 else rest, timeout - (time.time() - start), wait=False)
+
+    with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix='split') as executor:
+        results = list(executor.map(run_part, range(len(groups))))
+    for result in results:
+        if result is None:
+            raise chunking.Unsplittable('needs the worker pool or pipe mode')
+        if not result['success']:
+            if result.get('reason') in ('timeout', 'limit'):
+                return dict(result, elapsed=time.time() - start, mode='split', parts=len(groups))
+            # Possibly a part Hercules can't take on its own; the whole file may still work
+            raise chunking.Unsplittable(f"a part failed: {result['error'][:200]}")
+
+    output = chunking.assemble(prelude, [r['output'] for r in results])
+    stderr = ''.join(r['stderr'] for r in results)
+    if final:
+        remaining = timeout - (time.time() - start)
+        if remaining <= 0:
+            # The parts used up the whole budget
+            return {'success': False, 'error': 'Timeout', 'reason': 'timeout', 'elapsed': time.time() - start,
+                    'stderr': stderr[-2000:], 'mode': 'split', 'parts': len(groups)}
+        result = _run_steps(output, final, remaining)
+        if result is None or not result['success']:
+            if result and result.get('reason') in ('timeout', 'limit'):
+                return dict(result, elapsed=time.time() - start, mode='split', parts=len(groups))
+            raise chunking.Unsplittable(f"final pass failed: {result['error'][:200] if result else 'no runner'}")
+        output = result['output']
+        stderr += result['stderr']
+
+    # The pre-flight checker pool (preflight imports this module, hence the late import)
+    from preflight import checker, describe
+    error = checker.check(output)
+    if error:
+        raise chunking.Unsplittable(f'reassembled output does not compile: {describe(error)[:200]}')
+    return {
+        'success': True,
+        'output': output,
+        'elapsed': time.time() - start,
+        'stderr': stderr[-2000:],
+        'mode': 'split',
+        'parts': len(groups),
+    }
+
+
+def run_pipeline(code, preset, timeout, resume=True):
+    """
+    Run a pipeline's steps one at a time in Config.STEPS order on a warm
+    worker or the pipe shim, starting after the longest prefix of them
+    already cached for this code and caching the output of every step but
+    the last (the caller caches the result). resume=False runs every step
+    and caches nothing. Returns None when neither runner is available.
+    """
+    steps = pipelines.steps(preset)
+    resumed, output = pipelines.cached_prefix(code, steps) if resume else (0, code)
+
+    def done(count, output):
+        cache.put(pipelines.key(code, steps[:resumed + count]), output)
+
+    result = _run_steps(output, steps[resumed:], timeout, done=done if resume else None)
+    if result is not None and resumed:
+        result['resumed'] = resumed
+    return result
+
+
+def execute(code, preset, timeout, tokens=None, parts=1):
+    """
+    Run one job on a warm worker or the pipe shim (run_pipeline), else on
+    the hercules.lua CLI. preset is a pipeline name (see pipelines).
+    tokens is the count from the job's cost estimate, if there was one. With
+    parts > 1 (slots to spare) a large file is tried in split mode first.
+    """
+    start = time.time()
+    result = None
+    skipped = None
+    if parts > 1:
+        try:
+            result = run_split(code, preset, timeout, parts)
+        except chunking.Unsplittable as e:
+            skipped = str(e)
+            print(f"Split mode skipped: {skipped}")
+        timeout = max(1, timeout - (time.time() - start))
+    if result is None:
+        result = run_pipeline(code, preset, timeout)
+    if result is None:
+        result = run_cli(code, preset, timeout)
+    if skipped:
+        result['split_skipped'] = skipped
+    label = pipelines.label(preset)
+    metrics.record_run(label, code, result)
+    metrics.pool_workers.set(pool.count)
+    # A timed out run still tells the cost model the job takes at least that long;
+    # split and resumed runs would teach it times that full runs can't meet
+    if result['mode'] != 'split' and not result.get('resumed') and (result['success'] or result.get('reason') == 'timeout'):
+        cost_model.record(preset, code, result['elapsed'], tokens)
+    return result
+
+
+def debug_lines(result, clean):
+    """Human readable trace of an execute() result; clean() strips ANSI codes"""
+    labels = {'worker': 'Warm worker', 'pipe': 'Pipe mode', 'cli': 'CLI', 'split': 'Split mode'}
+    lines = [f"🔥 {labels[result['mode']]} ({result['elapsed']:.2f}s)"]
+    if result.get('parts'):
+        lines.append(f"🧩 {result['parts']} parts in parallel")
+    if result.get('split_skipped'):
+        lines.append(f"🧩 Split skipped: {result['split_skipped']}")
+    if result.get('resumed'):
+        lines.append(f"♻️ Resumed after {result['resumed']} cached steps")
+    if result.get('command'):
+        lines.append(f"🔧 Command: {result['command']}")
+    if 'exit_code' in result:
+        lines.append(f"📤 Exit code: {result['exit_code']}")
+    if result.get('stdout'):
+        lines.append(f"📝 STDOUT:\n{clean(result['stdout'])[:300]}")
+    if result.get('stderr'):
+        lines.append(f"⚠️ STDERR:\n{clean(result['stderr'])[:300]}")
+    if result['success']:
+        lines.append(f"✅ Output: {len(result['output'])} bytes")
+    else:
+        lines.append(f"❌ Failed ({result.get('reason', 'unknown')})")
+    return lines
@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from config import Config
+
+PREFIX = 'job-'
+
+
+def default_root():
+    """tmpfs when available, so CLI fallback jobs never touch the real disk"""
+    shm = os.path.dirname(Config.TMPFS_WORK_FOLDER)
+    if os.path.isdir(shm) and os.access(shm, os.W_OK):
+        return Config.TMPFS_WORK_FOLDER
+    return Config.WORK_FOLDER
+
+
+class Workspace:
+    """
+    Private directory for one CLI job.
+    The input gets a unique name and Hercules writes <name>_obfuscated.lua next
+    to it, so the output path is known up front and no directory scan is needed.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or default_root()
+        os.makedirs(self.root, exist_ok=True)
+        # pid in the name lets the janitor spot workspaces of dead processes
+        self.path = tempfile.mkdtemp(prefix=f'{PREFIX}{os.getpid()}-', dir=self.root)
+        self.name = uuid.uuid4().hex[:12]
+        self.input_file = os.path.join(self.path, f'{self.name}.lua')
+        self.output_file = os.path.join(self.path, f'{self.name}_obfuscated.lua')
+        # Some Hercules versions write the output into their working directory
+        self.cwd_output_file = os.path.join(Config.HERCULES_PATH, f'{self.name}_obfuscated.lua')
+
+    def write_input(self, code):
+        with open(self.input_file, 'w') as f:
+            f.write(code)
+
+    def output_path(self):
+        for path in (self.output_file, self.cwd_output_file):
+            if os.path.exists(path):
+                return path
+        return None
+
+    def read_output(self):
+        path = self.output_path()
+        if path is None:
+            return None
+        with open(path, 'r') as f:
+            return f.read()
+
+    def cleanup(self):
+        try:
+            os.remove(self.cwd_output_file)
+        except OSError:
+            pass
+        remove_tree(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+
+def remove_tree(path):
+    """Rename first so a half-deleted workspace is never mistaken for a live one"""
+    trash = os.path.join(os.path.dirname(path), f'.trash-{uuid.uuid4().hex[:8]}')
+    try:
+        os.rename(path, trash)
+    except OSError:
+        trash = path
+    shutil.rmtree(trash, ignore_errors=True)
+
+
+def _owner_alive(name):
+    try:
+        pid = int(name[len(PREFIX):].split('-')[0])
+        os.kill(pid, 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def clean_orphans(root=None, max_age=None):
+    """Remove workspaces left behind by crashed or killed workers"""
+    if root is None:
+        return sum(clean_orphans(r, max_age) for r in {Config.WORK_FOLDER, Config.TMPFS_WORK_FOLDER})
+    cutoff = time.time() - (max_age or Config.OBFUSCATION_TIMEOUT * 2)
+    removed = 0
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return 0
+    for name in names:
+        path = os.path.join(root, name)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            continue
+        if name.startswith('.trash-'):
+            stale = True
+        elif name.startswith(PREFIX):
+            stale = not _owner_alive(name) or mtime < cutoff
+        else:
+            continue
+        if stale:
+            remove_tree(path)
+            removed += 1
+    return removed
+
+
+_janitor = None
+
+
+def start_janitor(interval=300):
+    """Start the orphan sweeper once per process"""
+    global _janitor
+    if _janitor is not None:
+        return
+
+    def loop():
+        while True:
+            try:
+                removed = clean_orphans()
+                if removed:
+                    print(f"Workspace janitor removed {removed} orphaned workspaces")
+            except Exception as e:
+                print(f"Workspace janitor error: {e}")
+            time.sleep(interval)
+
+    _janitor = threading.Thread(target=loop, daemon=True)
+    _janitor.start()